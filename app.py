@@ -52,6 +52,26 @@ class MultiLoader(sgtk.platform.Application):
         }
         self.engine.register_command(menu_caption, cb, menu_options)
 
+        # in the shell, expose the site cache warm-up job so that it can be
+        # scheduled with e.g. "tank Project xyz warm_up_loader_site_cache"
+        if self.engine.name == "tk-shell" and self.get_setting("site_cache_root"):
+            self.engine.register_command(
+                "warm_up_loader_site_cache",
+                self.warm_up_site_cache,
+                {"short_name": "warm_up_loader_site_cache"}
+            )
+
+    def destroy_app(self):
+        """
+        Called as the application is being destroyed
+        """
+        if not self.engine.has_ui:
+            return
+
+        # destroy the dialog kept warm between invocations, if any
+        tk_multi_loader = self.import_module("tk_multi_loader")
+        tk_multi_loader.dialog_pool.clear()
+
     @property
     def context_change_allowed(self):
         """
@@ -77,3 +97,60 @@ class MultiLoader(sgtk.platform.Application):
         """
         tk_multi_loader = self.import_module("tk_multi_loader")
         return tk_multi_loader.open_publish_browser(self, title, action, publish_types)
+
+    def find_latest_publishes(self, entities, publish_types=None, filters=None, batch_size=100):
+        """
+        Returns the latest publishes linked to a list of entities, exactly as the loader
+        displays them when each entity is selected: the filter_publishes hook is run and
+        only the latest version of each publish is kept. This doesn't require any UI and
+        can be used by scripts and farm jobs.
+
+        The loader's cache is shared, so entities displayed or queried before only need
+        their changes to be retrieved. Entities are queried in batches of batch_size.
+
+        :param entities:                List of Shotgun entity dictionaries, with at least
+                                        a type and an id. Tasks are supported.
+        :param publish_types:           If specified then only publishes of these types
+                                        are returned.
+        :param filters:                 Additional Shotgun filters for the publishes, e.g.
+                                        the publish_filters of an entities tab.
+        :param batch_size:              Maximum number of entities per Shotgun query.
+        :returns:                       Dictionary keyed by (entity type, entity id) holding
+                                        the list of the latest publishes for each entity.
+                                        Date fields are unix time stamps.
+        """
+        tk_multi_loader = self.import_module("tk_multi_loader")
+        return tk_multi_loader.find_latest_publishes(self,
+                                                     entities,
+                                                     publish_types=publish_types,
+                                                     additional_sg_filters=filters,
+                                                     batch_size=batch_size)
+
+    def run_memory_leak_test(self, iterations=10, navigation_steps=5, max_growth_mb=50, max_object_growth=100):
+        """
+        Opens the loader dialog without displaying it, selects items in its entity
+        tabs and closes it, repeatedly, then checks that the process memory and the
+        number of Qt objects stayed bounded. A QApplication must exist.
+
+        :param iterations:              Number of times the dialog is opened and closed.
+        :param navigation_steps:        Number of items selected in each entity tab.
+        :param max_growth_mb:           Maximum growth of the process memory, in megabytes.
+        :param max_object_growth:       Maximum growth of the number of each kind of Qt object.
+        :returns:                       Text report of the growth between the first and last runs.
+        :raises TankError:              If memory or objects grew more than allowed.
+        """
+        tk_multi_loader = self.import_module("tk_multi_loader")
+        return tk_multi_loader.run_memory_leak_test(self,
+                                                    iterations=iterations,
+                                                    navigation_steps=navigation_steps,
+                                                    max_growth_mb=max_growth_mb,
+                                                    max_object_growth=max_object_growth)
+
+    def warm_up_site_cache(self):
+        """
+        Builds the caches for the entities tabs, the publish types and the statuses
+        and publishes them to the shared site cache configured with the site_cache_root
+        setting. This doesn't display any UI and is meant to be run by a scheduled job.
+        """
+        tk_multi_loader = self.import_module("tk_multi_loader")
+        tk_multi_loader.warm_up_site_cache(self)
@@ -13,6 +13,7 @@
 Hook that loads defines all the available actions, broken down by publish type.
 """
 import collections
+import contextlib
 import os
 import re
 
@@ -142,11 +143,13 @@ class FlameActions(HookBaseClass):
 
         :param list actions: Action dictionaries.
         """
-        for single_action in actions:
-            name = single_action["name"]
-            sg_publish_data = single_action["sg_publish_data"]
-            params = single_action["params"]
-            self.execute_action(name, params, sg_publish_data)
+        # share the Shotgun lookups between all the actions of this run
+        with self._shotgun_cache():
+            for single_action in actions:
+                name = single_action["name"]
+                sg_publish_data = single_action["sg_publish_data"]
+                params = single_action["params"]
+                self.execute_action(name, params, sg_publish_data)
 
     def execute_action(self, name, params, sg_publish_data):
         """
@@ -164,20 +167,22 @@ class FlameActions(HookBaseClass):
                       "Parameters: %s. Publish Data: %s" % (name, params, sg_publish_data))
 
         try:
-            if name == CLIP_ACTION:
-                self._import_clip(sg_publish_data)
+            # Shotgun lookups are shared by all the steps of the action
+            with self._shotgun_cache():
+                if name == CLIP_ACTION:
+                    self._import_clip(sg_publish_data)
 
-            elif name == SETUP_ACTION:
-                self._import_batch_file(sg_publish_data)
+                elif name == SETUP_ACTION:
+                    self._import_batch_file(sg_publish_data)
 
-            elif name == SHOT_CREATE_ACTION:
-                self._add_batch_group_from_shot(sg_publish_data, True)
+                elif name == SHOT_CREATE_ACTION:
+                    self._add_batch_group_from_shot(sg_publish_data, True)
 
-            elif name == SHOT_LOAD_ACTION:
-                self._add_batch_group_from_shot(sg_publish_data, False)
+                elif name == SHOT_LOAD_ACTION:
+                    self._add_batch_group_from_shot(sg_publish_data, False)
 
-            else:
-                raise FlameActionError("Unknown action name: '%s'".format(name))
+                else:
+                    raise FlameActionError("Unknown action name: '%s'".format(name))
         except FlameActionError, error:
             # A FlameActionError reaching here means that something major have stopped the current action
             app.log_error(error)
@@ -667,13 +672,19 @@ class FlameActions(HookBaseClass):
         # First loop populates the list of valid published files in the shot
         published_files = []
 
-        for published_file in sg_published_files:
-            # Gets paths to published files
-            sg_filters = [["id", "is", published_file["id"]]]
-            sg_fields = ["path", "published_file_type", "version", "version_number", "code", "updated_at", "name"]
-            sg_type = "PublishedFile"
+        # Gets paths to published files, all in one go
+        sg_fields = ["path", "published_file_type", "version", "version_number", "code", "updated_at", "name"]
+        sg_type = "PublishedFile"
 
-            file_info = self.parent.shotgun.find_one(sg_type, filters=sg_filters, fields=sg_fields)
+        files_info = self._find_by_ids(sg_type, [published_file["id"] for published_file in sg_published_files],
+                                       sg_fields)
+
+        for published_file in sg_published_files:
+            file_info = files_info.get(published_file["id"])
+            if file_info is None:
+                # The published file was retired or can't be seen by the current user
+                self.parent.log_warning("Cannot find {} {}".format(sg_type, published_file["id"]))
+                continue
 
             try:
                 # Get the local path of the published file
@@ -780,17 +791,17 @@ class FlameActions(HookBaseClass):
         if "sg_versions" in sg_info and len(sg_info["sg_versions"]) > 0:
             latest_update = None
 
-            for version in sg_info["sg_versions"]:
-                filters = [["id", "is", version["id"]]]
-                fields = ["frame_range", "updated_at"]
-                entity_type = "Version"
+            fields = ["frame_range", "updated_at"]
+            entity_type = "Version"
 
-                version_data = self.parent.shotgun.find_one(
-                    entity_type, filters=filters, fields=fields
-                )
+            versions_data = self._find_by_ids(entity_type, [version["id"] for version in sg_info["sg_versions"]],
+                                              fields)
+
+            for version in sg_info["sg_versions"]:
+                version_data = versions_data.get(version["id"])
 
                 # Checks that we have the necessary info to proceed.
-                if not all(f in version_data for f in fields):
+                if version_data is None or not all(f in version_data for f in fields):
                     raise FlameActionError("Cannot extract frame range for \n {}".format(sg_info))
 
                 # Only if the frame_range is defined
@@ -806,6 +817,60 @@ class FlameActions(HookBaseClass):
         app.log_debug("Found first frame = %s and last frame = %s" % (first_frame, last_frame))
         return first_frame, last_frame
 
+    @contextlib.contextmanager
+    def _shotgun_cache(self):
+        """
+        Context manager caching the entities retrieved by :meth:`_find_by_ids`
+        until the outermost context exits, so that an action run doesn't
+        retrieve the same entities several times.
+        """
+        if getattr(self, "_sg_cache", None) is not None:
+            # Nested in an action run which already has a cache
+            yield
+            return
+
+        self._sg_cache = {}
+        try:
+            yield
+        finally:
+            self._sg_cache = None
+
+    def _find_by_ids(self, entity_type, entity_ids, fields):
+        """
+        Retrieves a list of entities with a single Shotgun query. Entities which were
+        already retrieved during the current action run are taken from the cache.
+
+        :param str entity_type: Type of the entities.
+        :param [int] entity_ids: Ids of the entities.
+        :param [str] fields: Fields to retrieve.
+        :returns: Dictionary of Shotgun data dictionaries keyed by id. Entities which can't
+                  be found are missing.
+        :rtype: dict
+        """
+        cache = getattr(self, "_sg_cache", None)
+        if cache is None:
+            cache = {}
+
+        results = {}
+        missing_ids = []
+        for entity_id in entity_ids:
+            sg_data = cache.get((entity_type, entity_id))
+            if sg_data is not None and all(f in sg_data for f in fields):
+                results[entity_id] = sg_data
+            elif entity_id not in missing_ids:
+                missing_ids.append(entity_id)
+
+        if missing_ids:
+            self.parent.log_debug("Retrieving {} {} entities from Shotgun".format(len(missing_ids), entity_type))
+            sg_data_list = self.parent.shotgun.find(
+                entity_type, filters=[["id", "in", missing_ids]], fields=fields
+            )
+            for sg_data in sg_data_list:
+                cache[(entity_type, sg_data["id"])] = sg_data
+                results[sg_data["id"]] = sg_data
+
+        return results
+
     @staticmethod
     def _latest_version_filter(published_files_info):
         """
@@ -840,8 +905,7 @@ class FlameActions(HookBaseClass):
 
         return latest_clips.values()
 
-    @staticmethod
-    def _handle_frame_range(path):
+    def _handle_frame_range(self, path):
         """
         Takes a path and inserts formatted frame range for later use in Flame,
         using old-style Python formatting normally reserved for ints.
@@ -851,7 +915,10 @@ class FlameActions(HookBaseClass):
         :rtype: dict
         """
 
-        ranges = FlameActions._guess_frame_range(path)
+        ranges = self._guess_frame_range(path)
+
+        if None in ranges:
+            raise FlameActionError("File not found on disk - '%s'" % path)
 
         # Cuts off everything after the position of the formatting char.
         path_end = path[path.find('%'):]
@@ -863,9 +930,7 @@ class FlameActions(HookBaseClass):
         start_frame = formatting_str % int(ranges[0])
         end_frame = formatting_str % int(ranges[1])
 
-        if None in [start_frame, end_frame]:
-            raise FlameActionError("File not found on disk - '%s'" % path)
-        elif start_frame == end_frame:
+        if start_frame == end_frame:
             frame_range = start_frame
         else:
             # Generates back the frame range, now formatted
@@ -875,8 +940,7 @@ class FlameActions(HookBaseClass):
 
         return {"path": path.replace(formatting_str, frame_range), "start_frame": start_frame, "end_frame": end_frame}
 
-    @staticmethod
-    def _guess_frame_range(path):
+    def _guess_frame_range(self, path):
         """
         Try to get the sequence's frame range from the path
 
@@ -884,52 +948,22 @@ class FlameActions(HookBaseClass):
         :return: Tuple containing the first and the last frame number of the sequence or tuple of None if failure
         :rtype: ( int, int ) or ( None, None )
         """
-        folder, file_name = os.path.split(path)
-        match = re.match(r"(.*)(%\d+d)(.+)", file_name)
-
-        if not match:
+        if not re.match(r"(.*)(%\d+d)(.+)", os.path.basename(path)):
             raise FlameActionError("Cannot detect frame pattern for '%s'" % path)
 
-        frame_list = []
-
-        # The frame numbers have to match a certain number of digits
-        frame_len = int(match.group(2)[1:-1])
-
-        # Lets retrieve all the files that's in the folder of the file to match
-        try:
-            files = [f for f in os.listdir(folder) if os.path.isfile(os.path.join(folder, f))]
-        except OSError, e:
+        if not os.path.isdir(os.path.dirname(path)):
             raise FlameActionError("Unable to guess the frame range for '%s'" % path)
 
-        for f in files:
-            # It doesn't match our pattern
-            if not f.startswith(match.group(1)) or not f.endswith(match.group(3)):
-                continue
+        # The folder is listed once and the listing is reused while it doesn't change
+        frame_range = self._sequence_scanner.get_frame_range(path)
 
-            # Lets isolate the potential frame number from the file name
-            frame = f[len(match.group(1)):-len(match.group(3))]
-
-            # It's not a frame that match our pattern
-            if len(frame) != frame_len and not frame.isdigit():
-                continue
-
-            # Let's add the frame number of the file that match our pattern
-            frame_list.append(frame)
-
-        frame_list.sort()
-
-        if len(frame_list) >= 2:
-            # We have at least 2 frame so let's return first and the last frame number
-            return frame_list[0], frame_list[-1]
-        elif len(frame_list) == 1:
-            # We only have one frame that match so let's return the same frame as begin and end frame
-            return frame_list[0], frame_list[0]
-        else:
+        if frame_range is None:
             # Let's return None because nothing match our pattern
             return None, None
 
-    @staticmethod
-    def _exists(media_path):
+        return frame_range
+
+    def _exists(self, media_path):
         """
         Checks if the path exists directly or as a sequence
 
@@ -937,39 +971,25 @@ class FlameActions(HookBaseClass):
         :return: Return if the media_path exists
         :rtype: bool
         """
-
         # Check if the path exists
         if os.path.exists(media_path):
             return True
 
-        folder, file_name = os.path.split(media_path)
-
         # Try to check if the path is a sequence
-        match = re.match(r"(.*)(\[\d+-\d+\])(.+)", file_name)
-
-        if not match:
+        if not re.match(r"(.*)(\[\d+-\d+\])(.+)", os.path.basename(media_path)):
             # The path is not a sequence
             return False
 
-        # Get the first and last frame of the sequence
-        first, last = match.group(2).replace("[", "").replace("]", "").split("-")
-
-        # Get the frame value padding length
-        frame_size = len(first)
+        # Check if at least one frame in the sequence exists, the folder is listed
+        # once rather than checking each frame on disk
+        return self._sequence_scanner.exists(media_path)
 
-        # Check if at least one frame in the sequence exists
-        for frame in range(int(first), int(last)):
-            # Apply frame padding
-            frame = "0" * (frame_size - len(str(frame))) + str(frame)
-
-            # Build frame file name
-            file_name = match.group(1) + frame + match.group(3)
-
-            # Check if frame exists
-            if os.path.exists(os.path.join(folder, file_name)):
-                return True
-
-        return False
+    @property
+    def _sequence_scanner(self):
+        """
+        Sequence scanner shared by the action hooks, see :mod:`tk_multi_loader.sequence_scanner`.
+        """
+        return self.parent.import_module("tk_multi_loader").sequence_scanner
 
     @staticmethod
     def _build_path_from_template(template, fields):
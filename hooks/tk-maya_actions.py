@@ -12,7 +12,6 @@
 Hook that loads defines all the available actions, broken down by publish type. 
 """
 
-import glob
 import os
 import re
 import pymel.core as pm
@@ -258,15 +257,14 @@ class MayaActions(HookBaseClass):
         app = self.parent
         has_frame_spec = False
 
-        # replace any %0#d format string with a glob character. then just find
-        # an existing frame to use. example %04d => *
+        # find an existing frame to use for any %0#d format string, the
+        # directory is only listed once.
         frame_pattern = re.compile("(%0\dd)")
         frame_match = re.search(frame_pattern, path)
         if frame_match:
             has_frame_spec = True
-            frame_spec = frame_match.group(1)
-            glob_path = path.replace(frame_spec, "*")
-            frame_files = glob.glob(glob_path)
+            sequence_scanner = app.import_module("tk_multi_loader").sequence_scanner
+            frame_files = sequence_scanner.get_frame_paths(path)
             if frame_files:
                 path = frame_files[0]
             else:
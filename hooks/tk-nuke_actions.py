@@ -14,7 +14,6 @@ Hook that loads defines all the available actions, broken down by publish type.
 import sgtk
 import os
 import re
-import glob
 
 HookBaseClass = sgtk.get_hook_baseclass()
 
@@ -247,42 +246,25 @@ class NukeActions(HookBaseClass):
         :returns: None if no range could be determined, otherwise (min, max)
         :rtype: tuple or None
         """
-        # This pattern will match the following at the end of a string and
-        # retain the frame number or frame token as group(1) in the resulting
-        # match object:
-        #
-        # 0001
-        # ####
-        # %04d
-        #
-        # The number of digits or hashes does not matter; we match as many as
-        # exist.
-        frame_pattern = re.compile(r"([0-9#]+|[%]0\dd)$")
-        root, ext = os.path.splitext(path)
-        match = re.search(frame_pattern, root)
-
-        # If we did not match, we don't know how to parse the file name, or there
-        # is no frame number to extract.
-        if not match:
-            return None
+        sequence_scanner = self.parent.import_module("tk_multi_loader").sequence_scanner
 
-        # We need to get all files that match the pattern from disk so that we
-        # can determine what the min and max frame number is.
-        glob_path = "%s%s" % (
-            re.sub(frame_pattern, "*", root),
-            ext,
-        )
-        files = glob.glob(glob_path)
-
-        # Our pattern from above matches against the file root, so we need
-        # to chop off the extension at the end.
-        file_roots = [os.path.splitext(f)[0] for f in files]
-
-        # We know that the search will result in a match at this point, otherwise
-        # the glob wouldn't have found the file. We can search and pull group 1
-        # to get the integer frame number from the file root name.
-        frames = [int(re.search(frame_pattern, f).group(1)) for f in file_roots]
-        return (min(frames), max(frames))
+        if not sequence_scanner.is_sequence_path(path):
+            # This pattern will match a frame number at the end of the file
+            # root, such as file.0001.jpg, which is then turned into a frame
+            # token with the same padding.
+            frame_pattern = re.compile(r"([0-9]+)$")
+            root, ext = os.path.splitext(path)
+            match = re.search(frame_pattern, root)
+
+            # If we did not match, we don't know how to parse the file name, or there
+            # is no frame number to extract.
+            if not match:
+                return None
+
+            path = "%s%s%s" % (root[:match.start()], "#" * len(match.group(1)), ext)
+
+        # The frames are found with a single, cached, listing of the directory.
+        return sequence_scanner.get_frame_range(path)
 
     def _find_sequence_range(self, path):
         """
@@ -312,7 +294,13 @@ class NukeActions(HookBaseClass):
         fields = template.get_fields(path)
         if not "SEQ" in fields:
             return None
-        
+
+        sequence_scanner = self.parent.import_module("tk_multi_loader").sequence_scanner
+        if "eye" not in fields and sequence_scanner.is_sequence_path(path):
+            # The frames can be found with a single, cached, listing of the
+            # directory rather than by globbing the template.
+            return sequence_scanner.get_frame_range(path)
+
         files = self.parent.sgtk.paths_from_template(template, fields, ["SEQ", "eye"])
         
         # find frame numbers from these files:
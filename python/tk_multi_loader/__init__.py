@@ -8,14 +8,35 @@
 # agreement to the Shotgun Pipeline Toolkit Source Code License. All rights 
 # not expressly granted therein are reserved by Shotgun Software Inc.
 
-from .open_publish_form import open_publish_browser
+# modules imported here must not require Qt, so that the headless
+# functions can be used by scripts and farm jobs.
+from .site_cache import warm_up_site_cache
+from .publish_query import find_latest_publishes
+from . import dialog_pool
+from . import sequence_scanner
 
 import sgtk
 from sgtk.platform.qt import QtCore, QtGui
 
-from .ui import resources_rc
 
-help_screen = sgtk.platform.import_framework("tk-framework-qtwidgets", "help_screen") 
+def open_publish_browser(app, title, action, publish_types=None):
+    """
+    Display the loader UI in an open-file style, see :meth:`open_publish_form.open_publish_browser`.
+    """
+    # defer imports so that the app works gracefully in batch modes
+    from .open_publish_form import open_publish_browser
+    return open_publish_browser(app, title, action, publish_types)
+
+
+def run_memory_leak_test(app, iterations, navigation_steps, max_growth_mb, max_object_growth):
+    """
+    Checks that memory stays bounded as the dialog is opened and closed, see
+    :meth:`memory_diagnostics.run_leak_test`.
+    """
+    # defer imports so that the app works gracefully in batch modes
+    from .memory_diagnostics import run_leak_test
+    return run_leak_test(app, iterations, navigation_steps, max_growth_mb, max_object_growth)
+
 
 def show_dialog(app):
     """
@@ -24,7 +45,17 @@ def show_dialog(app):
     :param app:    The parent App
     """
     # defer imports so that the app works gracefully in batch modes
+    from .ui import resources_rc
     from .dialog import AppDialog
+
+    # reuse the dialog kept warm by the pool, if any
+    w = dialog_pool.acquire(app)
+    if w is not None:
+        w.reuse()
+        w.window().show()
+        w.window().raise_()
+        w.window().activateWindow()
+        return
     
     # Create and display the splash screen
     splash_pix = QtGui.QPixmap(":/res/splash.png") 
@@ -44,6 +75,10 @@ def show_dialog(app):
     # Keep pointer to dialog so as to be able to hide/show it in actions
     engine_name = app.engine.instance_name
     
+    # keep the dialog warm between invocations
+    if dialog_pool.is_enabled(app):
+        dialog_pool.adopt(app, w)
+
     # attach splash screen to the main window to help GC
     w.__splash_screen = splash
     
@@ -0,0 +1,271 @@
+# Copyright (c) 2015 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Checks whether the files of the publishes displayed are on disk, so that the
+delegates can flag missing files and incomplete sequences before an action
+fails on them.
+
+Only the rows visible in the publish view are checked, in the background and
+in batches, once the listing is displayed. Directories are listed with the
+shared sequence scanner and the listings are reused for the number of seconds
+set in the availability_badges setting, without even checking whether the
+directories were modified.
+"""
+
+import os
+import time
+
+import sgtk
+from sgtk.platform.qt import QtCore
+
+from . import sequence_scanner
+from .model_latestpublish import SgLatestPublishModel
+
+shotgun_model = sgtk.platform.import_framework("tk-framework-shotgunutils", "shotgun_model")
+
+# values of the availability role
+AVAILABLE = "available"
+INCOMPLETE = "incomplete"
+MISSING = "missing"
+
+# settings used when not configured
+DEFAULT_TTL = 30
+DEFAULT_BATCH_SIZE = 50
+
+# maximum number of visible rows checked in one go
+MAX_VISIBLE_ROWS = 500
+
+# number of results kept before the expired ones are discarded
+MAX_RESULTS = 10000
+
+
+def get_availability(path, max_age=0):
+    """
+    Checks whether a file or a sequence is on disk.
+
+    :param path: Path to a file or to a sequence, e.g. /path/to/render.%04d.exr
+    :param max_age: Number of seconds during which cached directory listings
+                    are used without checking whether the directories were modified.
+    :returns: AVAILABLE, INCOMPLETE if frames are missing in a sequence, or MISSING.
+    """
+    pattern = sequence_scanner.parse(path)
+    if pattern is None:
+        file_names = sequence_scanner.list_files(os.path.dirname(path), max_age)
+        if file_names is not None and os.path.basename(path) in file_names:
+            return AVAILABLE
+        # directories aren't listed, e.g. for publishes of whole folders
+        return AVAILABLE if file_names is not None and os.path.isdir(path) else MISSING
+
+    frames = sequence_scanner.get_frames(path, max_age)
+    if not frames:
+        # the frame pattern may be part of an actual file name
+        return AVAILABLE if os.path.exists(path) else MISSING
+
+    (first, last) = pattern.frame_range or (frames[0], frames[-1])
+    if len(frames) < last - first + 1:
+        return INCOMPLETE
+    return AVAILABLE
+
+
+def check_paths(paths, max_age):
+    """
+    Checks a batch of paths. Meant to be run in a background thread.
+
+    :param paths: List of paths to check.
+    :param max_age: See :meth:`get_availability`.
+    :returns: Dictionary of availabilities keyed by path.
+    """
+    return dict((path, get_availability(path, max_age)) for path in paths)
+
+
+class AvailabilityChecker(QtCore.QObject):
+    """
+    Sets the availability role of the publishes visible in a view, checking
+    them in the background as the view is scrolled and as its rows change.
+    The source model of the proxy model needs to support setting the role
+    with setData, which the standard item and flat publish models both do.
+    """
+
+    def __init__(self, parent, view, proxy_model, bg_task_manager):
+        """
+        :param parent: Parent QObject.
+        :param view: The publish view.
+        :param proxy_model: The proxy model displayed in the view.
+        :param bg_task_manager: Background task manager used to check the paths.
+        """
+        QtCore.QObject.__init__(self, parent)
+        self._bundle = sgtk.platform.current_bundle()
+        self._view = view
+        self._proxy_model = proxy_model
+        self._bg_task_manager = bg_task_manager
+
+        settings = self._bundle.get_setting("availability_badges") or {}
+        self._ttl = settings.get("ttl", DEFAULT_TTL)
+        self._batch_size = settings.get("batch_size", DEFAULT_BATCH_SIZE)
+
+        # availability of the paths checked, with the time they were checked
+        self._results = {}
+        # paths being checked, keyed by task id, and the persistent
+        # indexes of the rows waiting for each path
+        self._tasks = {}
+        self._waiting_indexes = {}
+
+        # wait for the view to settle before checking anything, so that
+        # loading and scrolling the listing aren't slowed down.
+        self._timer = QtCore.QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(200)
+        self._timer.timeout.connect(self._check_visible_rows)
+
+        self._view.verticalScrollBar().valueChanged.connect(self.schedule_check)
+        self._proxy_model.modelReset.connect(self.schedule_check)
+        self._proxy_model.layoutChanged.connect(self.schedule_check)
+        self._proxy_model.rowsInserted.connect(self.schedule_check)
+        self._bg_task_manager.task_completed.connect(self._on_task_completed)
+        self._bg_task_manager.task_failed.connect(self._on_task_failed)
+
+    def destroy(self):
+        """
+        Call this method prior to destroying this object.
+        """
+        self._timer.stop()
+        self._view.verticalScrollBar().valueChanged.disconnect(self.schedule_check)
+        self._proxy_model.modelReset.disconnect(self.schedule_check)
+        self._proxy_model.layoutChanged.disconnect(self.schedule_check)
+        self._proxy_model.rowsInserted.disconnect(self.schedule_check)
+        self._bg_task_manager.task_completed.disconnect(self._on_task_completed)
+        self._bg_task_manager.task_failed.disconnect(self._on_task_failed)
+        self._tasks = {}
+        self._waiting_indexes = {}
+
+    def schedule_check(self, *args):
+        """
+        Checks the visible rows once the view has settled.
+        """
+        self._timer.start()
+
+    def _check_visible_rows(self):
+        """
+        Sets the availability of the visible rows which were checked recently
+        and checks the other ones in the background.
+        """
+        now = time.time()
+        paths = []
+        for proxy_index in self._get_visible_indexes():
+            source_index = self._proxy_model.mapToSource(proxy_index)
+            if shotgun_model.get_sanitized_data(source_index, SgLatestPublishModel.IS_FOLDER_ROLE):
+                continue
+            sg_data = shotgun_model.get_sg_data(source_index)
+            path = ((sg_data or {}).get("path") or {}).get("local_path")
+            if not path:
+                # e.g. publishes of urls, nothing to check on disk
+                continue
+
+            result = self._results.get(path)
+            if result and now - result[0] < self._ttl:
+                self._set_availability(source_index, result[1])
+                continue
+
+            if path not in self._waiting_indexes:
+                self._waiting_indexes[path] = []
+                paths.append(path)
+            self._waiting_indexes[path].append(QtCore.QPersistentModelIndex(source_index))
+
+        for first in range(0, len(paths), self._batch_size):
+            batch = paths[first:first + self._batch_size]
+            uid = self._bg_task_manager.add_task(check_paths,
+                                                 task_kwargs={"paths": batch, "max_age": self._ttl})
+            self._tasks[uid] = batch
+
+    def _get_visible_indexes(self):
+        """
+        Returns the proxy indexes of the rows visible in the view.
+
+        :returns: List of model indexes.
+        """
+        viewport_rect = self._view.viewport().rect()
+        first_index = self._view.indexAt(viewport_rect.topLeft() + QtCore.QPoint(1, 1))
+        first_row = first_index.row() if first_index.isValid() else 0
+
+        indexes = []
+        for row in range(first_row, min(first_row + MAX_VISIBLE_ROWS, self._proxy_model.rowCount())):
+            index = self._proxy_model.index(row, 0)
+            rect = self._view.visualRect(index)
+            if rect.top() > viewport_rect.bottom():
+                # rows are laid out in order, the other ones are below
+                break
+            if rect.intersects(viewport_rect):
+                indexes.append(index)
+        return indexes
+
+    def _set_availability(self, source_index, availability):
+        """
+        Sets the availability role of a row, if it changed.
+
+        :param source_index: Source model index of the row.
+        :param availability: Availability of the publish.
+        """
+        if source_index.data(SgLatestPublishModel.AVAILABILITY_ROLE) != availability:
+            source_index.model().setData(source_index, availability, SgLatestPublishModel.AVAILABILITY_ROLE)
+
+    def _on_task_completed(self, uid, group, result):
+        """
+        Called when a batch of paths was checked.
+
+        :param uid: Id of the task.
+        :param group: Group of the task.
+        :param result: Dictionary of availabilities keyed by path.
+        """
+        if uid not in self._tasks:
+            return
+        del self._tasks[uid]
+
+        now = time.time()
+        if len(self._results) > MAX_RESULTS:
+            # forget the paths which would be checked again anyway
+            self._results = dict(
+                (path, r) for (path, r) in self._results.iteritems() if now - r[0] < self._ttl
+            )
+
+        for (path, availability) in result.iteritems():
+            self._results[path] = (now, availability)
+            for persistent_index in self._waiting_indexes.pop(path, []):
+                if not persistent_index.isValid():
+                    # the row was removed in the meantime
+                    continue
+                model = persistent_index.model()
+                source_index = model.index(persistent_index.row(),
+                                           persistent_index.column(),
+                                           persistent_index.parent())
+                self._set_availability(source_index, availability)
+
+    def _on_task_failed(self, uid, group, msg, stack_trace):
+        """
+        Called when a batch of paths couldn't be checked.
+
+        :param uid: Id of the task.
+        :param group: Group of the task.
+        :param msg: Error message.
+        :param stack_trace: Stack trace of the error.
+        """
+        if uid not in self._tasks:
+            return
+        for path in self._tasks.pop(uid):
+            self._waiting_indexes.pop(path, None)
+        self._log_debug("Could not check the availability of publishes: %s" % msg)
+
+    def _log_debug(self, msg):
+        """
+        Convenience wrapper around debug logging
+
+        :param msg: debug message
+        """
+        self._bundle.log_debug("[%s] %s" % (self.__class__.__name__, msg))
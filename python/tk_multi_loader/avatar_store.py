@@ -0,0 +1,154 @@
+# Copyright (c) 2015 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+import sgtk
+from sgtk.platform.qt import QtCore, QtGui
+
+from . import metrics
+
+shotgun_model = sgtk.platform.import_framework("tk-framework-shotgunutils", "shotgun_model")
+shotgun_data = sgtk.platform.import_framework("tk-framework-shotgunutils", "shotgun_data")
+
+# size the avatars are scaled to, as overlayed on publish thumbnails
+AVATAR_SIZE = 30
+
+# avatars downloaded during the session, keyed by user id. Users whose
+# avatar could not be downloaded are stored with None.
+_avatars = {}
+
+
+class AvatarStore(QtCore.QObject):
+    """
+    Downloads the avatars of users, once per session.
+
+    A history of hundreds of versions usually only has a handful of authors,
+    so avatars are keyed by user id rather than requested for each version.
+    Avatars are scaled once, when they are downloaded, and shared by all the
+    stores of the session.
+    """
+
+    # emitted with the user id when the avatar of a user was downloaded
+    # or could not be downloaded
+    avatar_loaded = QtCore.Signal(int)
+
+    def __init__(self, parent, bg_task_manager):
+        """
+        :param parent: Parent QObject.
+        :param bg_task_manager: Background task manager to use to download avatars.
+        """
+        QtCore.QObject.__init__(self, parent)
+        self._bundle = sgtk.platform.current_bundle()
+
+        # user ids of the downloads in flight, keyed by request id
+        self._pending = {}
+
+        self._sg_data_retriever = shotgun_data.ShotgunDataRetriever(self, bg_task_manager=bg_task_manager)
+        self._sg_data_retriever.work_completed.connect(self._on_data_retriever_work_completed)
+        self._sg_data_retriever.work_failure.connect(self._on_data_retriever_work_failure)
+        self._sg_data_retriever.start()
+
+    def destroy(self):
+        """
+        Call this method prior to destroying this object.
+        """
+        self._pending = {}
+        self._sg_data_retriever.stop()
+
+    def request_avatar(self, user, url):
+        """
+        Requests the avatar of a user, unless it was already downloaded or
+        is being downloaded.
+
+        :param user: Shotgun entity dictionary of the user.
+        :param url: Url of the avatar, as returned by Shotgun.
+        :returns: True if the avatar is available, see :meth:`get_avatar`,
+                  False if :attr:`avatar_loaded` will be emitted once it is.
+        """
+        if user["id"] in _avatars:
+            metrics.increment("avatar_store.hit")
+            return True
+        if user["id"] in self._pending.values():
+            return False
+
+        metrics.increment("avatar_store.miss")
+        uid = self._sg_data_retriever.request_thumbnail(url,
+                                                        user["type"],
+                                                        user["id"],
+                                                        "image",
+                                                        load_image=True)
+        self._pending[uid] = user["id"]
+        return False
+
+    def is_avatar_loaded(self, user_id):
+        """
+        Checks whether the avatar of a user was downloaded, or couldn't be.
+
+        :param user_id: Id of the user.
+        :returns: True if the avatar won't be downloaded again.
+        """
+        return user_id in _avatars
+
+    def get_avatar(self, user_id):
+        """
+        Returns the avatar of a user.
+
+        :param user_id: Id of the user.
+        :returns: QPixmap scaled to :data:`AVATAR_SIZE`, or None if the avatar
+                  wasn't downloaded or couldn't be.
+        """
+        return _avatars.get(user_id)
+
+    def _on_data_retriever_work_completed(self, uid, request_type, data):
+        """
+        Signaled whenever the data retriever completes some work.
+
+        :param uid: The unique id of the work that completed
+        :param request_type: Type of work completed
+        :param data: Result of the work
+        """
+        uid = shotgun_model.sanitize_qt(uid)
+        if uid not in self._pending:
+            return
+        user_id = self._pending.pop(uid)
+
+        image = data.get("image")
+        avatar = None
+        if image and not image.isNull():
+            avatar = QtGui.QPixmap.fromImage(image).scaled(
+                AVATAR_SIZE, AVATAR_SIZE,
+                QtCore.Qt.KeepAspectRatioByExpanding,
+                QtCore.Qt.SmoothTransformation)
+        _avatars[user_id] = avatar
+        self.avatar_loaded.emit(user_id)
+
+    def _on_data_retriever_work_failure(self, uid, msg):
+        """
+        Signaled whenever the data retriever fails to complete some work.
+
+        :param uid: The unique id of the work that failed
+        :param msg: The error message
+        """
+        uid = shotgun_model.sanitize_qt(uid)
+        if uid not in self._pending:
+            return
+        user_id = self._pending.pop(uid)
+        self._log_debug("Could not retrieve the avatar of user %s: %s" % (user_id, msg))
+
+        # the versions are displayed without avatar, it isn't requested again
+        _avatars[user_id] = None
+        self.avatar_loaded.emit(user_id)
+
+    def _log_debug(self, msg):
+        """
+        Convenience wrapper around debug logging
+
+        :param msg: debug message
+        """
+        self._bundle.log_debug("[%s] %s" % (self.__class__.__name__, msg))
@@ -38,6 +38,9 @@ class Banner(QtGui.QLabel):
             border-bottom-right-radius: 10px;
         """)
 
+        # Links, e.g. to cancel an action, are reported through linkActivated.
+        self.setTextInteractionFlags(QtCore.Qt.LinksAccessibleByMouse)
+
         # Hide the widget by default.
         self.hide()
         self._banner_animation = QtCore.QSequentialAnimationGroup(self)
@@ -70,6 +73,15 @@ class Banner(QtGui.QLabel):
         # visible at least 3 seconds.
         self._show_time = time.time()
 
+    def update_banner(self, message):
+        """
+        Updates the message of the banner while it is displayed, e.g. to report
+        progress, without restarting its display time.
+
+        :param message: Message to display in the banner.
+        """
+        self.setText(message)
+
     def hide_banner(self):
         """
         Hides the banner with a scrolling animation.
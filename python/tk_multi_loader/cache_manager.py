@@ -0,0 +1,388 @@
+# Copyright (c) 2015 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Keeps track of the cache files written for each query and evicts them
+according to the quotas set in the cache_quotas setting.
+
+Each entity selection, multi-selection, sub-items mode and tab publish filters
+produces its own cache file. Models record which file they use each time they
+load a query, which gives the manager the last time each file was used. Files
+older than the age quota are removed, then the least recently used files are
+removed until the total size fits in the size quota.
+
+The index is shared by all the sessions using the same cache location, so
+it is merged with the index on disk, under a lock file, each time it is
+written. Files found next to the tracked ones but missing from the index,
+e.g. written before the index existed, are tracked with their modification
+time as their last use.
+"""
+
+import os
+import json
+import time
+import errno
+import threading
+import contextlib
+
+import sgtk
+
+# name of the file storing the cache index
+CACHE_INDEX_FILE_NAME = "cache_index.json"
+
+# seconds to wait for the lock on the index, and age after which a lock
+# file is considered left behind by a crashed session.
+INDEX_LOCK_TIMEOUT = 5
+INDEX_LOCK_STALE_AGE = 30
+
+# model type recorded for files which were not tracked by the index
+UNTRACKED_MODEL_TYPE = "Untracked"
+
+# quotas used when not configured
+DEFAULT_MAX_SIZE_MB = 1024
+DEFAULT_MAX_AGE_DAYS = 30
+
+# the cache manager shared by all models
+_cache_manager = None
+
+
+def get_cache_manager():
+    """
+    Returns the cache manager shared by all models, creating it if needed.
+
+    :returns: :class:`CacheManager` instance.
+    """
+    global _cache_manager
+    if _cache_manager is None:
+        _cache_manager = CacheManager()
+    return _cache_manager
+
+
+def get_shotgun_model_cache_path(model):
+    """
+    Returns the path of the cache file used by a ShotgunModel for its current query.
+
+    :param model: ShotgunModel instance.
+    :returns: Path or None if it can't be determined.
+    """
+    # the path isn't exposed by the shotgun utils framework, so look it up
+    # defensively in case its internals change.
+    data_handler = getattr(model, "_data_handler", None)
+    return getattr(data_handler, "_cache_path", None)
+
+
+def get_model_cache_paths(model):
+    """
+    Returns the paths of the cache files used by a model for its current query.
+
+    :param model: ShotgunModel or :class:`SgFlatPublishModel` instance.
+    :returns: List of paths.
+    """
+    if hasattr(model, "get_cache_paths"):
+        return model.get_cache_paths()
+    path = get_shotgun_model_cache_path(model)
+    return [path] if path else []
+
+
+def record_model_cache_use(model):
+    """
+    Records that a ShotgunModel used the cache file for its current query.
+
+    :param model: ShotgunModel instance.
+    """
+    get_cache_manager().record_use(model.__class__.__name__, get_shotgun_model_cache_path(model))
+
+
+class CacheManager(object):
+    """
+    Tracks cache files and enforces size and age quotas on them.
+
+    This is safe to use from multiple threads, which allows garbage collection
+    to run in the background.
+    """
+
+    def __init__(self, index_path=None):
+        """
+        :param index_path: Path to the file storing the index. If not specified,
+                           a file in the app's cache location is used.
+        """
+        self._bundle = sgtk.platform.current_bundle()
+        if index_path is None:
+            index_path = os.path.join(self._bundle.cache_location, CACHE_INDEX_FILE_NAME)
+        self._index_path = index_path
+
+        quotas = self._bundle.get_setting("cache_quotas") or {}
+        self._max_size = quotas.get("max_size_mb", DEFAULT_MAX_SIZE_MB) * 1024 * 1024
+        self._max_age = quotas.get("max_age_days", DEFAULT_MAX_AGE_DAYS) * 24 * 3600
+
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._index = self._read_index()
+
+        # files removed by this session, which are dropped from the index
+        # on disk when it is merged.
+        self._removed_paths = set()
+
+    def record_use(self, model_type, path):
+        """
+        Records that a cache file was just used. The index is only written
+        to disk by :meth:`save` and :meth:`collect_garbage`.
+
+        :param model_type: Name of the model class using the file.
+        :param path: Path to the cache file.
+        """
+        if not path:
+            return
+        with self._lock:
+            self._index[path] = {"model": model_type, "last_used": time.time()}
+            self._dirty = True
+
+    def get_usage(self):
+        """
+        Reports the disk space used by the tracked cache files.
+
+        :returns: Dictionary keyed by model type, with "files" and "size", in
+                  bytes, values.
+        """
+        with self._lock:
+            index = dict(self._index)
+
+        usage = {}
+        for (path, entry) in index.items():
+            size = _get_file_size(path)
+            if size is None:
+                continue
+            model_usage = usage.setdefault(entry["model"], {"files": 0, "size": 0})
+            model_usage["files"] += 1
+            model_usage["size"] += size
+        return usage
+
+    def collect_garbage(self, keep_paths=None):
+        """
+        Removes the cache files exceeding the quotas.
+
+        :param keep_paths: Paths of files which should not be removed, e.g.
+                           because they are currently displayed.
+        :returns: Tuple with the number of files removed and the number of bytes freed.
+        """
+        keep_paths = set(keep_paths or [])
+        # pick up the files recorded by other sessions, or by none
+        self._merge_index()
+        self._track_untracked_files()
+        with self._lock:
+            index = dict(self._index)
+
+        now = time.time()
+        removed = []
+        deleted = 0
+        freed = 0
+
+        # oldest entries first
+        entries = []
+        for (path, entry) in index.items():
+            size = _get_file_size(path)
+            if size is None:
+                # file is gone, forget about it
+                removed.append(path)
+            else:
+                entries.append((entry["last_used"], path, size))
+        entries.sort()
+
+        total_size = sum([size for (_, _, size) in entries])
+        for (last_used, path, size) in entries:
+            if path in keep_paths:
+                continue
+            if now - last_used <= self._max_age and total_size <= self._max_size:
+                # this entry and all the following ones are within quotas
+                break
+            try:
+                os.remove(path)
+            except Exception as e:
+                self._log_debug("Could not remove cache file %s: %s" % (path, e))
+                continue
+            removed.append(path)
+            total_size -= size
+            deleted += 1
+            freed += size
+
+        with self._lock:
+            for path in removed:
+                entry = self._index.get(path)
+                # skip files used again while collecting
+                if entry is not None and entry is index[path]:
+                    del self._index[path]
+                    self._removed_paths.add(path)
+            self._dirty = True
+
+        self.save()
+        self._log_debug(
+            "Removed %d cache file(s), freed %.1f MB." % (deleted, freed / (1024.0 * 1024.0))
+        )
+        for (model_type, model_usage) in sorted(self.get_usage().items()):
+            self._log_debug(
+                "%s: %d cache file(s), %.1f MB." % (
+                    model_type, model_usage["files"], model_usage["size"] / (1024.0 * 1024.0)
+                )
+            )
+        return (deleted, freed)
+
+    def save(self):
+        """
+        Writes the index to disk if it changed, merged with the entries
+        written by other sessions since it was read.
+        """
+        with self._lock:
+            if not self._dirty:
+                return
+            self._dirty = False
+
+        tmp_path = "%s.%d.tmp" % (self._index_path, os.getpid())
+        try:
+            if not os.path.exists(os.path.dirname(self._index_path)):
+                os.makedirs(os.path.dirname(self._index_path))
+            with self._lock_index():
+                data = self._merge_index()
+                with open(tmp_path, "w") as fh:
+                    json.dump(data, fh)
+                if os.path.exists(self._index_path):
+                    os.remove(self._index_path)
+                os.rename(tmp_path, self._index_path)
+            with self._lock:
+                self._removed_paths.clear()
+        except Exception as e:
+            self._log_debug("Could not write %s: %s" % (self._index_path, e))
+            with self._lock:
+                self._dirty = True
+
+    def _merge_index(self):
+        """
+        Merges the index on disk into the index of this session, keeping the
+        last use of each file. Files removed by this session are dropped,
+        unless they were written again since.
+
+        :returns: Copy of the merged index.
+        """
+        disk_index = self._read_index()
+        with self._lock:
+            for (path, entry) in disk_index.items():
+                current = self._index.get(path)
+                if path in self._removed_paths and not os.path.exists(path):
+                    continue
+                if current is None or entry["last_used"] > current["last_used"]:
+                    self._index[path] = entry
+            return dict(self._index)
+
+    def _track_untracked_files(self):
+        """
+        Adds the files which are missing from the index, in the folders holding
+        tracked files inside the app's cache location, using their modification
+        time as their last use. The cache location itself holds other state,
+        e.g. the index, and is not searched.
+        """
+        cache_root = os.path.normpath(self._bundle.cache_location)
+        with self._lock:
+            tracked_paths = set(self._index)
+        folders = set()
+        for path in tracked_paths:
+            folder = os.path.normpath(os.path.dirname(path))
+            if folder.startswith(cache_root + os.sep):
+                folders.add(folder)
+
+        untracked = {}
+        for folder in folders:
+            try:
+                names = os.listdir(folder)
+            except OSError:
+                continue
+            for name in names:
+                path = os.path.join(folder, name)
+                if path in tracked_paths or not os.path.isfile(path):
+                    continue
+                try:
+                    untracked[path] = {"model": UNTRACKED_MODEL_TYPE, "last_used": os.path.getmtime(path)}
+                except OSError:
+                    continue
+
+        if not untracked:
+            return
+        self._log_debug("Tracking %d cache file(s) missing from the index." % len(untracked))
+        with self._lock:
+            for (path, entry) in untracked.items():
+                self._index.setdefault(path, entry)
+            self._dirty = True
+
+    @contextlib.contextmanager
+    def _lock_index(self):
+        """
+        Context manager holding the lock file of the index, which prevents
+        sessions from writing the index at the same time.
+
+        :raises OSError: If the lock can't be acquired.
+        """
+        lock_path = "%s.lock" % self._index_path
+        end = time.time() + INDEX_LOCK_TIMEOUT
+        while True:
+            try:
+                os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                break
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+            try:
+                if time.time() - os.path.getmtime(lock_path) > INDEX_LOCK_STALE_AGE:
+                    # left behind by a session which crashed
+                    os.remove(lock_path)
+                    continue
+            except OSError:
+                # released in the meantime
+                continue
+            if time.time() > end:
+                raise OSError(errno.EEXIST, "Timed out waiting for the index lock", lock_path)
+            time.sleep(0.05)
+        try:
+            yield
+        finally:
+            os.remove(lock_path)
+
+    def _read_index(self):
+        """
+        Reads the index from disk.
+
+        :returns: Dictionary of entries keyed by path.
+        """
+        if not os.path.exists(self._index_path):
+            return {}
+        try:
+            with open(self._index_path, "r") as fh:
+                return json.load(fh)
+        except Exception as e:
+            self._log_debug("Could not read %s: %s" % (self._index_path, e))
+            return {}
+
+    def _log_debug(self, msg):
+        """
+        Convenience wrapper around debug logging
+
+        :param msg: debug message
+        """
+        self._bundle.log_debug("[%s] %s" % (self.__class__.__name__, msg))
+
+
+def _get_file_size(path):
+    """
+    Returns the size of a file.
+
+    :param path: Path to the file.
+    :returns: Size in bytes or None if the file doesn't exist.
+    """
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return None
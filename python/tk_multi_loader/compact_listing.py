@@ -0,0 +1,468 @@
+# Copyright (c) 2015 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Compact, memory-mappable, file format for publish listings.
+
+The columns needed to display, filter and search a row are stored in a
+fixed-width row index and a string table, so that a listing can be displayed
+straight from the mapped file. The full Shotgun dictionary of a row is only
+unpickled when it is accessed.
+
+The file is made of the following sections, integers are little endian:
+
+- header: magic, format version, number of rows in each index, section offsets.
+- listing index: one entry per displayed publish, with the location of its
+  pickled dictionary, its type id, the location of its display text, type
+  name and search string in the string table, its id, its update time and
+  the index of each of its facet values in the facet table.
+- raw index: one entry per record returned by Shotgun, before any filtering,
+  with its id, the location of its pickled dictionary and the index of its
+  delta in the delta table. Records which are displayed share the pickled
+  dictionary of their listing entry, only the records filtered out are
+  pickled on their own.
+- meta data: pickled dictionary of additional values.
+- facet table: pickled list of the distinct (key, label) facet values.
+- delta table: pickled list of the distinct differences between a displayed
+  dictionary and the record it was computed from, e.g. the task_uniqueness
+  flag added to the latest publishes.
+- string table: utf-8 encoded strings.
+- data: pickled dictionaries.
+"""
+
+import os
+import mmap
+import struct
+
+from .facets import FACETS
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+MAGIC = b"TKPL"
+FORMAT_VERSION = 4
+
+# magic, version, listing rows, raw rows, listing index offset, raw index offset,
+# meta data offset, meta data length, facet table offset, facet table length,
+# delta table offset, delta table length, string table offset, data offset
+_HEADER = struct.Struct("<4sIIIQQQIQIQIQQ")
+
+# data offset, data length, type id, offset and length of the display text,
+# type name and search string, publish id, update time, then the facet table
+# index of each facet value.
+_LISTING_ENTRY = struct.Struct("<QIiIIIIIIqd" + "I" * len(FACETS))
+
+# id, data offset, data length, delta table index
+_RAW_ENTRY = struct.Struct("<qQII")
+
+# type id stored for publishes without a type
+_NO_TYPE_ID = -1
+
+# string length stored for None
+_NO_STRING = 0xffffffff
+
+# delta table index stored for records pickled on their own
+_NO_DELTA = 0xffffffff
+
+# update time stored for publishes without one
+_NO_TIMESTAMP = -1.0
+
+
+class CompactListing(object):
+    """
+    Read access to a publish listing stored in the compact format.
+
+    The file stays open and mapped until :meth:`close` is called.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: Path to the listing file.
+        :raises ValueError: If the file isn't a valid listing.
+        """
+        self._path = path
+        self._map = None
+        self._open()
+
+        self._meta = None
+        self._facet_table = None
+
+    @property
+    def path(self):
+        """
+        Path to the listing file.
+        """
+        return self._path
+
+    def _open(self):
+        """
+        Opens and maps the listing file, and reads its header.
+
+        :raises ValueError: If the file isn't a valid listing.
+        """
+        self._fh = open(self._path, "rb")
+        try:
+            self._map = mmap.mmap(self._fh.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            self._fh.close()
+            raise
+
+        try:
+            (magic,
+             version,
+             self._row_count,
+             self._raw_count,
+             self._listing_offset,
+             self._raw_offset,
+             self._meta_offset,
+             self._meta_length,
+             self._facets_offset,
+             self._facets_length,
+             self._deltas_offset,
+             self._deltas_length,
+             self._strings_offset,
+             self._data_offset) = _HEADER.unpack_from(self._map, 0)
+            if magic != MAGIC or version != FORMAT_VERSION:
+                raise ValueError("Unsupported listing format.")
+            if self._data_offset > len(self._map):
+                raise ValueError("Truncated listing file.")
+        except Exception:
+            self.close()
+            raise
+
+    @property
+    def row_count(self):
+        """
+        Number of publishes in the listing.
+        """
+        return self._row_count
+
+    @property
+    def raw_count(self):
+        """
+        Number of records returned by Shotgun.
+        """
+        return self._raw_count
+
+    @property
+    def meta(self):
+        """
+        Dictionary of additional values stored with the listing.
+        """
+        if self._meta is None:
+            start = self._meta_offset
+            self._meta = pickle.loads(self._map[start:start + self._meta_length])
+        return self._meta
+
+    def get_columns(self, row):
+        """
+        Returns the columns stored for a publish, without unpickling its data.
+
+        :param row: Row number.
+        :returns: Tuple with the type id, display text, type name, search string,
+                  publish id, update time and facet values.
+        """
+        entry = _LISTING_ENTRY.unpack_from(self._map, self._listing_offset + row * _LISTING_ENTRY.size)
+        if self._facet_table is None:
+            start = self._facets_offset
+            self._facet_table = pickle.loads(self._map[start:start + self._facets_length])
+        type_id = entry[2]
+        return (
+            None if type_id == _NO_TYPE_ID else type_id,
+            self._get_string(entry[3], entry[4]),
+            self._get_string(entry[5], entry[6]),
+            self._get_string(entry[7], entry[8]),
+            entry[9],
+            None if entry[10] == _NO_TIMESTAMP else entry[10],
+            tuple(self._facet_table[index] for index in entry[11:]),
+        )
+
+    def get_row(self, row):
+        """
+        Returns the Shotgun dictionary for a publish.
+
+        :param row: Row number.
+        :returns: Shotgun dictionary.
+        """
+        (offset, length) = _LISTING_ENTRY.unpack_from(
+            self._map, self._listing_offset + row * _LISTING_ENTRY.size
+        )[:2]
+        return self._get_data(offset, length)
+
+    def get_raw_ids(self):
+        """
+        Returns the ids of the records returned by Shotgun, without unpickling them.
+
+        :returns: List of ids.
+        """
+        return [
+            _RAW_ENTRY.unpack_from(self._map, self._raw_offset + row * _RAW_ENTRY.size)[0]
+            for row in range(self._raw_count)
+        ]
+
+    def get_raw_rows(self):
+        """
+        Returns the records returned by Shotgun.
+
+        :returns: List of Shotgun dictionaries.
+        """
+        deltas = None
+        rows = []
+        for row in range(self._raw_count):
+            (_, offset, length, delta_index) = _RAW_ENTRY.unpack_from(
+                self._map, self._raw_offset + row * _RAW_ENTRY.size
+            )
+            sg_data = self._get_data(offset, length)
+            if delta_index != _NO_DELTA:
+                # the record shares the dictionary displayed for it
+                if deltas is None:
+                    start = self._deltas_offset
+                    deltas = pickle.loads(self._map[start:start + self._deltas_length])
+                (changed, removed_keys) = deltas[delta_index]
+                sg_data.update(changed)
+                for key in removed_keys:
+                    del sg_data[key]
+            rows.append(sg_data)
+        return rows
+
+    def move(self, path):
+        """
+        Moves the listing file, e.g. from the temporary file it was written to
+        into its final location. The listing stays open, and is reopened from
+        its previous location if the file can't be moved.
+
+        :param path: New path of the listing file.
+        """
+        # open files can't be renamed or replaced on all platforms
+        self.close()
+        try:
+            if os.path.exists(path):
+                os.remove(path)
+            os.rename(self._path, path)
+            self._path = path
+        finally:
+            self._open()
+
+    def close(self):
+        """
+        Unmaps and closes the file. Rows can't be accessed anymore afterwards.
+        """
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._fh.close()
+
+    def _get_string(self, offset, length):
+        """
+        Reads a string from the string table.
+
+        :param offset: Offset in the string table.
+        :param length: Length in bytes.
+        :returns: Unicode string or None.
+        """
+        if length == _NO_STRING:
+            return None
+        start = self._strings_offset + offset
+        return self._map[start:start + length].decode("utf-8")
+
+    def _get_data(self, offset, length):
+        """
+        Unpickles a dictionary from the data section.
+
+        :param offset: Offset in the data section.
+        :param length: Length in bytes.
+        :returns: Unpickled value.
+        """
+        start = self._data_offset + offset
+        return pickle.loads(self._map[start:start + length])
+
+
+def write_listing(fh, rows, raw_rows, meta):
+    """
+    Writes a publish listing in the compact format.
+
+    :param fh: File object opened for writing in binary mode.
+    :param rows: List of (sg_data, type_id, display_text, type_name, search_str,
+                 facet_values) tuples for the publishes to display.
+    :param raw_rows: List of records returned by Shotgun.
+    :param meta: Dictionary of additional values to store.
+    """
+    strings = _Section()
+    data = _Section()
+
+    # distinct facet values and their index in the facet table
+    facet_table = []
+    facet_indices = {}
+
+    # location of the pickled dictionary of each displayed publish, by id
+    listing_data = {}
+
+    listing_entries = []
+    for (sg_data, type_id, display_text, type_name, search_str, facet_values) in rows:
+        (data_offset, data_length) = data.add(pickle.dumps(sg_data, pickle.HIGHEST_PROTOCOL))
+        listing_data.setdefault(sg_data["id"], (sg_data, data_offset, data_length))
+        indices = []
+        for facet_value in facet_values:
+            index = facet_indices.get(facet_value)
+            if index is None:
+                index = len(facet_table)
+                facet_indices[facet_value] = index
+                facet_table.append(facet_value)
+            indices.append(index)
+        listing_entries.append(
+            _LISTING_ENTRY.pack(
+                data_offset,
+                data_length,
+                _NO_TYPE_ID if type_id is None else type_id,
+                *(_add_string(strings, display_text) +
+                  _add_string(strings, type_name) +
+                  _add_string(strings, search_str) +
+                  (sg_data["id"], _get_timestamp(sg_data)) +
+                  tuple(indices))
+            )
+        )
+
+    # distinct deltas and their index in the delta table
+    delta_table = []
+    delta_indices = {}
+
+    raw_entries = []
+    for sg_data in raw_rows:
+        listed = listing_data.get(sg_data["id"])
+        if listed is None:
+            # filtered out, e.g. an older version of a publish
+            (data_offset, data_length) = data.add(pickle.dumps(sg_data, pickle.HIGHEST_PROTOCOL))
+            delta_index = _NO_DELTA
+        else:
+            (listed_sg_data, data_offset, data_length) = listed
+            delta = _get_delta(listed_sg_data, sg_data)
+            delta_key = pickle.dumps(delta, pickle.HIGHEST_PROTOCOL)
+            delta_index = delta_indices.get(delta_key)
+            if delta_index is None:
+                delta_index = len(delta_table)
+                delta_indices[delta_key] = delta_index
+                delta_table.append(delta)
+        raw_entries.append(_RAW_ENTRY.pack(sg_data["id"], data_offset, data_length, delta_index))
+
+    meta_data = pickle.dumps(meta, pickle.HIGHEST_PROTOCOL)
+    facet_data = pickle.dumps(facet_table, pickle.HIGHEST_PROTOCOL)
+    delta_data = pickle.dumps(delta_table, pickle.HIGHEST_PROTOCOL)
+
+    listing_offset = _HEADER.size
+    raw_offset = listing_offset + len(listing_entries) * _LISTING_ENTRY.size
+    meta_offset = raw_offset + len(raw_entries) * _RAW_ENTRY.size
+    facets_offset = meta_offset + len(meta_data)
+    deltas_offset = facets_offset + len(facet_data)
+    strings_offset = deltas_offset + len(delta_data)
+    data_offset = strings_offset + strings.size
+
+    fh.write(
+        _HEADER.pack(
+            MAGIC,
+            FORMAT_VERSION,
+            len(listing_entries),
+            len(raw_entries),
+            listing_offset,
+            raw_offset,
+            meta_offset,
+            len(meta_data),
+            facets_offset,
+            len(facet_data),
+            deltas_offset,
+            len(delta_data),
+            strings_offset,
+            data_offset
+        )
+    )
+    fh.write(b"".join(listing_entries))
+    fh.write(b"".join(raw_entries))
+    fh.write(meta_data)
+    fh.write(facet_data)
+    fh.write(delta_data)
+    strings.write(fh)
+    data.write(fh)
+
+
+class _Section(object):
+    """
+    Accumulates chunks of bytes and keeps track of their offsets.
+    """
+
+    def __init__(self):
+        self._chunks = []
+        self.size = 0
+
+    def add(self, chunk):
+        """
+        Adds a chunk at the end of the section.
+
+        :param chunk: Bytes to add.
+        :returns: Tuple with the offset and the length of the chunk.
+        """
+        offset = self.size
+        self._chunks.append(chunk)
+        self.size += len(chunk)
+        return (offset, len(chunk))
+
+    def write(self, fh):
+        """
+        Writes the section.
+
+        :param fh: File object opened for writing in binary mode.
+        """
+        fh.write(b"".join(self._chunks))
+
+
+def _get_delta(sg_data, raw_sg_data):
+    """
+    Computes what differs between a displayed dictionary and the record it
+    was computed from.
+
+    :param sg_data: Displayed Shotgun dictionary.
+    :param raw_sg_data: Shotgun dictionary returned by the query.
+    :returns: Tuple with the dictionary of the values to change and the tuple of
+              the keys to remove to get the record back from the displayed dictionary.
+    """
+    changed = dict(
+        (key, value) for (key, value) in raw_sg_data.iteritems()
+        if key not in sg_data or sg_data[key] != value
+    )
+    removed_keys = tuple(sorted(key for key in sg_data if key not in raw_sg_data))
+    return (changed, removed_keys)
+
+
+def _get_timestamp(sg_data):
+    """
+    Returns the update time of a publish, as stored in the listing index.
+
+    :param sg_data: Shotgun dictionary, with time stamps already sanitized.
+    :returns: Unix time stamp as a float.
+    """
+    updated_at = sg_data.get("updated_at")
+    if not isinstance(updated_at, (int, long, float)):
+        return _NO_TIMESTAMP
+    return float(updated_at)
+
+
+def _add_string(strings, value):
+    """
+    Adds a string to the string table.
+
+    :param strings: String table :class:`_Section`.
+    :param value: String to add, can be None.
+    :returns: Tuple with the offset and the length of the string.
+    """
+    if value is None:
+        return (0, _NO_STRING)
+    if not isinstance(value, unicode):
+        value = str(value).decode("utf-8")
+    return strings.add(value.encode("utf-8"))
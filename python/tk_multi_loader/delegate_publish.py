@@ -3,6 +3,7 @@ import sgtk
 from sgtk.platform.qt import QtCore, QtGui
 
 from .model_latestpublish import SgLatestPublishModel
+from . import availability
 
 # import the shotgun_model and view modules from the shotgun utils framework
 shotgun_model = sgtk.platform.import_framework("tk-framework-shotgunutils", "shotgun_model")
@@ -196,3 +197,18 @@ class PublishDelegate(shotgun_view.EditSelectedWidgetDelegate):
             self._format_folder(model_index, widget)
         else:
             self._format_publish(model_index, widget)
+
+    def _get_availability_text(self, model_index):
+        """
+        Returns the text flagging publishes whose files are not fully on disk,
+        see the availability module.
+
+        :param model_index: The model index to operate on
+        :returns: Html text to append to the publish details, empty if there is nothing to flag.
+        """
+        publish_availability = shotgun_model.get_sanitized_data(model_index, SgLatestPublishModel.AVAILABILITY_ROLE)
+        if publish_availability == availability.MISSING:
+            return " <span style='color:#E0584A'>(Missing on disk)</span>"
+        elif publish_availability == availability.INCOMPLETE:
+            return " <span style='color:#E5A000'>(Incomplete on disk)</span>"
+        return ""
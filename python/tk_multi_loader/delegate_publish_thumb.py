@@ -223,6 +223,7 @@ class SgPublishThumbDelegate(PublishDelegate):
             details_text = shotgun_model.get_sanitized_data(model_index,
                                                             SgLatestPublishModel.PUBLISH_TYPE_NAME_ROLE)
 
+        details_text += self._get_availability_text(model_index)
         widget.set_text(header_text, details_text)
 
     def sizeHint(self, style_options, model_index):
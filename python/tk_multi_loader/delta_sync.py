@@ -0,0 +1,385 @@
+# Copyright (c) 2015 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Incremental synchronization of Shotgun query results.
+
+Rather than running a full query again, a refresh only asks Shotgun for the
+records which were created or updated since a high-water mark, plus a cheap
+check for records which no longer match the query.
+
+The methods taking a Shotgun connection as their first parameter are meant to
+be run in a background thread, e.g. through ``ShotgunDataRetriever.execute_method``.
+This module is deliberately free of any Qt dependencies.
+"""
+
+import time
+import datetime
+
+# number of seconds to look back in time when fetching changes. Shotgun stores
+# time stamps with a one second precision, so records updated within the same
+# second as the high-water mark could otherwise be missed.
+CHANGES_OVERLAP = 1
+
+
+def compute_watermark(sg_data_list):
+    """
+    Computes the high-water mark for a list of Shotgun records.
+
+    :param sg_data_list: List of Shotgun dictionaries, which should include
+                         the updated_at field.
+    :returns: Dictionary with keys "updated_at" (unix time stamp), "id" (highest id),
+              "count" (number of records) and "id_sum" (sum of the ids), or None if
+              the high-water mark can't be computed.
+    """
+    max_updated_at = None
+    max_id = 0
+    id_sum = 0
+    for sg_data in sg_data_list:
+        updated_at = _to_unix_time(sg_data.get("updated_at"))
+        if updated_at is None:
+            # this query doesn't include the updated_at field
+            return None
+        if max_updated_at is None or updated_at > max_updated_at:
+            max_updated_at = updated_at
+        max_id = max(sg_data["id"], max_id)
+        id_sum += sg_data["id"]
+
+    return {"updated_at": max_updated_at, "id": max_id, "count": len(sg_data_list), "id_sum": id_sum}
+
+
+def get_changes_filter(watermark, overlap=0):
+    """
+    Returns a Shotgun filter matching records created or updated after a high-water mark.
+
+    :param watermark: High-water mark, as returned by :meth:`compute_watermark`.
+    :param overlap: Number of seconds to look back in time from the high-water mark.
+    :returns: Shotgun filter dictionary.
+    """
+    filters = [["id", "greater_than", watermark["id"]]]
+    if watermark["updated_at"] is not None:
+        since = datetime.datetime.fromtimestamp(watermark["updated_at"] - overlap)
+        filters.append(["updated_at", "greater_than", since])
+    return {"filter_operator": "any", "filters": filters}
+
+
+def has_changes(sg, entity_type, filters, watermark):
+    """
+    Checks if the results of a query changed since a high-water mark was recorded.
+
+    Changes made to linked fields, e.g. the status of the version associated
+    with a publish, don't update the records themselves and are not detected.
+    This check is only meant for automatic refreshes, refreshes requested by
+    users should always run the full query.
+
+    :param sg: Shotgun API instance.
+    :param entity_type: Shotgun entity type of the query.
+    :param filters: Shotgun filters of the query.
+    :param watermark: High-water mark, as returned by :meth:`compute_watermark`.
+    :returns: True if records were added, updated or removed, False otherwise.
+    """
+    if sg.find_one(entity_type, filters + [get_changes_filter(watermark, CHANGES_OVERLAP)], ["id"]):
+        return True
+
+    # nothing new, check if some records were deleted, don't match the query
+    # anymore or started to match it. High-water marks recorded before the
+    # sum of the ids was stored only have their count checked.
+    (count, id_sum) = _get_id_summary(sg, entity_type, filters)
+    return count != watermark["count"] or id_sum != watermark.get("id_sum", id_sum)
+
+
+def fetch_changes(sg, entity_type, filters, fields, order, watermark, known_ids):
+    """
+    Retrieves the changes made to the results of a query since a high-water mark
+    was recorded.
+
+    :param sg: Shotgun API instance.
+    :param entity_type: Shotgun entity type of the query.
+    :param filters: Shotgun filters of the query.
+    :param fields: Shotgun fields to retrieve.
+    :param order: Shotgun order specification.
+    :param watermark: High-water mark, as returned by :meth:`compute_watermark`.
+    :param known_ids: List of ids of the records retrieved so far.
+    :returns: Dictionary with keys "updated", the list of created or updated records,
+              and "removed_ids", the list of ids of the records which don't match the
+              query anymore.
+    """
+    return _fetch_changes(
+        sg,
+        entity_type,
+        filters,
+        get_changes_filter(watermark, CHANGES_OVERLAP),
+        fields,
+        order,
+        known_ids
+    )
+
+
+def _fetch_changes(sg, entity_type, filters, changes_filter, fields, order, known_ids):
+    """
+    Retrieves the changes made to the results of a query, see :meth:`fetch_changes`.
+
+    :param sg: Shotgun API instance.
+    :param entity_type: Shotgun entity type of the query.
+    :param filters: Shotgun filters of the query.
+    :param changes_filter: Shotgun filter matching the records created or updated
+                           since the results were retrieved.
+    :param fields: Shotgun fields to retrieve.
+    :param order: Shotgun order specification.
+    :param known_ids: List of ids of the records retrieved so far.
+    :returns: Dictionary with keys "updated" and "removed_ids".
+    """
+    updated = sg.find(entity_type, filters + [changes_filter], fields, order)
+
+    known_ids = set(known_ids)
+    updated_ids = set([sg_data["id"] for sg_data in updated])
+
+    # cheap check first: if the number of records matching the query and the
+    # sum of their ids are what we expect, nothing was removed and no record
+    # started to match the query without being updated itself. Comparing the
+    # sum of the ids catches a record being removed while another one starts
+    # to match, which leaves the count unchanged. Several records removed
+    # while others with the exact same sum of ids start to match would still
+    # go unnoticed until the next full query.
+    removed_ids = []
+    expected_ids = known_ids | updated_ids
+    if _get_id_summary(sg, entity_type, filters) != (len(expected_ids), sum(expected_ids)):
+        # something was removed, or records started to match the query without
+        # being updated themselves, e.g. because a linked entity changed. Only
+        # retrieve the ids to find out which ones.
+        current_ids = set([sg_data["id"] for sg_data in sg.find(entity_type, filters, ["id"])])
+        removed_ids = list(known_ids - current_ids)
+        missing_ids = list(current_ids - known_ids - updated_ids)
+        if missing_ids:
+            updated.extend(sg.find(entity_type, filters + [["id", "in", missing_ids]], fields, order))
+
+    return {"updated": updated, "removed_ids": removed_ids}
+
+
+def fetch_records(sg, entity_type, filters, fields, order, changed_ids, removed_ids):
+    """
+    Retrieves specific records, e.g. records reported as changed by the event log,
+    and reports them on the same form as :meth:`fetch_changes`.
+
+    :param sg: Shotgun API instance.
+    :param entity_type: Shotgun entity type of the query.
+    :param filters: Shotgun filters of the query.
+    :param fields: Shotgun fields to retrieve.
+    :param order: Shotgun order specification.
+    :param changed_ids: Ids of the records which were created or changed.
+    :param removed_ids: Ids of the records which were removed.
+    :returns: Dictionary with keys "updated" and "removed_ids". Changed records
+              which don't match the query are reported as removed.
+    """
+    updated = []
+    if changed_ids:
+        updated = sg.find(entity_type, filters + [["id", "in", changed_ids]], fields, order)
+
+    updated_ids = set([sg_data["id"] for sg_data in updated])
+    removed_ids = list(removed_ids) + [x for x in changed_ids if x not in updated_ids]
+
+    return {"updated": updated, "removed_ids": removed_ids}
+
+
+def fetch_parts(sg, entity_type, common_filters, fields, order, parts):
+    """
+    Retrieves the results of several queries which only differ by the entity
+    their records are linked to, e.g. the publishes of each entity of a
+    multi-selection, in as few requests as possible.
+
+    Parts which were never retrieved are fetched with a single query. Parts
+    retrieved before only have their changes fetched, with another single query
+    in which each part is checked against its own high-water mark. Parts linked
+    through a field which isn't retrieved, e.g. tags applied to the version of
+    a publish, can't be told apart in the results and are queried on their own.
+
+    :param sg: Shotgun API instance.
+    :param entity_type: Shotgun entity type of the queries.
+    :param common_filters: Shotgun filters shared by all the parts.
+    :param fields: Shotgun fields to retrieve.
+    :param order: Shotgun order specification.
+    :param parts: List of dictionaries with keys "field", the link field, "value",
+                  the entity the records of the part are linked to, "watermark",
+                  the high-water mark of the part or None if it was never retrieved,
+                  and "known_ids", the ids of the records retrieved so far.
+    :returns: List with, for each part, a dictionary with either key "sg", the
+              records of the part, or "changes", on the same form as returned
+              by :meth:`fetch_changes`.
+    """
+    results = [None] * len(parts)
+
+    for (i, part) in enumerate(parts):
+        if part["field"] in fields:
+            continue
+        filters = common_filters + [_get_link_filter([part])]
+        if part["watermark"] is None:
+            results[i] = {"sg": sg.find(entity_type, filters, fields, order)}
+        else:
+            results[i] = {
+                "changes": fetch_changes(sg, entity_type, filters, fields, order, part["watermark"], part["known_ids"])
+            }
+
+    missing = [
+        i for (i, part) in enumerate(parts) if part["field"] in fields and part["watermark"] is None
+    ]
+    if missing:
+        sg_data_list = sg.find(
+            entity_type,
+            common_filters + [_get_link_filter([parts[i] for i in missing])],
+            fields,
+            order
+        )
+        for i in missing:
+            results[i] = {"sg": [sg_data for sg_data in sg_data_list if _is_linked(sg_data, parts[i])]}
+
+    cached = [
+        i for (i, part) in enumerate(parts) if part["field"] in fields and part["watermark"] is not None
+    ]
+    if cached:
+        # each part only fetches what changed since its own high-water mark,
+        # parts sharing the same high-water mark share the same filter.
+        groups = {}
+        for i in cached:
+            watermark = parts[i]["watermark"]
+            groups.setdefault((watermark["updated_at"], watermark["id"]), []).append(parts[i])
+        changes_filters = [
+            {
+                "filter_operator": "all",
+                "filters": [
+                    _get_link_filter(group),
+                    get_changes_filter(group[0]["watermark"], CHANGES_OVERLAP)
+                ]
+            }
+            for (_, group) in sorted(groups.items())
+        ]
+        if len(changes_filters) == 1:
+            changes_filter = changes_filters[0]
+        else:
+            changes_filter = {"filter_operator": "any", "filters": changes_filters}
+
+        known_ids = set()
+        for i in cached:
+            known_ids.update(parts[i]["known_ids"])
+
+        changes = _fetch_changes(
+            sg,
+            entity_type,
+            common_filters + [_get_link_filter([parts[i] for i in cached])],
+            changes_filter,
+            fields,
+            order,
+            known_ids
+        )
+
+        all_removed_ids = set(changes["removed_ids"])
+        all_updated_ids = set([sg_data["id"] for sg_data in changes["updated"]])
+        for i in cached:
+            updated = [sg_data for sg_data in changes["updated"] if _is_linked(sg_data, parts[i])]
+            updated_ids = set([sg_data["id"] for sg_data in updated])
+            # records which are now linked to another entity are removed from this part
+            removed_ids = [
+                x for x in parts[i]["known_ids"]
+                if x in all_removed_ids or (x in all_updated_ids and x not in updated_ids)
+            ]
+            results[i] = {"changes": {"updated": updated, "removed_ids": removed_ids}}
+
+    return results
+
+
+def merge_changes(sg_data_list, changes, sort_field=None):
+    """
+    Merges changes retrieved with :meth:`fetch_changes` or :meth:`fetch_records`
+    into a list of records.
+
+    :param sg_data_list: List of Shotgun dictionaries.
+    :param changes: Changes as returned by :meth:`fetch_changes`.
+    :param sort_field: Optional field to sort the resulting list by.
+    :returns: New list of Shotgun dictionaries.
+    """
+    updated_by_id = dict((sg_data["id"], sg_data) for sg_data in changes["updated"])
+    removed_ids = set(changes["removed_ids"])
+
+    merged = []
+    for sg_data in sg_data_list:
+        if sg_data["id"] in removed_ids:
+            continue
+        merged.append(updated_by_id.pop(sg_data["id"], sg_data))
+
+    # whatever remains are new records. Keep the order they were returned in.
+    merged.extend([sg_data for sg_data in changes["updated"] if sg_data["id"] in updated_by_id])
+
+    if sort_field:
+        # the list is mostly sorted already, so this is cheap.
+        merged.sort(key=lambda sg_data: sg_data.get(sort_field))
+
+    return merged
+
+
+def _get_link_filter(parts):
+    """
+    Returns a Shotgun filter matching the records linked to any of the entities of
+    a list of parts, as passed to :meth:`fetch_parts`.
+
+    :param parts: List of part dictionaries.
+    :returns: Shotgun filter.
+    """
+    values_by_field = {}
+    for part in parts:
+        values_by_field.setdefault(part["field"], []).append(part["value"])
+
+    filters = [[field, "in", values] for (field, values) in sorted(values_by_field.items())]
+    if len(filters) == 1:
+        return filters[0]
+    return {"filter_operator": "any", "filters": filters}
+
+
+def _is_linked(sg_data, part):
+    """
+    Checks if a record belongs to a part, as passed to :meth:`fetch_parts`.
+
+    :param sg_data: Shotgun dictionary.
+    :param part: Part dictionary.
+    :returns: True if the record is linked to the entity of the part.
+    """
+    link = sg_data.get(part["field"])
+    return bool(link) and link.get("type") == part["value"]["type"] and link.get("id") == part["value"]["id"]
+
+
+def _get_id_summary(sg, entity_type, filters):
+    """
+    Returns the number of records matching a query and the sum of their ids,
+    with a single request.
+
+    :param sg: Shotgun API instance.
+    :param entity_type: Shotgun entity type of the query.
+    :param filters: Shotgun filters of the query.
+    :returns: Tuple with the number of records and the sum of their ids.
+    """
+    # summaries are keyed by field, so the records are counted on another
+    # field than the one the ids are summed on.
+    result = sg.summarize(
+        entity_type,
+        filters,
+        [{"field": "created_at", "type": "record_count"}, {"field": "id", "type": "sum"}]
+    )
+    return (result["summaries"]["created_at"], result["summaries"]["id"] or 0)
+
+
+def _to_unix_time(value):
+    """
+    Converts a Shotgun time stamp to a unix time stamp.
+
+    :param value: A datetime, as returned by the Shotgun API, or a unix time stamp,
+                  as stored in the model caches.
+    :returns: Unix time stamp or None.
+    """
+    if isinstance(value, datetime.datetime):
+        return time.mktime(value.timetuple())
+    return value
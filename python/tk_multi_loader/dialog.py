@@ -15,7 +15,8 @@ from sgtk.platform.qt import QtCore, QtGui
 
 from .model_hierarchy import SgHierarchyModel
 from .model_entity import SgEntityModel
-from .model_latestpublish import SgLatestPublishModel
+from .model_latestpublish import SgLatestPublishModel, get_publish_filters
+from .model_flatpublish import SgFlatPublishModel
 from .model_publishtype import SgPublishTypeModel
 from .model_status import SgStatusModel
 from .proxymodel_latestpublish import SgLatestPublishProxyModel
@@ -27,9 +28,22 @@ from .delegate_publish_history import SgPublishHistoryDelegate
 from .search_widget import SearchWidget
 from .banner import Banner
 from .loader_action_manager import LoaderActionManager
+from .event_watcher import EventLogWatcher, ShotgunEventSource
 
 from . import constants
 from . import model_item_data
+from . import utils
+from . import site_cache
+from . import cache_manager
+from . import dialog_pool
+from . import navigation_snapshots
+from . import single_flight
+from . import tracing
+from . import memory_diagnostics
+from .prefetch import PublishPrefetcher
+from .availability import AvailabilityChecker
+from .facet_menu import FacetFilterMenu
+from .metrics_panel import MetricsPanel, MetricsDumper
 
 from .ui.dialog import Ui_Dialog
 
@@ -76,8 +90,10 @@ class AppDialog(QtGui.QWidget):
         # We will support the banners only for the default loader.
         if isinstance(action_manager, LoaderActionManager):
             self._action_banner = Banner(self)
+            self._action_banner.linkActivated.connect(self._on_action_banner_link_activated)
             self._action_manager.pre_execute_action.connect(self._pre_execute_action)
             self._action_manager.post_execute_action.connect(lambda _: self._action_banner.hide_banner())
+            self._action_manager.prepare_progress.connect(self._on_action_prepare_progress)
 
         # create a settings manager where we can pull and push prefs later
         # prefs in this manager are shared
@@ -90,6 +106,14 @@ class AppDialog(QtGui.QWidget):
 
         shotgun_globals.register_bg_task_manager(self._task_manager)
 
+        # prepare the actions in the background before running them
+        if isinstance(action_manager, LoaderActionManager):
+            self._action_manager.set_bg_task_manager(self._task_manager)
+
+        # pick up any newer caches from the shared site cache
+        # before the models load their own caches
+        site_cache.seed_user_cache(sgtk.platform.current_bundle())
+
         # set up the UI
         self.ui = Ui_Dialog()
         self.ui.setupUi(self)
@@ -115,6 +139,8 @@ class AppDialog(QtGui.QWidget):
 
         self._details_action_menu = QtGui.QMenu()
         self.ui.detail_actions_btn.setMenu(self._details_action_menu)
+        # actions of the publish displayed in the details pane
+        self._details_actions = []
 
         self.ui.info.clicked.connect(self._toggle_details_pane)
 
@@ -181,9 +207,38 @@ class AppDialog(QtGui.QWidget):
 
         #################################################
         # setup publish model
-        self._publish_model = SgLatestPublishModel(self,
-                                                   self._publish_type_model,
-                                                   self._task_manager)
+        app = sgtk.platform.current_bundle()
+        if app.get_setting("flat_publish_model"):
+            publish_model_class = SgFlatPublishModel
+        else:
+            publish_model_class = SgLatestPublishModel
+        self._publish_model = publish_model_class(self,
+                                                  self._publish_type_model,
+                                                  self._task_manager)
+        # the tree view selection currently loaded in the publish model
+        self._current_publish_query = None
+        # snapshots of the publish view for recently displayed selections
+        self._navigation_snapshots = navigation_snapshots.NavigationSnapshotCache()
+
+        # warms the publish cache for the selections likely to come next
+        self._prefetcher = None
+        if publish_model_class is SgFlatPublishModel and (app.get_setting("prefetch") or {}).get("enabled", True):
+            self._prefetcher = PublishPrefetcher(self, self._publish_model, self._task_manager)
+
+        #################################################
+        # optionally watch the event log for publishes created
+        # or changed by others while the dialog is open
+        self._event_watcher = None
+        if app.get_setting("live_updates"):
+            publish_entity_type = sgtk.util.get_published_file_entity_type(app.sgtk)
+            event_source = ShotgunEventSource(publish_entity_type, app.context.project)
+            self._event_watcher = EventLogWatcher(self,
+                                                  self._task_manager,
+                                                  event_source,
+                                                  app.get_setting("live_updates_interval"))
+            self._event_watcher.publishes_changed.connect(self._publish_model.apply_publish_changes)
+            self._event_watcher.publishes_changed.connect(self._publish_history_model.apply_publish_changes)
+            self._event_watcher.start()
 
         self._publish_main_overlay = ShotgunModelOverlayWidget(self._publish_model,
                                                                self.ui.publish_view)
@@ -206,6 +261,14 @@ class AppDialog(QtGui.QWidget):
 
         self._publish_list_delegate = SgPublishListDelegate(self.ui.publish_view, self._action_manager)
 
+        # optionally flag the publishes whose files are not on disk
+        self._availability_checker = None
+        if (app.get_setting("availability_badges") or {}).get("enabled"):
+            self._availability_checker = AvailabilityChecker(self,
+                                                             self.ui.publish_view,
+                                                             self._publish_proxy_model,
+                                                             self._task_manager)
+
         # recall which the most recently mode used was and set that
         main_view_mode = self._settings_manager.retrieve("main_view_mode", self.MAIN_VIEW_THUMB)
         self._set_main_view_mode(main_view_mode)
@@ -247,6 +310,19 @@ class AppDialog(QtGui.QWidget):
         # hook it up so that it signals the publish proxy model whenever the filter changes
         self._search_widget.filter_changed.connect(self._publish_proxy_model.set_search_query)
 
+        # facet filters, next to the search button
+        self._facet_button = QtGui.QToolButton(self)
+        self._facet_button.setMinimumSize(QtCore.QSize(0, 26))
+        self._facet_button.setText("Filter")
+        self._facet_button.setToolTip("Filter the publishes by status, author, task or link")
+        layout = self.ui.horizontalLayout_2
+        layout.insertWidget(layout.indexOf(self.ui.search_publishes), self._facet_button)
+        self._facet_menu = FacetFilterMenu(self,
+                                           self._facet_button,
+                                           self._publish_model,
+                                           self._publish_proxy_model,
+                                           self._status_model)
+
         #################################################
         # checkboxes, buttons etc
         self.ui.show_sub_items.toggled.connect(self._on_show_subitems_toggled)
@@ -290,6 +366,38 @@ class AppDialog(QtGui.QWidget):
         self._reload_action.triggered.connect(self._on_reload_action)
         self.ui.cog_button.addAction(self._reload_action)
 
+        self._record_trace_action = QtGui.QAction("Record Performance Trace", self)
+        self._record_trace_action.setCheckable(True)
+        self._record_trace_action.setChecked(tracing.is_enabled())
+        self._record_trace_action.toggled.connect(self._on_record_trace_toggled)
+        self.ui.cog_button.addAction(self._record_trace_action)
+
+        self._save_trace_action = QtGui.QAction("Save Performance Trace...", self)
+        self._save_trace_action.triggered.connect(self._on_save_trace_action)
+        self.ui.cog_button.addAction(self._save_trace_action)
+
+        self._metrics_action = QtGui.QAction("Show Performance Metrics", self)
+        self._metrics_action.triggered.connect(self._on_metrics_action)
+        self.ui.cog_button.addAction(self._metrics_action)
+        self._metrics_panel = None
+
+        # optionally dump the metrics periodically to compare workstations and releases
+        self._metrics_dumper = None
+        metrics_dump_interval = (app.get_setting("metrics_dump") or {}).get("interval")
+        if metrics_dump_interval:
+            self._metrics_dumper = MetricsDumper(self, metrics_dump_interval)
+
+        # optionally report how memory grows over the session
+        self._memory_monitor = None
+        memory_settings = app.get_setting("memory_diagnostics") or {}
+        if memory_settings.get("enabled"):
+            self._memory_monitor = memory_diagnostics.MemoryMonitor(self,
+                                                                    self.get_memory_report,
+                                                                    memory_settings.get("interval", 300))
+            self._memory_report_action = QtGui.QAction("Show Memory Report", self)
+            self._memory_report_action.triggered.connect(self._on_memory_report_action)
+            self.ui.cog_button.addAction(self._memory_report_action)
+
         #################################################
         # set up preset tabs and load and init tree views
         self._entity_presets = {}
@@ -304,6 +412,14 @@ class AppDialog(QtGui.QWidget):
         # trigger an initial evaluation of filter proxy model
         self._apply_type_filters_on_publishes()
 
+        # evict cache files exceeding the quotas in the background, except
+        # the ones of the queries currently loaded.
+        self._task_manager.add_task(cache_manager.get_cache_manager().collect_garbage,
+                                    task_kwargs={"keep_paths": self._get_cache_paths()})
+
+        # start warming the cache once the loader is idle
+        self._prefetch_likely_selections()
+
     def _show_publish_actions(self, pos):
         """
         Shows the actions for the current publish selection.
@@ -325,6 +441,9 @@ class AppDialog(QtGui.QWidget):
         # Wait for the user to pick something.
         menu.exec_(self.ui.publish_view.mapToGlobal(pos))
 
+        # the menu is parented to the dialog, don't keep one per right click
+        menu.deleteLater()
+
     @property
     def selected_publishes(self):
         """
@@ -363,14 +482,11 @@ class AppDialog(QtGui.QWidget):
                 # underlying model
                 source_index = proxy_index.model().mapToSource(proxy_index)
 
-                # now we have arrived at our model derived from StandardItemModel
-                # so let's retrieve the standarditem object associated with the index
-                item = source_index.model().itemFromIndex(source_index)
-
-                sg_data = item.get_sg_data()
-
-                sg_data = item.get_sg_data()
-                if sg_data and not item.data(SgLatestPublishModel.IS_FOLDER_ROLE):
+                # work with the index rather than the item so that both
+                # the standard item and the flat publish models are supported
+                sg_data = shotgun_model.get_sg_data(source_index)
+                is_folder = shotgun_model.get_sanitized_data(source_index, SgLatestPublishModel.IS_FOLDER_ROLE)
+                if sg_data and not is_folder:
                     sg_data_list.append(sg_data)
 
         return sg_data_list
@@ -380,7 +496,15 @@ class AppDialog(QtGui.QWidget):
         Executed when the main dialog is closed.
         All worker threads and other things which need a proper shutdown
         need to be called here.
+
+        Pooled dialogs are only hidden, and are reused by the next invocation.
         """
+        if dialog_pool.release(self):
+            self._suspend()
+            self.window().hide()
+            event.ignore()
+            return
+
         # display exit splash screen
         splash_pix = QtGui.QPixmap(":/res/exit_splash.png")
         splash = QtGui.QSplashScreen(splash_pix, QtCore.Qt.WindowStaysOnTopHint)
@@ -405,6 +529,50 @@ class AppDialog(QtGui.QWidget):
                 self._entity_presets[p].view.selectionModel().selectionChanged.disconnect(
                     self._on_treeview_item_selected)
 
+            # stop polling for events
+            if self._event_watcher:
+                self._event_watcher.stop()
+
+            # cancel any prefetching
+            if self._prefetcher:
+                self._prefetcher.destroy()
+
+            # stop checking files on disk
+            if self._availability_checker:
+                self._availability_checker.destroy()
+
+            # stop indexing publishes for the facet filters
+            self._facet_menu.destroy()
+
+            # dump the metrics of the session a last time
+            if self._metrics_dumper:
+                self._metrics_dumper.destroy()
+
+            # stop reporting memory usage
+            if self._memory_monitor:
+                self._memory_monitor.destroy()
+
+            # remember which cache files were used
+            cache_manager.get_cache_manager().save()
+
+            # release the rows held for back and forward navigation
+            self._navigation_snapshots.clear()
+
+            (requests, coalesced) = single_flight.get_coalescing_stats()
+            app = sgtk.platform.current_bundle()
+            app.log_debug("%d of %d Shotgun requests were coalesced with identical ones in flight."
+                          % (coalesced, requests))
+
+            # stop the models, releasing the requests they share with other models
+            self._publish_model.destroy()
+            self._publish_history_model.destroy()
+            for p in self._entity_presets:
+                self._entity_presets[p].model.destroy()
+
+            # drop the actions being prepared
+            if isinstance(self._action_manager, LoaderActionManager):
+                self._action_manager.set_bg_task_manager(None)
+
             # gracefully close all connections
             shotgun_globals.unregister_bg_task_manager(self._task_manager)
             self._task_manager.shut_down()
@@ -419,6 +587,44 @@ class AppDialog(QtGui.QWidget):
         # okay to close dialog
         event.accept()
 
+    def reuse(self):
+        """
+        Prepares a pooled dialog to be displayed again. The view state is reset
+        as if the dialog was just created and the data is revalidated in the
+        background.
+        """
+        # reset the view state
+        self.ui.publish_view.selectionModel().clear()
+        self.ui.history_view.selectionModel().clear()
+        if self.ui.search_publishes.isChecked():
+            self.ui.search_publishes.setChecked(False)
+            self._on_publish_filter_clicked()
+        self._setup_details_panel([])
+
+        # pick up publishes changed while the dialog was hidden
+        if self._event_watcher:
+            self._event_watcher.start()
+
+        # revalidate the entity tabs, then select the home item, which
+        # loads the publishes displayed for it.
+        for preset in self._entity_presets.values():
+            if isinstance(preset.model, SgEntityModel):
+                preset.model.async_refresh_if_stale()
+        self._on_home_clicked()
+
+    def _suspend(self):
+        """
+        Stops background activity while a pooled dialog is hidden.
+        """
+        if self._event_watcher:
+            self._event_watcher.stop()
+        if self._prefetcher:
+            self._prefetcher.cancel()
+        if isinstance(self._action_manager, LoaderActionManager):
+            self._action_manager.cancel_pending_actions()
+        self._navigation_snapshots.clear()
+        cache_manager.get_cache_manager().save()
+
     def is_first_launch(self):
         """
         Returns true if this is the first time UI is being launched
@@ -613,25 +819,26 @@ class AppDialog(QtGui.QWidget):
             proxy_model = model_index.model()
             source_index = proxy_model.mapToSource(model_index)
 
-            # now we have arrived at our model derived from StandardItemModel
-            # so let's retrieve the standarditem object associated with the index
-            item = source_index.model().itemFromIndex(source_index)
-
             # render out details
-            thumb_pixmap = item.icon().pixmap(512)
+            icon = shotgun_model.get_sanitized_data(source_index, QtCore.Qt.DecorationRole)
+            if icon:
+                thumb_pixmap = icon.pixmap(512)
+            else:
+                thumb_pixmap = QtGui.QPixmap()
             self.ui.details_image.setPixmap(thumb_pixmap)
 
-            sg_data = item.get_sg_data()
+            sg_data = shotgun_model.get_sg_data(source_index)
 
             if sg_data is None:
                 # an item which doesn't have any sg data directly associated
                 # typically an item higher up the tree
                 # just use the default text
-                folder_name = __make_table_row("Name", item.text())
+                item_text = shotgun_model.get_sanitized_data(source_index, QtCore.Qt.DisplayRole)
+                folder_name = __make_table_row("Name", item_text)
                 self.ui.details_header.setText("<table>%s</table>" % folder_name)
                 __set_publish_ui_visibility(False)
 
-            elif item.data(SgLatestPublishModel.IS_FOLDER_ROLE):
+            elif shotgun_model.get_sanitized_data(source_index, SgLatestPublishModel.IS_FOLDER_ROLE):
                 # folder with sg data - basically a leaf node in the entity tree
 
                 status_code = sg_data.get("sg_status_list")
@@ -664,7 +871,7 @@ class AppDialog(QtGui.QWidget):
                 # this is a publish!
                 __set_publish_ui_visibility(True)
 
-                sg_item = item.get_sg_data()
+                sg_item = sg_data
 
                 # sort out the actions button
                 actions = self._action_manager.get_actions_for_publish(sg_item, self._action_manager.UI_AREA_DETAILS)
@@ -673,8 +880,9 @@ class AppDialog(QtGui.QWidget):
                 else:
                     self.ui.detail_playback_btn.setVisible(True)
                     self._details_action_menu.clear()
+                    # only keep the actions of the current publish alive
+                    self._details_actions = actions
                     for a in actions:
-                        self._dynamic_widgets.append(a)
                         self._details_action_menu.addAction(a)
 
                 # if there is an associated version, show the play button
@@ -696,7 +904,7 @@ class AppDialog(QtGui.QWidget):
                 else:
                     name_str = sg_item.get("name")
 
-                type_str = shotgun_model.get_sanitized_data(item, SgLatestPublishModel.PUBLISH_TYPE_NAME_ROLE)
+                type_str = shotgun_model.get_sanitized_data(source_index, SgLatestPublishModel.PUBLISH_TYPE_NAME_ROLE)
 
                 msg = ""
                 msg += __make_table_row("Name", name_str)
@@ -737,7 +945,6 @@ class AppDialog(QtGui.QWidget):
                 self.ui.details_header.setText("<table>%s</table>" % msg)
 
                 # tell details pane to load stuff
-                sg_data = item.get_sg_data()
                 self._publish_history_model.load_data(sg_data)
 
             self.ui.details_header.updateGeometry()
@@ -958,15 +1165,11 @@ class AppDialog(QtGui.QWidget):
         proxy_model = model_index.model()
         source_index = proxy_model.mapToSource(model_index)
 
-        # now we have arrived at our model derived from StandardItemModel
-        # so let's retrieve the standarditem object associated with the index
-        item = source_index.model().itemFromIndex(source_index)
-
-        is_folder = item.data(SgLatestPublishModel.IS_FOLDER_ROLE)
+        is_folder = shotgun_model.get_sanitized_data(source_index, SgLatestPublishModel.IS_FOLDER_ROLE)
 
         if is_folder:
             # get the corresponding tree view item
-            tree_view_item = self._publish_model.get_associated_tree_view_item(item)
+            tree_view_item = self._publish_model.get_associated_tree_view_item(source_index)
 
             # select it in the tree view
             self._select_item_in_entity_tree(self._current_entity_preset, tree_view_item)
@@ -988,6 +1191,68 @@ class AppDialog(QtGui.QWidget):
 
         :param action: The QAction that is being executed.
         """
+        if self._action_manager.has_pending_actions():
+            # the publishes are prepared in the background first, which
+            # can be cancelled until the hook runs.
+            self._action_banner.show_banner(self._get_action_prepare_message(action, "..."))
+        else:
+            self._action_banner.show_banner(self._get_action_banner_message(action))
+
+        # Force the window to be redrawn and process events right away since the
+        # hooks will be run right after this method returns, which wouldn't
+        # leave space for the event loop to update the UI.
+        self.window().repaint()
+        QtGui.QApplication.processEvents()
+
+    def _on_action_prepare_progress(self, action, prepared, total):
+        """
+        Called while an action is being prepared in the background.
+
+        :param action: The QAction that is being executed.
+        :param prepared: Number of publishes prepared.
+        :param total: Number of publishes the action is executed on.
+        """
+        if prepared < total:
+            self._action_banner.update_banner(
+                self._get_action_prepare_message(action, ": %d of %d publishes." % (prepared, total))
+            )
+        else:
+            self._action_banner.update_banner(self._get_action_banner_message(action))
+
+        # the hook may run right after this, without leaving space
+        # for the event loop to update the UI.
+        self._action_banner.repaint()
+
+    def _on_action_banner_link_activated(self, link):
+        """
+        Called when a link of the action banner is clicked.
+
+        :param link: The link that was clicked.
+        """
+        if link == "cancel":
+            self._action_manager.cancel_pending_actions()
+
+    def _get_action_prepare_message(self, action, progress):
+        """
+        Returns the message shown while an action is being prepared, with a
+        link to cancel it.
+
+        :param action: The QAction that is being executed.
+        :param progress: Text describing the progress of the preparation.
+        :returns: The message for the banner.
+        """
+        return (
+            "<center>Preparing <b>%s</b>%s "
+            "<a href='cancel' style='color: white'>Cancel</a></center>" % (action.text(), progress)
+        )
+
+    def _get_action_banner_message(self, action):
+        """
+        Returns the message displayed in the banner when an action is executed.
+
+        :param action: The QAction that is being executed.
+        :returns: Html message.
+        """
         data = action.data()
 
         # If there is a single item, we'll put its name in the banner.
@@ -997,22 +1262,12 @@ class AppDialog(QtGui.QWidget):
             version_number = sg_data.get("version_number")
             vers_str = "%03d" % version_number if version_number is not None else "N/A"
 
-            self._action_banner.show_banner(
-                "<center>Action <b>%s</b> launched on <b>%s Version %s</b></center>" % (
-                    action.text(), name_str, vers_str
-                )
-            )
-        else:
-            # Otherwise we'll simply mention the selection.
-            self._action_banner.show_banner(
-                "<center>Action <b>%s</b> launched on selection.</center>" % (action.text(),)
+            return "<center>Action <b>%s</b> launched on <b>%s Version %s</b></center>" % (
+                action.text(), name_str, vers_str
             )
 
-        # Force the window to be redrawn and process events right away since the
-        # hooks will be run right after this method returns, which wouldn't
-        # leave space for the event loop to update the UI.
-        self.window().repaint()
-        QtGui.QApplication.processEvents()
+        # Otherwise we'll simply mention the selection.
+        return "<center>Action <b>%s</b> launched on selection.</center>" % (action.text(),)
 
     def show_help_popup(self):
         """
@@ -1044,6 +1299,94 @@ class AppDialog(QtGui.QWidget):
         for p in self._entity_presets:
             self._entity_presets[p].model.hard_refresh()
 
+    def get_memory_report(self):
+        """
+        Takes a memory report of the models of the dialog and of the objects
+        it retains, see :meth:`memory_diagnostics.get_report`.
+
+        :returns: Report dictionary.
+        """
+        models = [
+            ("Publishes", self._publish_model),
+            ("Publish History", self._publish_history_model),
+            ("Publish Types", self._publish_type_model),
+            ("Statuses", self._status_model),
+        ]
+        for (name, preset) in sorted(self._entity_presets.items()):
+            models.append(("Entities: %s" % name, preset.model))
+
+        retained = {
+            "dynamic widgets": len(self._dynamic_widgets),
+            "details actions": len(self._details_actions),
+            "history": len(self._history),
+        }
+        return memory_diagnostics.get_report(models, retained)
+
+    def _get_cache_paths(self):
+        """
+        Returns the paths of the cache files used by the models for their
+        current queries.
+
+        :returns: List of paths.
+        """
+        models = [self._publish_model, self._publish_history_model, self._publish_type_model, self._status_model]
+        models.extend(preset.model for preset in self._entity_presets.values())
+
+        paths = []
+        for model in models:
+            paths.extend(cache_manager.get_model_cache_paths(model))
+        return paths
+
+    def _on_memory_report_action(self):
+        """
+        Shows a memory report, with the growth since the first one.
+        """
+        report_text = self._memory_monitor.get_report_text()
+        self._bundle.log_debug("Memory report:\n%s" % report_text)
+        QtGui.QMessageBox.information(self, "Memory Report", report_text)
+
+    def _on_metrics_action(self):
+        """
+        Shows the performance metrics panel.
+        """
+        if self._metrics_panel is None:
+            self._metrics_panel = MetricsPanel(self)
+        self._metrics_panel.show()
+        self._metrics_panel.raise_()
+
+    def _on_record_trace_toggled(self, checked):
+        """
+        Starts or stops recording trace spans. Starting a recording
+        discards the spans previously recorded.
+
+        :param checked: True to start recording.
+        """
+        if checked:
+            tracing.clear()
+        tracing.set_enabled(checked)
+
+    def _on_save_trace_action(self):
+        """
+        Saves the trace spans recorded in the Chrome trace event format.
+        """
+        path = QtGui.QFileDialog.getSaveFileName(self,
+                                                 "Save Performance Trace",
+                                                 "loader_trace.json",
+                                                 "Trace Files (*.json)")
+        # PySide returns the selected filter too
+        if isinstance(path, tuple):
+            path = path[0]
+        if not path:
+            return
+
+        app = sgtk.platform.current_bundle()
+        try:
+            count = tracing.export(path)
+        except (IOError, OSError) as e:
+            app.log_error("Could not save the performance trace to %s: %s" % (path, e))
+            return
+        app.log_info("Saved %d trace events to %s." % (count, path))
+
     ########################################################################################
     # entity listing tree view and presets toolbar
 
@@ -1564,27 +1907,7 @@ class AppDialog(QtGui.QWidget):
         """
 
         # Resolve any magic tokens in the filters.
-        resolved_filters = []
-        for filter in setting_dict["filters"]:
-            resolved_filter = []
-            for field in filter:
-                if field == "{context.entity}":
-                    field = app.context.entity
-                elif field == "{context.project}":
-                    field = app.context.project
-                elif field == "{context.project.id}":
-                    if app.context.project:
-                        field = app.context.project.get("id")
-                    else:
-                        field = None
-                elif field == "{context.step}":
-                    field = app.context.step
-                elif field == "{context.task}":
-                    field = app.context.task
-                elif field == "{context.user}":
-                    field = app.context.user
-                resolved_filter.append(field)
-            resolved_filters.append(resolved_filter)
+        resolved_filters = utils.resolve_filters(app, setting_dict["filters"])
         setting_dict["filters"] = resolved_filters
 
         # Construct the query model.
@@ -1664,7 +1987,7 @@ class AppDialog(QtGui.QWidget):
             # SgHierarchyModel does not yet support this kind of functionality.
             model = self._entity_presets[self._current_entity_preset].model
             if isinstance(model, SgEntityModel):
-                model.async_refresh()
+                model.async_refresh_if_stale()
 
         if track_in_history:
             # figure out what is selected
@@ -1717,16 +2040,82 @@ class AppDialog(QtGui.QWidget):
         # tell publish UI to update itself
         self._load_publishes_for_entity_items(selected_items)
 
+        # the siblings of the selection are likely to be looked at next
+        self._prefetch_likely_selections()
+
+    def _prefetch_likely_selections(self):
+        """
+        Asks the prefetcher to warm the publish cache for the selections
+        users are likely to make next: the context entity, their tasks
+        and the siblings of the selected entity.
+        """
+        if self._prefetcher is None:
+            return
+
+        sg_filters_list = []
+
+        def add_item(item, preset):
+            (sg_filters, _) = get_publish_filters([item], [], False, preset.publish_filters)
+            if sg_filters and sg_filters not in sg_filters_list:
+                sg_filters_list.append(sg_filters)
+
+        # the context entity
+        ctx = sgtk.platform.current_bundle().context
+        if ctx.entity:
+            for preset in self._entity_presets.values():
+                if isinstance(preset.model, SgEntityModel) and preset.entity_type == ctx.entity["type"]:
+                    item = preset.model.item_from_entity(ctx.entity["type"], ctx.entity["id"])
+                    if item is not None:
+                        add_item(item, preset)
+                        break
+
+        # the first tasks of the task tabs, e.g. My Tasks
+        for preset in self._entity_presets.values():
+            if isinstance(preset.model, SgEntityModel) and preset.entity_type == "Task":
+                task_items = self._get_leaf_items(preset.model.invisibleRootItem(), self._prefetcher.max_tasks)
+                for item in task_items:
+                    add_item(item, preset)
+
+        # the siblings of the selected entity
+        if self._current_entity_preset in self._entity_presets:
+            preset = self._entity_presets[self._current_entity_preset]
+            selected_item = self._get_selected_entity()
+            if selected_item is not None:
+                parent_item = selected_item.parent() or preset.model.invisibleRootItem()
+                siblings = [
+                    parent_item.child(row)
+                    for row in range(parent_item.rowCount())
+                    if parent_item.child(row) is not selected_item
+                ]
+                for item in siblings[:self._prefetcher.max_siblings]:
+                    add_item(item, preset)
+
+        self._prefetcher.prefetch(sg_filters_list)
+
+    def _get_leaf_items(self, parent_item, max_items):
+        """
+        Returns the first leaf items found under an item of an entity model.
+
+        :param parent_item: Item to look under.
+        :param max_items: Maximum number of items to return.
+        :returns: List of items, in the order they are displayed.
+        """
+        leaf_items = []
+        for row in range(parent_item.rowCount()):
+            if len(leaf_items) >= max_items:
+                break
+            item = parent_item.child(row)
+            if item.hasChildren():
+                leaf_items.extend(self._get_leaf_items(item, max_items - len(leaf_items)))
+            else:
+                leaf_items.append(item)
+        return leaf_items
+
     def _load_publishes_for_entity_item(self, item):
         """
         Given an item from the treeview, or None if no item
         is selected, prepare the publish area UI.
         """
-        # clear selection. If we don't clear the model at this point,
-        # the selection model will attempt to pair up with the model is
-        # data is being loaded in, resulting in many many events
-        self.ui.publish_view.selectionModel().clear()
-
         # Determine the child folders.
         child_folders = []
         proxy_model = self._entity_presets[self._current_entity_preset].proxy_model
@@ -1791,18 +2180,13 @@ class AppDialog(QtGui.QWidget):
 
         # now finally load up the data in the publish model
         publish_filters = self._entity_presets[self._current_entity_preset].publish_filters
-        self._publish_model.load_data(item, child_folders, show_sub_items, publish_filters)
+        self._load_publish_model([item], child_folders, show_sub_items, publish_filters)
 
     def _load_publishes_for_entity_items(self, items):
         """
         Given an item from the treeview, or None if no item
         is selected, prepare the publish area UI.
         """
-        # clear selection. If we don't clear the model at this point,
-        # the selection model will attempt to pair up with the model is
-        # data is being loaded in, resulting in many many events
-        self.ui.publish_view.selectionModel().clear()
-
         # Determine the child folders.
         child_folders = []
         proxy_model = self._entity_presets[self._current_entity_preset].proxy_model
@@ -1869,8 +2253,95 @@ class AppDialog(QtGui.QWidget):
             # now finally load up the data in the publish model
             publish_filters = self._entity_presets[self._current_entity_preset].publish_filters
 
+        self._load_publish_model(items, child_folders, show_sub_items, publish_filters)
+
+    def _load_publish_model(self, items, child_folders, show_sub_items, publish_filters):
+        """
+        Loads the publishes for the given tree view selection into the publish model.
+
+        If the same query is already loaded, the model refreshes its rows in place
+        and the current selection in the publish view is kept. When navigating
+        back or forward to a recently displayed selection, its snapshot is
+        restored instead and revalidated in the background.
+
+        :param items: List of selected tree view items, None if nothing is selected.
+        :param child_folders: List of tree view items to display as folders.
+        :param show_sub_items: Indicates whether or not to use the sub items mode.
+        :param publish_filters: List of additional shotgun filters for the publishes.
+        """
+        query = (items, child_folders, show_sub_items, publish_filters)
+        if not self._is_current_publish_query(query):
+            self._store_navigation_snapshot()
+            # clear selection. If we don't clear the model at this point,
+            # the selection model will attempt to pair up with the model is
+            # data is being loaded in, resulting in many many events
+            self.ui.publish_view.selectionModel().clear()
+            self._current_publish_query = query
+            if self._history_navigation_mode and self._restore_navigation_snapshot(query):
+                return
+        self._current_publish_query = query
+
         self._publish_model.load_data(items, child_folders, show_sub_items, publish_filters)
 
+    def _is_current_publish_query(self, query):
+        """
+        Checks whether a publish query is the one currently loaded.
+
+        :param query: Tuple with the selected items, child folders, sub items mode
+                      and publish filters.
+        :returns: True if it is the current query, False otherwise.
+        """
+        if self._current_publish_query is None:
+            return False
+        return navigation_snapshots.is_same_publish_query(query, self._current_publish_query)
+
+    def _store_navigation_snapshot(self):
+        """
+        Stores a snapshot of the publish view for the current query, so that
+        it can be restored instantly when navigating back to it.
+        """
+        if self._current_publish_query is None or not isinstance(self._publish_model, SgFlatPublishModel):
+            return
+
+        model_snapshot = self._publish_model.take_snapshot()
+        if model_snapshot is None:
+            return
+
+        selected_rows = [
+            self._publish_proxy_model.mapToSource(idx).row()
+            for idx in self.ui.publish_view.selectionModel().selectedIndexes()
+        ]
+        scroll_position = self.ui.publish_view.verticalScrollBar().value()
+        self._navigation_snapshots.store(
+            self._current_publish_query,
+            navigation_snapshots.NavigationSnapshot(model_snapshot, selected_rows, scroll_position)
+        )
+
+    def _restore_navigation_snapshot(self, query):
+        """
+        Restores the snapshot of the publish view stored for a query, if any.
+
+        :param query: Tuple with the selected items, child folders, sub items mode
+                      and publish filters.
+        :returns: True if a snapshot was restored, False otherwise.
+        """
+        snapshot = self._navigation_snapshots.take(query)
+        if snapshot is None:
+            return False
+
+        self._publish_model.restore_snapshot(snapshot.model_snapshot)
+
+        selection_model = self.ui.publish_view.selectionModel()
+        for row in snapshot.selected_rows:
+            idx = self._publish_proxy_model.mapFromSource(self._publish_model.index(row, 0))
+            if idx.isValid():
+                selection_model.select(idx, QtGui.QItemSelectionModel.Select)
+
+        # the view lays its items out lazily, so wait for it before scrolling
+        scroll_bar = self.ui.publish_view.verticalScrollBar()
+        QtCore.QTimer.singleShot(0, lambda: scroll_bar.setValue(snapshot.scroll_position))
+        return True
+
     def _populate_entity_breadcrumbs(self, selected_item):
         """
         Computes the current entity breadcrumbs
@@ -0,0 +1,159 @@
+# Copyright (c) 2015 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Pool keeping the main loader dialog alive between invocations.
+
+When a pooled dialog is closed, it is hidden rather than destroyed, together
+with its models and its background task manager. Showing the loader again
+reuses it, only resetting the view state and revalidating the data in the
+background. A hidden dialog is destroyed after the idle timeout set in the
+dialog_pool setting, or straight away if the process uses more memory than
+the cap set in the same setting.
+"""
+
+import os
+
+import sgtk
+from sgtk.platform.qt import QtCore
+
+# settings used when not configured
+DEFAULT_ENABLED = False
+DEFAULT_MAX_MEMORY_MB = 2048
+DEFAULT_IDLE_TIMEOUT = 1800
+
+# dialogs managed by the pool, keyed by app instance name
+_dialogs = {}
+# hidden dialogs, keyed by app instance name, with their idle timer
+_hidden = {}
+
+
+def is_enabled(app):
+    """
+    Checks whether the dialog pool is enabled for an app.
+
+    :param app: The app instance.
+    :returns: True if dialogs should be pooled, False otherwise.
+    """
+    return (app.get_setting("dialog_pool") or {}).get("enabled", DEFAULT_ENABLED)
+
+
+def adopt(app, dialog):
+    """
+    Puts a newly created dialog under the management of the pool, so that
+    it is kept when it is closed.
+
+    :param app: The app instance.
+    :param dialog: :class:`AppDialog` instance.
+    """
+    _dialogs[app.instance_name] = dialog
+
+
+def acquire(app):
+    """
+    Returns the hidden dialog for an app, if any. The dialog is then
+    shown again by the caller.
+
+    :param app: The app instance.
+    :returns: :class:`AppDialog` instance or None.
+    """
+    entry = _hidden.pop(app.instance_name, None)
+    if entry is None:
+        return None
+
+    (dialog, timer) = entry
+    timer.stop()
+    app.log_debug("Reusing pooled loader dialog.")
+    return dialog
+
+
+def release(dialog):
+    """
+    Called when a dialog is closed. Pooled dialogs are kept for the next
+    invocation, unless the memory cap is exceeded.
+
+    :param dialog: :class:`AppDialog` being closed.
+    :returns: True if the dialog was kept and should only be hidden,
+              False if it should be destroyed.
+    """
+    app = sgtk.platform.current_bundle()
+    if _dialogs.get(app.instance_name) is not dialog:
+        return False
+
+    settings = app.get_setting("dialog_pool") or {}
+    max_memory = settings.get("max_memory_mb", DEFAULT_MAX_MEMORY_MB) * 1024 * 1024
+    memory = get_memory_usage()
+    if memory is not None and memory > max_memory:
+        app.log_debug(
+            "Process uses %.1f MB, releasing pooled loader dialog." % (memory / (1024.0 * 1024.0))
+        )
+        del _dialogs[app.instance_name]
+        return False
+
+    timer = QtCore.QTimer()
+    timer.setSingleShot(True)
+    timer.setInterval(settings.get("idle_timeout", DEFAULT_IDLE_TIMEOUT) * 1000)
+    timer.timeout.connect(lambda: _discard(app.instance_name))
+    timer.start()
+    _hidden[app.instance_name] = (dialog, timer)
+    return True
+
+
+def clear():
+    """
+    Destroys all the dialogs managed by the pool, e.g. when the app is destroyed.
+    """
+    for instance_name in list(_dialogs.keys()):
+        _discard(instance_name)
+
+
+def _discard(instance_name):
+    """
+    Removes a dialog from the pool and destroys it if it is hidden.
+
+    :param instance_name: Instance name of the app the dialog belongs to.
+    """
+    _dialogs.pop(instance_name, None)
+    entry = _hidden.pop(instance_name, None)
+    if entry is None:
+        # dialog is being displayed, it will be destroyed when closed
+        return
+
+    (dialog, timer) = entry
+    timer.stop()
+    try:
+        # the dialog isn't managed by the pool anymore, so closing it
+        # shuts it down properly
+        dialog.window().close()
+    except RuntimeError:
+        # the underlying widget was already deleted, e.g. by the engine
+        pass
+
+
+def get_memory_usage():
+    """
+    Returns the memory used by the current process.
+
+    :returns: Resident set size in bytes or None if it can't be determined.
+    """
+    try:
+        import psutil
+    except ImportError:
+        psutil = None
+
+    if psutil:
+        return psutil.Process(os.getpid()).memory_info().rss
+
+    # fall back on procfs where available
+    try:
+        with open("/proc/self/statm", "r") as fh:
+            return int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except Exception:
+        return None
@@ -0,0 +1,330 @@
+# Copyright (c) 2015 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+import threading
+
+import sgtk
+from sgtk.platform.qt import QtCore
+
+shotgun_model = sgtk.platform.import_framework("tk-framework-shotgunutils", "shotgun_model")
+shotgun_data = sgtk.platform.import_framework("tk-framework-shotgunutils", "shotgun_data")
+
+
+class EventSource(object):
+    """
+    Base class for the sources of events polled by the :class:`EventLogWatcher`.
+    This base source has no events.
+
+    The methods are called from a background thread and get passed a Shotgun API
+    instance. Deriving classes which don't talk to Shotgun, e.g. :class:`FakeEventSource`,
+    can simply ignore it.
+
+    Events are dictionaries on the same form as Shotgun EventLogEntry records, the
+    watcher relies on the "id", "event_type", "entity" and "meta" keys.
+    """
+
+    def get_last_event_id(self, sg):
+        """
+        Returns the id of the most recent event, events older than this one are ignored.
+
+        :param sg: Shotgun API instance.
+        :returns: Event id or None if there are no events.
+        """
+        return None
+
+    def fetch_events(self, sg, since_id):
+        """
+        Returns the events following a given event.
+
+        :param sg: Shotgun API instance.
+        :param since_id: Id of the last event seen.
+        :returns: List of events, sorted by id.
+        """
+        return []
+
+
+class FakeEventSource(EventSource):
+    """
+    Source replaying scripted events, to test the watcher and the models
+    without an event log, e.g. against a mocked Shotgun::
+
+        source = FakeEventSource("PublishedFile")
+        source.add_event("New", publish_id)
+        source.add_event("Retirement", other_publish_id)
+    """
+
+    def __init__(self, publish_entity_type):
+        """
+        :param publish_entity_type: PublishedFile or TankPublishedFile.
+        """
+        self._publish_entity_type = publish_entity_type
+        self._events = []
+        # events are added from the main thread and read from a background thread
+        self._lock = threading.Lock()
+
+    def add_event(self, action, publish_id):
+        """
+        Adds an event, which is reported by the next poll.
+
+        :param action: New, Change, Retirement or Revival.
+        :param publish_id: Id of the publish the event is about.
+        :returns: The event dictionary.
+        """
+        with self._lock:
+            event = {
+                "id": len(self._events) + 1,
+                "event_type": "Shotgun_%s_%s" % (self._publish_entity_type, action),
+                "meta": {"entity_id": publish_id},
+            }
+            # retired entities are not linked to their events anymore
+            if action == "Retirement":
+                event["entity"] = None
+            else:
+                event["entity"] = {"type": self._publish_entity_type, "id": publish_id}
+            self._events.append(event)
+        return event
+
+    def get_last_event_id(self, sg):
+        """
+        Returns the id of the most recent event.
+
+        :param sg: Shotgun API instance, unused.
+        :returns: Event id or None if there are no events.
+        """
+        with self._lock:
+            return self._events[-1]["id"] if self._events else None
+
+    def fetch_events(self, sg, since_id):
+        """
+        Returns the events added after a given event.
+
+        :param sg: Shotgun API instance, unused.
+        :param since_id: Id of the last event seen.
+        :returns: List of events, sorted by id.
+        """
+        with self._lock:
+            return [dict(event) for event in self._events if event["id"] > since_id]
+
+
+class ShotgunEventSource(EventSource):
+    """
+    Polls the Shotgun EventLogEntry table for publish events.
+    """
+
+    # maximum number of events to retrieve in one go
+    MAX_EVENTS = 500
+
+    def __init__(self, publish_entity_type, project=None):
+        """
+        :param publish_entity_type: PublishedFile or TankPublishedFile.
+        :param project: Project entity dictionary to restrict events to, if any.
+        """
+        self._event_types = [
+            "Shotgun_%s_%s" % (publish_entity_type, action)
+            for action in ["New", "Change", "Retirement", "Revival"]
+        ]
+        self._project = project
+
+    def get_last_event_id(self, sg):
+        """
+        Returns the id of the most recent event.
+
+        :param sg: Shotgun API instance.
+        :returns: Event id or None if there are no events.
+        """
+        event = sg.find_one("EventLogEntry", [], ["id"], order=[{"field_name": "id", "direction": "desc"}])
+        return event["id"] if event else None
+
+    def fetch_events(self, sg, since_id):
+        """
+        Returns the publish events following a given event.
+
+        :param sg: Shotgun API instance.
+        :param since_id: Id of the last event seen.
+        :returns: List of events, sorted by id.
+        """
+        filters = [
+            ["id", "greater_than", since_id],
+            ["event_type", "in", self._event_types],
+        ]
+        if self._project:
+            filters.append(["project", "is", self._project])
+
+        return sg.find(
+            "EventLogEntry",
+            filters,
+            ["id", "event_type", "entity", "meta"],
+            order=[{"field_name": "id", "direction": "asc"}],
+            limit=self.MAX_EVENTS
+        )
+
+
+class EventLogWatcher(QtCore.QObject):
+    """
+    Periodically polls an event source in the background and reports
+    which publishes were created, changed or retired.
+    """
+
+    # emitted with the list of ids of the publishes which were created or changed
+    # and the list of ids of the publishes which were retired.
+    publishes_changed = QtCore.Signal(list, list)
+
+    def __init__(self, parent, bg_task_manager, event_source, interval):
+        """
+        :param parent: Parent QObject.
+        :param bg_task_manager: Background task manager to use to poll events.
+        :param event_source: :class:`EventSource` to poll.
+        :param interval: Number of seconds between two polls.
+        """
+        QtCore.QObject.__init__(self, parent)
+        self._bundle = sgtk.platform.current_bundle()
+
+        self._event_source = event_source
+        self._last_event_id = None
+        self._current_poll_uid = None
+
+        self._sg_data_retriever = shotgun_data.ShotgunDataRetriever(self, bg_task_manager=bg_task_manager)
+        self._sg_data_retriever.work_completed.connect(self._on_data_retriever_work_completed)
+        self._sg_data_retriever.work_failure.connect(self._on_data_retriever_work_failure)
+
+        self._timer = QtCore.QTimer(self)
+        self._timer.setInterval(interval * 1000)
+        self._timer.timeout.connect(self.poll)
+
+    @property
+    def last_event_id(self):
+        """
+        Id of the last event processed, None if polling hasn't started yet.
+        """
+        return self._last_event_id
+
+    def start(self):
+        """
+        Starts polling.
+        """
+        self._sg_data_retriever.start()
+        self._timer.start()
+        self.poll()
+
+    def stop(self):
+        """
+        Stops polling. Any poll in progress is discarded.
+        """
+        self._timer.stop()
+        self._current_poll_uid = None
+        self._sg_data_retriever.stop()
+
+    def poll(self):
+        """
+        Polls the event source in the background, unless a poll is already in progress.
+        """
+        if self._current_poll_uid is not None:
+            return
+
+        self._current_poll_uid = self._sg_data_retriever.execute_method(
+            _poll_event_source,
+            self._event_source,
+            self._last_event_id
+        )
+
+    def process_events(self, events):
+        """
+        Processes events retrieved from the event source and emits
+        publishes_changed if any publish was affected.
+
+        :param events: List of events, sorted by id.
+        """
+        changed_ids = []
+        removed_ids = []
+        for event in events:
+            if self._last_event_id is None or event["id"] > self._last_event_id:
+                self._last_event_id = event["id"]
+
+            # retired publishes are not linked to their events anymore, so
+            # fall back on the id stored in the event meta data.
+            publish_id = None
+            if event.get("entity"):
+                publish_id = event["entity"]["id"]
+            elif event.get("meta"):
+                publish_id = event["meta"].get("entity_id")
+            if publish_id is None:
+                continue
+
+            # only keep the latest state of each publish
+            if event["event_type"].endswith("_Retirement"):
+                if publish_id in changed_ids:
+                    changed_ids.remove(publish_id)
+                if publish_id not in removed_ids:
+                    removed_ids.append(publish_id)
+            else:
+                if publish_id in removed_ids:
+                    removed_ids.remove(publish_id)
+                if publish_id not in changed_ids:
+                    changed_ids.append(publish_id)
+
+        if changed_ids or removed_ids:
+            self._log_debug("%d publishes changed and %d retired." % (len(changed_ids), len(removed_ids)))
+            self.publishes_changed.emit(changed_ids, removed_ids)
+
+    def _on_data_retriever_work_completed(self, uid, request_type, data):
+        """
+        Signaled whenever the data retriever completes some work.
+
+        :param uid: The unique id of the work that completed
+        :param request_type: Type of work completed
+        :param data: Result of the work
+        """
+        uid = shotgun_model.sanitize_qt(uid)
+        if uid != self._current_poll_uid:
+            return
+        self._current_poll_uid = None
+
+        data = shotgun_model.sanitize_qt(data)
+        result = data["return_value"]
+        if self._last_event_id is None:
+            # first poll, only establishes where to start from
+            self._last_event_id = result["last_event_id"] or 0
+        self.process_events(result["events"])
+
+    def _on_data_retriever_work_failure(self, uid, msg):
+        """
+        Signaled whenever the data retriever fails to complete some work.
+
+        :param uid: The unique id of the work that failed
+        :param msg: The error message
+        """
+        uid = shotgun_model.sanitize_qt(uid)
+        if uid != self._current_poll_uid:
+            return
+        self._current_poll_uid = None
+        # the next poll will try again from the same event
+        self._log_debug("Could not poll events: %s" % msg)
+
+    def _log_debug(self, msg):
+        """
+        Convenience wrapper around debug logging
+
+        :param msg: debug message
+        """
+        self._bundle.log_debug("[%s] %s" % (self.__class__.__name__, msg))
+
+
+def _poll_event_source(sg, event_source, since_id):
+    """
+    Polls an event source. Runs in a background thread.
+
+    :param sg: Shotgun API instance.
+    :param event_source: :class:`EventSource` to poll.
+    :param since_id: Id of the last event seen, None if polling just started.
+    :returns: Dictionary with keys "last_event_id" and "events".
+    """
+    if since_id is None:
+        return {"last_event_id": event_source.get_last_event_id(sg), "events": []}
+    return {"last_event_id": since_id, "events": event_source.fetch_events(sg, since_id)}
@@ -0,0 +1,245 @@
+# Copyright (c) 2015 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+import sgtk
+from sgtk.platform.qt import QtCore, QtGui
+
+from .facets import FacetIndex, FACETS, get_record_facet_values
+from .model_latestpublish import SgLatestPublishModel
+from . import latest_publishes
+
+shotgun_model = sgtk.platform.import_framework("tk-framework-shotgunutils", "shotgun_model")
+
+# maximum number of values listed for a facet
+MAX_FACET_VALUES = 50
+
+
+class FacetFilterMenu(QtCore.QObject):
+    """
+    Menu of a button, filtering the publishes displayed by status, review status, author,
+    task and link, showing how many publishes each value would display.
+
+    The facet index is built from the publishes already loaded, the first
+    time the menu is shown after they changed, so filtering doesn't need any
+    Shotgun query. Publish types keep being filtered from the type list.
+    """
+
+    def __init__(self, parent, button, publish_model, proxy_model, status_model):
+        """
+        :param parent: Parent QObject.
+        :param button: Tool button showing the menu.
+        :param publish_model: Model holding the publishes.
+        :param proxy_model: Proxy model filtering the publishes.
+        :param status_model: Status model, used to display status names.
+        """
+        QtCore.QObject.__init__(self, parent)
+        self._bundle = sgtk.platform.current_bundle()
+        self._button = button
+        self._menu = QtGui.QMenu(button)
+        self._button.setMenu(self._menu)
+        self._button.setPopupMode(QtGui.QToolButton.InstantPopup)
+        self._publish_model = publish_model
+        self._proxy_model = proxy_model
+        self._status_model = status_model
+
+        # selected keys, keyed by facet. Selections are kept when other
+        # publishes are loaded, e.g. to see the work of a given artist
+        # across entities.
+        self._selections = {}
+        self._index = None
+
+        # rows change in batches, only update the index once they settled
+        self._timer = QtCore.QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(0)
+        self._timer.timeout.connect(self._on_publishes_changed)
+
+        self._menu.aboutToShow.connect(self._populate)
+        for signal in (self._publish_model.modelReset,
+                       self._publish_model.layoutChanged,
+                       self._publish_model.rowsInserted,
+                       self._publish_model.rowsRemoved):
+            signal.connect(self._schedule_update)
+        # rows are unchanged, e.g. when thumbnails are loaded, the index
+        # is only updated if the facets of the changed rows differ
+        self._publish_model.dataChanged.connect(self._on_data_changed)
+
+    def destroy(self):
+        """
+        Call this method prior to destroying this object.
+        """
+        self._timer.stop()
+        for signal in (self._publish_model.modelReset,
+                       self._publish_model.layoutChanged,
+                       self._publish_model.rowsInserted,
+                       self._publish_model.rowsRemoved):
+            signal.disconnect(self._schedule_update)
+        self._publish_model.dataChanged.disconnect(self._on_data_changed)
+        self._index = None
+
+    def get_selection_count(self):
+        """
+        Returns the number of facet values selected.
+
+        :returns: Number of values selected.
+        """
+        return sum(len(keys) for keys in self._selections.itervalues())
+
+    def clear_selections(self):
+        """
+        Displays all publishes again.
+        """
+        self._selections = {}
+        self._apply_selections()
+
+    def _schedule_update(self, *args):
+        """
+        Discards the index once the publishes changed.
+        """
+        self._timer.start()
+
+    def _on_data_changed(self, top_left, bottom_right):
+        """
+        Updates the index if the facets of the changed rows differ from the
+        indexed ones. Decorations, such as thumbnails, are ignored.
+
+        :param top_left: Index of the first changed row.
+        :param bottom_right: Index of the last changed row.
+        """
+        if self._index is None:
+            return
+        for row in range(top_left.row(), bottom_right.row() + 1):
+            publish = self._get_publish(self._publish_model.index(row, 0, top_left.parent()))
+            if publish is not None and not self._index.is_current(*publish):
+                self._schedule_update()
+                return
+
+    def _on_publishes_changed(self):
+        """
+        Discards the index and filters the new publishes if needed.
+        """
+        self._index = None
+        if self._selections:
+            self._apply_selections()
+
+    def _get_index(self):
+        """
+        Returns the index of the publishes loaded, building it if needed.
+
+        :returns: :class:`FacetIndex`.
+        """
+        if self._index is None:
+            self._index = FacetIndex(self._iter_publishes())
+        return self._index
+
+    def _iter_publishes(self):
+        """
+        Iterates over the publishes loaded, skipping folders.
+
+        :returns: Generator of (publish id, facet values) tuples.
+        """
+        for row in range(self._publish_model.rowCount()):
+            publish = self._get_publish(self._publish_model.index(row, 0))
+            if publish is not None:
+                yield publish
+
+    def _get_publish(self, index):
+        """
+        Returns the id and facet values of a publish.
+
+        Models holding them as columns of their rows serve them through roles,
+        so that the Shotgun data of each row doesn't need to be loaded.
+
+        :param index: Model index of the publish.
+        :returns: Tuple with the publish id and its facet values, or None for folders.
+        """
+        if shotgun_model.get_sanitized_data(index, SgLatestPublishModel.IS_FOLDER_ROLE):
+            return None
+
+        publish_id = shotgun_model.get_sanitized_data(index, SgLatestPublishModel.PUBLISH_ID_ROLE)
+        facet_values = shotgun_model.get_sanitized_data(index, SgLatestPublishModel.FACET_VALUES_ROLE)
+        if publish_id is None or facet_values is None:
+            sg_data = shotgun_model.get_sg_data(index)
+            if not sg_data:
+                return None
+            publish_id = sg_data["id"]
+            facet_values = get_record_facet_values(sg_data, latest_publishes.get_publish_type_field())
+        return (publish_id, facet_values)
+
+    def _apply_selections(self):
+        """
+        Filters the publishes displayed with the current selections.
+        """
+        ids = None
+        if self._selections:
+            ids = self._get_index().get_ids(self._selections)
+        self._proxy_model.set_facet_ids(ids)
+
+        count = self.get_selection_count()
+        self._button.setText("Filter (%d)" % count if count else "Filter")
+
+    def _populate(self):
+        """
+        Lists the values of each facet, with their counts.
+        """
+        self._menu.clear()
+        index = self._get_index()
+
+        for (facet, display_name) in FACETS:
+            if facet == "type":
+                continue
+            counts = index.get_counts(facet, self._selections)
+            submenu = self._menu.addMenu(display_name)
+            submenu.setEnabled(bool(counts))
+
+            selected_keys = self._selections.get(facet, set())
+            for (key, label, count) in counts[:MAX_FACET_VALUES]:
+                if facet in ("status", "review_status") and key:
+                    label = self._status_model.get_long_name(key)
+                action = submenu.addAction("%s (%d)" % (label, count))
+                action.setCheckable(True)
+                action.setChecked(key in selected_keys)
+                action.toggled.connect(
+                    lambda checked, facet=facet, key=key: self._on_value_toggled(facet, key, checked)
+                )
+            if len(counts) > MAX_FACET_VALUES:
+                action = submenu.addAction("%d more values..." % (len(counts) - MAX_FACET_VALUES))
+                action.setEnabled(False)
+
+        self._menu.addSeparator()
+        clear_action = self._menu.addAction("Clear Filters")
+        clear_action.setEnabled(bool(self._selections))
+        clear_action.triggered.connect(self.clear_selections)
+
+    def _on_value_toggled(self, facet, key, checked):
+        """
+        Called when a facet value is selected or deselected.
+
+        :param facet: Name of the facet.
+        :param key: Key of the value.
+        :param checked: True if the value was selected.
+        """
+        keys = self._selections.setdefault(facet, set())
+        if checked:
+            keys.add(key)
+        else:
+            keys.discard(key)
+            if not keys:
+                del self._selections[facet]
+        self._log_debug("Facet selections: %s" % self._selections)
+        self._apply_selections()
+
+    def _log_debug(self, msg):
+        """
+        Convenience wrapper around debug logging
+
+        :param msg: debug message
+        """
+        self._bundle.log_debug("[%s] %s" % (self.__class__.__name__, msg))
@@ -0,0 +1,162 @@
+# Copyright (c) 2015 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Faceted filtering of the publishes displayed.
+
+A :class:`FacetIndex` is built with a single pass over the publishes
+loaded. It holds the set of publish ids for each value of each facet, so
+that counts and the publishes matching any combination of selected values
+are computed with set operations, without any Shotgun query.
+
+Publishes are indexed by id rather than by row, so that an index stays
+valid when rows are inserted or removed.
+
+This module is deliberately free of any Qt dependencies.
+"""
+
+# facets, in the order they are presented, with their display names
+FACETS = [
+    ("type", "Type"),
+    ("status", "Status"),
+    ("review_status", "Review Status"),
+    ("author", "Author"),
+    ("task", "Task"),
+    ("entity", "Link"),
+]
+
+
+def get_facet_values(sg_data, publish_type_field):
+    """
+    Returns the value of each facet for a publish.
+
+    :param sg_data: Shotgun data of the publish.
+    :param publish_type_field: Name of the publish type field.
+    :returns: List of (facet, key, label) tuples. Keys are hashable and
+              publishes without a value for a facet get a None key.
+    """
+    return [
+        ("type",) + _get_link_value(sg_data.get(publish_type_field), "No Type"),
+        ("status", sg_data.get("sg_status_list"), sg_data.get("sg_status_list") or "No Status"),
+        ("review_status",
+         sg_data.get("version.Version.sg_status_list"),
+         sg_data.get("version.Version.sg_status_list") or "No Review Status"),
+        ("author",) + _get_link_value(sg_data.get("created_by"), "Unspecified User"),
+        ("task",) + _get_link_value(sg_data.get("task"), "No Task"),
+        ("entity",) + _get_link_value(sg_data.get("entity"), "Unlinked"),
+    ]
+
+
+def get_record_facet_values(sg_data, publish_type_field):
+    """
+    Returns the value of each facet for a publish, as stored with the
+    rows of the publish model.
+
+    :param sg_data: Shotgun data of the publish.
+    :param publish_type_field: Name of the publish type field.
+    :returns: Tuple of (key, label) tuples, in the order of :data:`FACETS`.
+    """
+    return tuple((key, label) for (_, key, label) in get_facet_values(sg_data, publish_type_field))
+
+
+def _get_link_value(link, empty_label):
+    """
+    Returns the key and label of an entity link.
+
+    :param link: Entity dictionary or None.
+    :param empty_label: Label used when there is no link.
+    :returns: Tuple with the key and the label.
+    """
+    if not link:
+        return (None, empty_label)
+    key = (link.get("type"), link.get("id"))
+    if link.get("type") in ("Task", "HumanUser", "PublishedFileType", "TankType"):
+        return (key, link.get("name") or "Unnamed")
+    return (key, "%s %s" % (link.get("type"), link.get("name") or "Unnamed"))
+
+
+class FacetIndex(object):
+    """
+    Publish ids of each value of each facet.
+    """
+
+    def __init__(self, publishes):
+        """
+        Builds the index in a single pass.
+
+        :param publishes: Iterable of (publish id, facet values) tuples, with the facet
+                          values returned by :meth:`get_record_facet_values`.
+        """
+        # facet -> key -> [label, set of publish ids]
+        self._values = dict((facet, {}) for (facet, _) in FACETS)
+        self._facet_values_by_id = {}
+        for (publish_id, facet_values) in publishes:
+            self._facet_values_by_id[publish_id] = facet_values
+            for ((facet, _), (key, label)) in zip(FACETS, facet_values):
+                value = self._values[facet].get(key)
+                if value is None:
+                    self._values[facet][key] = [label, set([publish_id])]
+                else:
+                    value[1].add(publish_id)
+
+    def is_current(self, publish_id, facet_values):
+        """
+        Checks whether a publish is indexed with the given facet values, e.g.
+        to keep the index when a row changed without its facets changing.
+
+        :param publish_id: Id of the publish.
+        :param facet_values: Facet values of the publish.
+        :returns: True if the index is up to date for the publish.
+        """
+        return self._facet_values_by_id.get(publish_id) == facet_values
+
+    def get_ids(self, selections):
+        """
+        Returns the ids of the publishes matching selected values. Publishes
+        need to match one of the values selected for each facet.
+
+        :param selections: Dictionary keyed by facet holding the set of selected keys.
+                           Facets without any selected keys don't filter anything.
+        :returns: Set of publish ids, or None if nothing is selected.
+        """
+        ids = None
+        for (facet, keys) in selections.iteritems():
+            if not keys:
+                continue
+            facet_ids = set()
+            for key in keys:
+                value = self._values[facet].get(key)
+                if value is not None:
+                    facet_ids |= value[1]
+            ids = facet_ids if ids is None else ids & facet_ids
+        return ids
+
+    def get_counts(self, facet, selections=None):
+        """
+        Returns the values of a facet with their number of publishes. Selections
+        made on the other facets are taken into account, so that counts tell
+        how many publishes would be displayed if a value was selected too.
+
+        :param facet: Name of the facet.
+        :param selections: Dictionary keyed by facet holding the set of selected keys.
+        :returns: List of (key, label, count) tuples, sorted by decreasing count.
+        """
+        other_selections = dict(
+            (other_facet, keys) for (other_facet, keys) in (selections or {}).iteritems()
+            if other_facet != facet
+        )
+        ids = self.get_ids(other_selections)
+
+        counts = []
+        for (key, (label, value_ids)) in self._values[facet].iteritems():
+            count = len(value_ids) if ids is None else len(value_ids & ids)
+            counts.append((key, label, count))
+        counts.sort(key=lambda value: (-value[2], value[1]))
+        return counts
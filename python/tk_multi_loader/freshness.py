@@ -0,0 +1,247 @@
+# Copyright (c) 2015 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Freshness policy deciding whether cached model data should be refreshed
+from Shotgun when a model is loaded.
+
+Each model is configured through the cache_freshness app setting with either:
+
+- "revalidate": cached data is displayed straight away and refreshed in the
+  background. This is the default.
+- a number of seconds: cached data younger than this is considered fresh and
+  is displayed without querying Shotgun.
+
+Refresh times are read from the freshness file once per session and kept in
+memory. Refreshes marked within a :meth:`FreshnessPolicy.batch` are written
+together, merged with the refresh times recorded by other sessions.
+"""
+
+import os
+import sys
+import json
+import time
+import threading
+import contextlib
+
+import sgtk
+
+from .publish_cache import get_query_key
+
+# policy applied to models which are not configured
+REVALIDATE = "revalidate"
+
+# name of the file storing when each query was last refreshed
+FRESHNESS_FILE_NAME = "freshness.json"
+
+# refresh times of each freshness file read during the session, keyed by path
+_refresh_times = {}
+# guards the refresh times, queries may be marked from background threads
+_lock = threading.Lock()
+
+
+class FreshnessPolicy(object):
+    """
+    Freshness policy for a given model.
+    """
+
+    # set to always refresh, whatever the policy is, e.g. when warming up caches
+    force_refresh = False
+
+    def __init__(self, model_name):
+        """
+        :param model_name: Name of the model in the cache_freshness setting,
+                           e.g. "status" or "publish_type".
+        """
+        self._bundle = sgtk.platform.current_bundle()
+        self._model_name = model_name
+
+        policies = self._bundle.get_setting("cache_freshness") or {}
+        self._policy = policies.get(model_name, REVALIDATE)
+        if self._policy != REVALIDATE and not isinstance(self._policy, (int, long, float)):
+            self._bundle.log_warning(
+                "Invalid cache_freshness value '%s' for '%s', using '%s' instead." % (
+                    self._policy, model_name, REVALIDATE
+                )
+            )
+            self._policy = REVALIDATE
+
+        self._path = os.path.join(self._bundle.cache_location, FRESHNESS_FILE_NAME)
+
+        # number of nested batches and whether refreshes were marked in them
+        self._batch_depth = 0
+        self._batch_changed = False
+
+    def needs_refresh(self, data_cached, *query):
+        """
+        Checks whether a model should refresh its data from Shotgun.
+
+        :param data_cached: True if the model loaded data from its cache.
+        :param query: Values identifying the query, e.g. entity type, filters and fields.
+        :returns: True if the data should be refreshed, False if the cached data can be used.
+        """
+        if not data_cached or self._policy == REVALIDATE or self.force_refresh:
+            return True
+
+        with _lock:
+            refreshed_at = self._get_refresh_times().get(self._get_entry_key(query))
+        if refreshed_at is None:
+            return True
+
+        age = time.time() - refreshed_at
+        if age < 0 or age > self._policy:
+            return True
+
+        self._bundle.log_debug(
+            "Cached %s data is %d seconds old, skipping refresh." % (self._model_name, age)
+        )
+        return False
+
+    def mark_refreshed(self, *query):
+        """
+        Records that the data for a query was just refreshed from Shotgun.
+
+        :param query: Values identifying the query, as passed to :meth:`needs_refresh`.
+        """
+        if self._policy == REVALIDATE:
+            # nothing to track
+            return
+
+        with _lock:
+            self._get_refresh_times()[self._get_entry_key(query)] = time.time()
+
+        if self._batch_depth:
+            self._batch_changed = True
+        else:
+            self._write()
+
+    @contextlib.contextmanager
+    def batch(self):
+        """
+        Context manager writing the refreshes marked within it in one go,
+        e.g. when the parts of a multi-selection are refreshed together.
+        """
+        self._batch_depth += 1
+        try:
+            yield
+        finally:
+            self._batch_depth -= 1
+            if not self._batch_depth and self._batch_changed:
+                self._batch_changed = False
+                self._write()
+
+    def _get_entry_key(self, query):
+        """
+        Returns the key for a query in the freshness file.
+
+        :param query: Values identifying the query.
+        """
+        return "%s:%s" % (self._model_name, get_query_key(*query))
+
+    def _get_refresh_times(self):
+        """
+        Returns the refresh times of the freshness file, reading it the first
+        time. Must be called with the lock held.
+
+        :returns: Dictionary of time stamps keyed by query.
+        """
+        data = _refresh_times.get(self._path)
+        if data is None:
+            try:
+                data = _read_refresh_times(self._path)
+            except Exception as e:
+                self._bundle.log_debug("Could not read %s: %s" % (self._path, e))
+                data = {}
+            _refresh_times[self._path] = data
+        return data
+
+    def _write(self):
+        """
+        Writes the refresh times to the freshness file, keeping the ones
+        more recently recorded by other sessions.
+        """
+        with _lock:
+            data = self._get_refresh_times()
+            try:
+                _merge_refresh_times(data, _read_refresh_times(self._path))
+                _write_refresh_times(self._path, data)
+            except Exception as e:
+                self._bundle.log_debug("Could not write %s: %s" % (self._path, e))
+
+
+def merge_refresh_times(source_path, target_path):
+    """
+    Merges the refresh times stored in a freshness file into another one,
+    keeping the most recent time for each query.
+
+    :param source_path: Freshness file to merge.
+    :param target_path: Freshness file to update.
+    """
+    with _lock:
+        data = _refresh_times.get(target_path)
+        if data is None:
+            data = _read_refresh_times(target_path)
+        else:
+            # the session already read the target, keep its refresh times current
+            _merge_refresh_times(data, _read_refresh_times(target_path))
+        if _merge_refresh_times(data, _read_refresh_times(source_path)):
+            _write_refresh_times(target_path, data)
+
+
+def _merge_refresh_times(data, other_data):
+    """
+    Merges refresh times into others, keeping the most recent time for each query.
+
+    :param data: Dictionary of time stamps keyed by query, updated in place.
+    :param other_data: Dictionary of time stamps keyed by query to merge.
+    :returns: True if any time stamp was updated, False otherwise.
+    """
+    changed = False
+    for (key, refreshed_at) in other_data.items():
+        if refreshed_at > data.get(key, 0):
+            data[key] = refreshed_at
+            changed = True
+    return changed
+
+
+def _read_refresh_times(path):
+    """
+    Reads a freshness file.
+
+    :param path: Path to the file.
+    :returns: Dictionary of time stamps keyed by query, empty if the file doesn't exist.
+    """
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as fh:
+        return json.load(fh)
+
+
+def _write_refresh_times(path, data):
+    """
+    Writes a freshness file. The file is written to a temporary file first
+    and then renamed, so that it is never read half written.
+
+    :param path: Path to the file.
+    :param data: Dictionary of time stamps keyed by query.
+    """
+    if not os.path.exists(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    tmp_path = "%s.%d.tmp" % (path, os.getpid())
+    try:
+        with open(tmp_path, "w") as fh:
+            json.dump(data, fh)
+        if sys.platform == "win32" and os.path.exists(path):
+            # files can't be renamed over existing ones on windows
+            os.remove(path)
+        os.rename(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
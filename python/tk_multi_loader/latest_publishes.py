@@ -0,0 +1,187 @@
+# Copyright (c) 2015 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Logic for reducing a list of publishes down to the latest version of each publish.
+
+This module is deliberately free of any Qt dependencies so that it can be shared
+between the different publish models.
+"""
+
+from collections import defaultdict
+
+import sgtk
+
+from . import tracing
+
+
+def get_publish_type_field():
+    """
+    Returns the name of the field holding the publish type, depending on whether
+    the site is using PublishedFile or the old TankPublishedFile entity.
+
+    :returns: "published_file_type" or "tank_type"
+    """
+    app = sgtk.platform.current_bundle()
+    publish_entity_type = sgtk.util.get_published_file_entity_type(app.sgtk)
+
+    if publish_entity_type == "PublishedFile":
+        return "published_file_type"
+    else:
+        return "tank_type"
+
+
+def compute_latest_publishes(sg_data_list, publish_type_field):
+    """
+    Filters a list of publishes so that only the latest version of each publish
+    is returned, and computes how many publishes of each type remain.
+
+    The input list is expected to be sorted by creation date in ascending order
+    so that later entries represent later versions.
+
+    For example, if there are these publishes:
+
+    - name FOO, version 1, task ANIM, type XXX
+    - name FOO, version 2, task ANIM, type XXX
+    - name FOO, version 3, task ANIM, type XXX
+    - name FOO, version 1, task ANIM, type YYY
+    - name FOO, version 2, task ANIM, type YYY
+    - name FOO, version 5, task LAY,  type YYY
+    - name FOO, version 6, task LAY,  type YYY
+    - name FOO, version 7, task LAY,  type YYY
+
+    three items will be returned:
+
+    - Foo v3 (type XXX)
+    - Foo v2 (type YYY, task ANIM)
+    - Foo v7 (type YYY, task LAY)
+
+    Each returned publish gets a special ``task_uniqueness`` boolean flag which
+    is False if there are other publishes in the result with the same name and
+    type but with a different task.
+
+    :param sg_data_list: List of shotgun publish dictionaries.
+    :param publish_type_field: Name of the publish type field, see :meth:`get_publish_type_field`.
+    :returns: Tuple with the filtered list of publishes and a dictionary
+              keyed by type id holding the number of publishes of that type.
+    """
+    with tracing.span("dedup_latest_publishes", rows_in=len(sg_data_list)) as span:
+        result = _compute_latest_publishes(sg_data_list, publish_type_field)
+        span.set(rows_out=len(result[0]))
+    return result
+
+
+def _compute_latest_publishes(sg_data_list, publish_type_field):
+    """
+    Implementation of :meth:`compute_latest_publishes`.
+    """
+    # FIRST PASS!
+    # get a dict with only the latest versions, grouped by name, type and task.
+    unique_data = {}
+    name_type_aggregates = defaultdict(int)
+
+    for sg_item in sg_data_list:
+
+        # get the associated type
+        type_id = None
+        type_link = sg_item[publish_type_field]
+        if type_link:
+            type_id = type_link["id"]
+
+        # also get the associated task
+        task_id = None
+        task_link = sg_item["task"]
+        if task_link:
+            task_id = task_link["id"]
+
+        # key publishes in dict by type and name
+        unique_data[(sg_item["name"], type_id, task_id)] = {"sg_item": sg_item, "type_id": type_id}
+
+        # count how many items of this type we have
+        name_type_aggregates[(sg_item["name"], type_id)] += 1
+
+    # SECOND PASS
+    # We now have the latest versions only
+    # Go ahead count types for the aggregate
+    # and assemble filtered sg data set
+    type_id_aggregates = defaultdict(int)
+    new_sg_data = []
+    for second_pass_data in unique_data.values():
+
+        # get the shotgun data for this guy
+        sg_item = second_pass_data["sg_item"]
+
+        # now add a flag to indicate if this item is "task unique" or not
+        # e.g. if there are other items in the listing with the same name
+        # and same type but with a different task
+        if name_type_aggregates[(sg_item["name"], second_pass_data["type_id"])] > 1:
+            # there are more than one item with this same name/type combo!
+            sg_item["task_uniqueness"] = False
+        else:
+            # no other item with this task/name/type combo
+            sg_item["task_uniqueness"] = True
+
+        # append to new sg data
+        new_sg_data.append(sg_item)
+
+        # update our aggregate counts for the publish type view
+        type_id_aggregates[second_pass_data["type_id"]] += 1
+
+    return (new_sg_data, type_id_aggregates)
+
+
+def filter_publishes(app, sg_data_list):
+    """
+    Filters a list of shotgun published files based on the filter_publishes
+    hook.
+
+    :param app:           app that has the hook.
+    :param sg_data_list:  list of shotgun dictionaries, as returned by the
+                          find() call.
+    :returns:             list of filtered shotgun dictionaries, same form as
+                          the input.
+    """
+    with tracing.span("filter_publishes_hook", rows_in=len(sg_data_list)) as span:
+        sg_data_list = _filter_publishes(app, sg_data_list)
+        span.set(rows_out=len(sg_data_list))
+    return sg_data_list
+
+
+def _filter_publishes(app, sg_data_list):
+    """
+    Implementation of :meth:`filter_publishes`.
+    """
+    try:
+        # Constructing a wrapper dictionary so that it's future proof to
+        # support returning additional information from the hook
+        hook_publish_list = [{"sg_publish": sg_data}
+                             for sg_data in sg_data_list]
+
+        hook_publish_list = app.execute_hook("filter_publishes_hook",
+                                             publishes=hook_publish_list)
+        if not isinstance(hook_publish_list, list):
+            app.log_error(
+                "hook_filter_publishes returned an unexpected result type \
+                '%s' - ignoring!"
+                % type(hook_publish_list).__name__)
+            hook_publish_list = []
+
+        # split back out publishes:
+        sg_data_list = []
+        for item in hook_publish_list:
+            sg_data = item.get("sg_publish")
+            if sg_data:
+                sg_data_list.append(sg_data)
+
+    except:
+        app.log_exception("Failed to execute 'filter_publishes_hook'!")
+        sg_data_list = []
+
+    return sg_data_list
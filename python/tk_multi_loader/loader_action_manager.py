@@ -17,18 +17,32 @@ from tank_vendor import shotgun_api3
 from sgtk import TankError
 
 from .action_manager import ActionManager
+from . import sequence_scanner
+from . import metrics
+
+# number of actions prepared by a single background task
+_PREPARE_BATCH_SIZE = 20
 
 class LoaderActionManager(ActionManager):
     """
     Specialisation of the base ActionManager class that handles dishing out and 
     executing QActions based on the hook configuration for the regular loader UI
 
+    Actions run in two phases when a background task manager is set. The
+    prepare phase resolves the publish paths and scans their directories in
+    background threads, warming the caches of the shared sequence scanner.
+    The apply phase then runs the actions hook on the main thread, where only
+    the DCC calls are left to do.
+
     :signal: ``pre_execute_action(QtGui.QAction)`` - Fired before a custom action is executed.
     :signal: ``post_execute_action(QtGui.QAction)`` - Fired after a custom action is executed.
+    :signal: ``prepare_progress(QtGui.QAction, int, int)`` - Fired while the action is
+        prepared, with the number of publishes prepared and the total number of publishes.
     """
 
     pre_execute_action = QtCore.Signal(object)
     post_execute_action = QtCore.Signal(object)
+    prepare_progress = QtCore.Signal(object, int, int)
 
     def __init__(self):
         """
@@ -46,6 +60,45 @@ class LoaderActionManager(ActionManager):
         else:
             self._publish_type_field = "tank_type"
 
+        # actions being prepared, in the order they were triggered
+        self._bg_task_manager = None
+        self._pending_runs = []
+
+    def set_bg_task_manager(self, bg_task_manager):
+        """
+        Sets the background task manager used to prepare actions. Actions are
+        run synchronously until it is set.
+
+        :param bg_task_manager: A :class:`BackgroundTaskManager` instance, or None.
+        """
+        if self._bg_task_manager:
+            self.cancel_pending_actions()
+            self._bg_task_manager.task_completed.disconnect(self._on_prepare_task_completed)
+            self._bg_task_manager.task_failed.disconnect(self._on_prepare_task_failed)
+
+        self._bg_task_manager = bg_task_manager
+
+        if self._bg_task_manager:
+            self._bg_task_manager.task_completed.connect(self._on_prepare_task_completed)
+            self._bg_task_manager.task_failed.connect(self._on_prepare_task_failed)
+
+    def has_pending_actions(self):
+        """
+        :returns: True if actions are being prepared.
+        """
+        return len(self._pending_runs) > 0
+
+    def cancel_pending_actions(self):
+        """
+        Cancels the actions being prepared. Their hooks won't be run.
+        """
+        pending_runs = self._pending_runs
+        self._pending_runs = []
+        for run in pending_runs:
+            self._bg_task_manager.stop_task_group(run.group)
+            self._app.log_debug("Cancelled action '%s'." % run.qt_action.text())
+            self.post_execute_action.emit(run.qt_action)
+
     def _get_actions_for_publish(self, sg_data, ui_area):
         """
         Retrieves the list of actions for a given publish.
@@ -90,11 +143,12 @@ class LoaderActionManager(ActionManager):
         action_defs = []
         try:
             # call out to hook to give us the specifics.
-            action_defs = self._app.execute_hook_method("actions_hook",
-                                                        "generate_actions",
-                                                        sg_publish_data=sg_data,
-                                                        actions=actions,
-                                                        ui_area=ui_area_str)
+            with metrics.timer("generate_actions_hook"):
+                action_defs = self._app.execute_hook_method("actions_hook",
+                                                            "generate_actions",
+                                                            sg_publish_data=sg_data,
+                                                            actions=actions,
+                                                            ui_area=ui_area_str)
         except Exception:
             self._app.log_exception("Could not execute generate_actions hook.")
 
@@ -292,11 +346,12 @@ class LoaderActionManager(ActionManager):
         action_defs = []
         try:
             # call out to hook to give us the specifics.
-            action_defs = self._app.execute_hook_method("actions_hook",
-                                                        "generate_actions",
-                                                        sg_publish_data=sg_data,
-                                                        actions=actions,
-                                                        ui_area="main")  # folder options only found in main ui area
+            with metrics.timer("generate_actions_hook"):
+                action_defs = self._app.execute_hook_method("actions_hook",
+                                                            "generate_actions",
+                                                            sg_publish_data=sg_data,
+                                                            actions=actions,
+                                                            ui_area="main")  # folder options only found in main ui area
         except Exception:
             self._app.log_exception("Could not execute generate_actions hook.")
 
@@ -371,33 +426,124 @@ class LoaderActionManager(ActionManager):
     @staticmethod
     def _fix_timestamp(sg_data):
         """
-        Convert created_at unix time stamp in sg_data to shotgun time stamp.
+        Convert created_at and updated_at unix time stamps in sg_data to shotgun time stamps.
 
         :param sg_data: Standard Shotgun entity dictionary with keys type, id and name.
         """
 
-        unix_timestamp = sg_data.get("created_at")
-        if isinstance(unix_timestamp, float):
-            sg_timestamp = datetime.datetime.fromtimestamp(
-                unix_timestamp, shotgun_api3.sg_timezone.LocalTimezone()
-            )
-            sg_data["created_at"] = sg_timestamp
+        for field in ["created_at", "updated_at"]:
+            unix_timestamp = sg_data.get(field)
+            if isinstance(unix_timestamp, float):
+                sg_timestamp = datetime.datetime.fromtimestamp(
+                    unix_timestamp, shotgun_api3.sg_timezone.LocalTimezone()
+                )
+                sg_data[field] = sg_timestamp
 
     ########################################################################################
     # callbacks
 
     def _execute_hook(self, qt_action, actions):
         """
-        callback - executes a hook
+        callback - executes a hook, once the actions have been prepared in the background
         """
-        self._app.log_debug("Calling scene load hook.")
-
+        if not self._bg_task_manager or not actions:
+            self.pre_execute_action.emit(qt_action)
+            self._apply_actions(qt_action, actions)
+            return
+
+        run = _PendingRun(qt_action, actions)
+        self._pending_runs.append(run)
+        for first in range(0, len(actions), _PREPARE_BATCH_SIZE):
+            batch = actions[first:first + _PREPARE_BATCH_SIZE]
+            uid = self._bg_task_manager.add_task(self._prepare_actions,
+                                                 group=run.group,
+                                                 task_kwargs={"actions": batch})
+            run.batches[uid] = len(batch)
+
+        # the run is pending by now, so listeners can offer to cancel it
         self.pre_execute_action.emit(qt_action)
 
+    def _prepare_actions(self, actions):
+        """
+        Runs in a background thread. Resolves the paths of the publishes and scans
+        their directories, so that the actions hook finds them in the caches.
+        No DCC calls can be made here.
+
+        :param actions: List of action dictionaries, as passed to the actions hook.
+        :returns: Number of actions prepared.
+        """
+        for action in actions:
+            sg_data = action["sg_publish_data"]
+            try:
+                path = sgtk.util.resolve_publish_path(self._app.sgtk, sg_data)
+            except Exception:
+                # older cores can't resolve paths, the hook will do it
+                path = (sg_data.get("path") or {}).get("local_path")
+
+            if path:
+                # lists the directory once for the file and for any sequence
+                sequence_scanner.exists(path)
+        return len(actions)
+
+    def _on_prepare_task_completed(self, uid, group, result):
+        """
+        Called when a batch of actions was prepared.
+
+        :param uid: Id of the task.
+        :param group: Group of the task.
+        :param result: Number of actions prepared.
+        """
+        self._on_batch_prepared(uid)
+
+    def _on_prepare_task_failed(self, uid, group, msg, stack_trace):
+        """
+        Called when a batch of actions couldn't be prepared. The actions are still
+        run, preparing them is only an optimization.
+
+        :param uid: Id of the task.
+        :param group: Group of the task.
+        :param msg: Error message.
+        :param stack_trace: Stack trace of the error.
+        """
+        if self._on_batch_prepared(uid):
+            self._app.log_debug("Could not prepare actions: %s" % msg)
+
+    def _on_batch_prepared(self, uid):
+        """
+        Updates the progress of a run and applies the runs which are fully prepared,
+        in the order they were triggered.
+
+        :param uid: Id of the task which prepared the batch.
+        :returns: True if the task belonged to a pending run.
+        """
+        for run in self._pending_runs:
+            if uid in run.batches:
+                run.prepared += run.batches.pop(uid)
+                self.prepare_progress.emit(run.qt_action, run.prepared, len(run.actions))
+                break
+        else:
+            # not one of ours, or the run was cancelled
+            return False
+
+        while self._pending_runs and not self._pending_runs[0].batches:
+            run = self._pending_runs.pop(0)
+            self._apply_actions(run.qt_action, run.actions)
+        return True
+
+    def _apply_actions(self, qt_action, actions):
+        """
+        Runs the actions hook on the main thread.
+
+        :param qt_action: The QAction that was triggered.
+        :param actions: List of action dictionaries to pass to the actions hook.
+        """
+        self._app.log_debug("Calling scene load hook.")
+
         try:
-            self._app.execute_hook_method("actions_hook",
-                                          "execute_multiple_actions",
-                                          actions=actions)
+            with metrics.timer("actions_hook"):
+                self._app.execute_hook_method("actions_hook",
+                                              "execute_multiple_actions",
+                                              actions=actions)
         except Exception, e:
             self._app.log_exception("Could not execute execute_action hook: %s" % e)
             QtGui.QMessageBox.critical(
@@ -486,3 +632,25 @@ class LoaderActionManager(ActionManager):
             exit_code = os.system(cmd)
             if exit_code != 0:
                 self._engine.log_error("Failed to launch '%s'!" % cmd)
+
+
+class _PendingRun(object):
+    """
+    Actions triggered together and being prepared in the background.
+    """
+
+    # used to give each run its own task group
+    _next_id = 0
+
+    def __init__(self, qt_action, actions):
+        """
+        :param qt_action: The QAction that was triggered.
+        :param actions: List of action dictionaries to pass to the actions hook.
+        """
+        _PendingRun._next_id += 1
+        self.group = "prepare_actions_%d" % _PendingRun._next_id
+        self.qt_action = qt_action
+        self.actions = actions
+        # number of actions in each batch being prepared, keyed by task id
+        self.batches = {}
+        self.prepared = 0
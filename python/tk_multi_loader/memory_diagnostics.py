@@ -0,0 +1,353 @@
+# Copyright (c) 2015 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Memory accounting of the loader, to track down memory creeping up in long
+DCC sessions.
+
+Reports hold the row count of each model with an estimate of the memory used
+by their Shotgun data, their pixmaps and their other roles, the number of Qt
+objects kept alive and the memory used by the process. The diagnostic mode,
+enabled with the memory_diagnostics setting, takes a report periodically and
+logs how it grew since the dialog was opened.
+
+:meth:`run_leak_test` opens, navigates and closes the dialog repeatedly without
+displaying it, and fails if the memory or the number of Qt objects keeps growing.
+"""
+
+import gc
+import sys
+import time
+from collections import defaultdict
+
+import sgtk
+from sgtk import TankError
+from sgtk.platform.qt import QtCore, QtGui
+
+from . import dialog_pool
+from .model_latestpublish import SgLatestPublishModel
+
+# maximum number of rows of a model inspected to estimate its memory,
+# the estimate is extrapolated to the other rows.
+MAX_SAMPLED_ROWS = 5000
+
+# leak test thresholds used when not specified
+DEFAULT_MAX_GROWTH_MB = 50
+DEFAULT_MAX_OBJECT_GROWTH = 100
+
+# Qt classes of the objects counted in reports
+_COUNTED_CLASSES = [
+    ("QAction", QtGui.QAction),
+    ("QMenu", QtGui.QMenu),
+    ("QWidget", QtGui.QWidget),
+    ("QAbstractItemModel", QtCore.QAbstractItemModel),
+    ("QStandardItem", QtGui.QStandardItem),
+    ("QPixmap", QtGui.QPixmap),
+    ("QImage", QtGui.QImage),
+    ("QIcon", QtGui.QIcon),
+]
+
+
+def estimate_size(value, seen=None):
+    """
+    Estimates the memory used by a Python value and the values it contains.
+    Values referenced more than once are only counted once.
+
+    :param value: Value to estimate, e.g. a Shotgun dictionary.
+    :param seen: Set of the ids of the values already counted.
+    :returns: Estimated number of bytes.
+    """
+    if seen is None:
+        seen = set()
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+
+    size = sys.getsizeof(value, 0)
+    if isinstance(value, dict):
+        for (key, item) in value.iteritems():
+            size += estimate_size(key, seen) + estimate_size(item, seen)
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        for item in value:
+            size += estimate_size(item, seen)
+    return size
+
+
+def get_model_report(name, model):
+    """
+    Counts the rows of a model and estimates the memory they use. Pixmaps
+    shared between rows, e.g. default icons, are only counted once.
+
+    :param name: Name of the model in the report.
+    :param model: Model to inspect. Only the rows already loaded are inspected.
+    :returns: Dictionary with the number of rows and the estimated bytes used
+              by the Shotgun data, the pixmaps and the other roles.
+    """
+    report = {"name": name, "rows": 0, "sg_data_bytes": 0, "pixmap_bytes": 0, "role_bytes": 0}
+    seen = set()
+    pixmap_keys = set()
+    sampled = 0
+
+    parents = [QtCore.QModelIndex()]
+    while parents:
+        parent = parents.pop()
+        for row in range(model.rowCount(parent)):
+            index = model.index(row, 0, parent)
+            report["rows"] += 1
+            if model.hasChildren(index):
+                parents.append(index)
+            if sampled >= MAX_SAMPLED_ROWS:
+                continue
+            sampled += 1
+
+            sg_data = index.data(SgLatestPublishModel.SG_DATA_ROLE)
+            report["sg_data_bytes"] += estimate_size(sg_data, seen)
+            for (role, value) in model.itemData(index).items():
+                if role == SgLatestPublishModel.SG_DATA_ROLE:
+                    continue
+                pixmap_bytes = _get_pixmap_bytes(value, pixmap_keys)
+                if pixmap_bytes is not None:
+                    report["pixmap_bytes"] += pixmap_bytes
+                else:
+                    report["role_bytes"] += estimate_size(value, seen)
+
+    if sampled and report["rows"] > sampled:
+        # only the pixmaps actually seen are counted, they are mostly shared
+        for key in ("sg_data_bytes", "role_bytes"):
+            report[key] = report[key] * report["rows"] / sampled
+    return report
+
+
+def count_qt_objects():
+    """
+    Counts the Qt objects referenced from Python, e.g. kept in lists.
+
+    :returns: Dictionary of counts keyed by class name, with the number of
+              widgets known to the application under "all widgets".
+    """
+    counts = defaultdict(int)
+    for obj in gc.get_objects():
+        for (class_name, cls) in _COUNTED_CLASSES:
+            if isinstance(obj, cls):
+                counts[class_name] += 1
+    counts["all widgets"] = len(QtGui.QApplication.allWidgets())
+    return dict(counts)
+
+
+def get_report(models=None, retained=None):
+    """
+    Takes a memory report.
+
+    :param models: List of (name, model) tuples for the models to inspect.
+    :param retained: Dictionary of the number of objects retained in
+                     containers, keyed by container name.
+    :returns: Dictionary with the time, the process memory, the model
+              reports, the Qt object counts and the retained objects.
+    """
+    return {
+        "time": time.time(),
+        "rss": dialog_pool.get_memory_usage(),
+        "models": [get_model_report(name, model) for (name, model) in models or []],
+        "qt_objects": count_qt_objects(),
+        "retained": dict(retained or {}),
+    }
+
+
+def format_report(report, baseline=None):
+    """
+    Formats a report as text, with the growth since a baseline report.
+
+    :param report: Report returned by :meth:`get_report`.
+    :param baseline: Earlier report to compare with, or None.
+    :returns: Multi-line string.
+    """
+    def growth(value, baseline_value):
+        if baseline_value is None or value is None:
+            return ""
+        return " (%+d)" % (value - baseline_value)
+
+    def mb(value):
+        return "unknown" if value is None else "%.1f MB" % (value / (1024.0 * 1024.0))
+
+    lines = []
+    baseline_rss = baseline["rss"] if baseline else None
+    lines.append("Process memory: %s%s" % (
+        mb(report["rss"]),
+        "" if report["rss"] is None or baseline_rss is None else
+        " (%+.1f MB)" % ((report["rss"] - baseline_rss) / (1024.0 * 1024.0))
+    ))
+    if baseline:
+        lines.append("Since: %.0f seconds" % (report["time"] - baseline["time"]))
+
+    baseline_models = dict((m["name"], m) for m in (baseline or {}).get("models", []))
+    lines.append("")
+    lines.append("Models:")
+    for model_report in report["models"]:
+        baseline_rows = baseline_models.get(model_report["name"], {}).get("rows")
+        lines.append(
+            "  %s: %d rows%s, sg data %s, pixmaps %s, other roles %s" % (
+                model_report["name"],
+                model_report["rows"],
+                growth(model_report["rows"], baseline_rows),
+                mb(model_report["sg_data_bytes"]),
+                mb(model_report["pixmap_bytes"]),
+                mb(model_report["role_bytes"]),
+            )
+        )
+
+    for (title, key) in [("Qt objects", "qt_objects"), ("Retained", "retained")]:
+        lines.append("")
+        lines.append("%s:" % title)
+        baseline_counts = (baseline or {}).get(key, {})
+        for (name, count) in sorted(report[key].items()):
+            lines.append("  %s: %d%s" % (name, count, growth(count, baseline_counts.get(name))))
+
+    return "\n".join(lines)
+
+
+def run_leak_test(app, iterations=10, navigation_steps=5,
+                  max_growth_mb=DEFAULT_MAX_GROWTH_MB, max_object_growth=DEFAULT_MAX_OBJECT_GROWTH):
+    """
+    Opens the dialog without displaying it, selects items in the entity tabs
+    and closes it, repeatedly, then checks that the memory used and the number
+    of Qt objects stayed bounded. The first run is only used to warm up caches.
+
+    A QApplication must exist, but no event loop needs to be running.
+
+    :param app: The app instance.
+    :param iterations: Number of times the dialog is opened and closed.
+    :param navigation_steps: Number of items selected in each entity tab.
+    :param max_growth_mb: Maximum growth of the process memory, in megabytes.
+    :param max_object_growth: Maximum growth of the number of each kind of Qt object.
+    :returns: Text report of the growth between the first and last runs.
+    :raises TankError: If memory or objects grew more than allowed.
+    """
+    # defer imports so that the app works gracefully in batch modes
+    from .ui import resources_rc
+    from .dialog import AppDialog
+    from .loader_action_manager import LoaderActionManager
+
+    reports = []
+    for iteration in range(iterations + 1):
+        dialog = AppDialog(LoaderActionManager())
+        _process_events(0.5)
+        for view in dialog.findChildren(QtGui.QTreeView):
+            model = view.model()
+            for row in range(min(navigation_steps, model.rowCount())):
+                view.selectionModel().select(model.index(row, 0),
+                                             QtGui.QItemSelectionModel.ClearAndSelect)
+                _process_events(0.2)
+        dialog.close()
+        dialog.deleteLater()
+        dialog = None
+        _process_events(0.5)
+        gc.collect()
+        reports.append(get_report())
+        app.log_debug("Leak test run %d of %d done." % (iteration, iterations))
+
+    baseline = reports[min(1, len(reports) - 1)]
+    report = reports[-1]
+    text = format_report(report, baseline)
+
+    errors = []
+    if report["rss"] is not None and baseline["rss"] is not None:
+        growth_mb = (report["rss"] - baseline["rss"]) / (1024.0 * 1024.0)
+        if growth_mb > max_growth_mb:
+            errors.append("process memory grew by %.1f MB" % growth_mb)
+    for (name, count) in report["qt_objects"].items():
+        object_growth = count - baseline["qt_objects"].get(name, 0)
+        if object_growth > max_object_growth:
+            errors.append("%d more %s objects" % (object_growth, name))
+
+    if errors:
+        raise TankError("Memory is not bounded after %d runs: %s.\n%s" % (iterations, ", ".join(errors), text))
+    return text
+
+
+def _get_pixmap_bytes(value, seen_keys):
+    """
+    Returns the memory used by a pixmap, an image or an icon, counting
+    each of them once.
+
+    :param value: Value of a model role.
+    :param seen_keys: Set of the cache keys of the pixmaps already counted.
+    :returns: Number of bytes, or None if the value isn't a pixmap, an image or an icon.
+    """
+    if isinstance(value, QtGui.QIcon):
+        if value.cacheKey() in seen_keys:
+            return 0
+        seen_keys.add(value.cacheKey())
+        return sum(size.width() * size.height() * 4 for size in value.availableSizes())
+    if isinstance(value, (QtGui.QPixmap, QtGui.QImage)):
+        if value.cacheKey() in seen_keys:
+            return 0
+        seen_keys.add(value.cacheKey())
+        return value.width() * value.height() * value.depth() / 8
+    return None
+
+
+def _process_events(duration):
+    """
+    Processes events for a while, including deferred deletes, so that
+    background work completes as it would in a running application.
+
+    :param duration: Number of seconds to process events for.
+    """
+    end = time.time() + duration
+    while time.time() < end:
+        QtCore.QCoreApplication.processEvents(QtCore.QEventLoop.AllEvents, 50)
+        time.sleep(0.01)
+    QtCore.QCoreApplication.sendPostedEvents(None, QtCore.QEvent.DeferredDelete)
+
+
+class MemoryMonitor(QtCore.QObject):
+    """
+    Diagnostic mode taking a memory report periodically and logging how it
+    grew since the first one.
+    """
+
+    def __init__(self, parent, get_report_callback, interval):
+        """
+        :param parent: Parent QObject.
+        :param get_report_callback: Callable returning a report, see :meth:`get_report`.
+        :param interval: Number of seconds between reports.
+        """
+        QtCore.QObject.__init__(self, parent)
+        self._bundle = sgtk.platform.current_bundle()
+        self._get_report = get_report_callback
+        self._baseline = None
+
+        self._timer = QtCore.QTimer(self)
+        self._timer.setInterval(interval * 1000)
+        self._timer.timeout.connect(self.log_report)
+        self._timer.start()
+
+    def destroy(self):
+        """
+        Call this method prior to destroying this object.
+        """
+        self._timer.stop()
+
+    def get_report_text(self):
+        """
+        Takes a report and formats it with the growth since the first one.
+
+        :returns: Multi-line string.
+        """
+        report = self._get_report()
+        if self._baseline is None:
+            self._baseline = report
+        return format_report(report, self._baseline)
+
+    def log_report(self):
+        """
+        Takes a report and logs it.
+        """
+        self._bundle.log_debug("[%s] Memory report:\n%s" % (self.__class__.__name__, self.get_report_text()))
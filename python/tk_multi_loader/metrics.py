@@ -0,0 +1,244 @@
+# Copyright (c) 2015 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Registry of runtime performance metrics: counters, gauges and latency
+histograms, e.g. for queries, cache hits and misses, thumbnail compositing,
+action hooks and proxy filtering.
+
+Metrics are kept in memory for the session. They can be inspected from the
+metrics panel and dumped to a json file, see :meth:`dump`, so that sessions
+on different workstations or with different releases can be compared.
+
+Metrics are always recorded, recording one only takes a lock and a few
+additions::
+
+    metrics.increment("publish_cache.hit")
+    with metrics.timer("actions_hook"):
+        ...
+
+This module is deliberately free of any Qt dependencies.
+"""
+
+import os
+import json
+import time
+import socket
+import bisect
+import platform
+import threading
+import contextlib
+
+# upper bounds of the latency histogram buckets, in milliseconds
+HISTOGRAM_BUCKETS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000]
+
+_lock = threading.Lock()
+_counters = {}
+_gauges = {}
+_histograms = {}
+_started_at = time.time()
+
+
+class Histogram(object):
+    """
+    Distribution of latencies. Only the number of values in each bucket is
+    kept, so percentiles are estimated from the bucket bounds.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        # one more bucket for the values over the last bound
+        self.buckets = [0] * (len(HISTOGRAM_BUCKETS) + 1)
+
+    def add(self, value):
+        """
+        Records a value.
+
+        :param value: Latency in milliseconds.
+        """
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        self.buckets[bisect.bisect_left(HISTOGRAM_BUCKETS, value)] += 1
+
+    def get_percentile(self, percentile):
+        """
+        Estimates a percentile as the upper bound of the bucket holding it.
+
+        :param percentile: Percentile between 0 and 100.
+        :returns: Latency in milliseconds, or None if no values were recorded.
+        """
+        if not self.count:
+            return None
+        rank = self.count * percentile / 100.0
+        seen = 0
+        for (index, bucket_count) in enumerate(self.buckets):
+            seen += bucket_count
+            if seen >= rank:
+                if index < len(HISTOGRAM_BUCKETS):
+                    return min(HISTOGRAM_BUCKETS[index], self.max)
+                break
+        return self.max
+
+    def to_dict(self):
+        """
+        Summarizes the histogram.
+
+        :returns: Dictionary with the count, total, min, max, mean and
+                  percentiles in milliseconds, and the bucket counts.
+        """
+        return {
+            "count": self.count,
+            "total_ms": _round(self.total),
+            "min_ms": _round(self.min),
+            "max_ms": _round(self.max),
+            "mean_ms": _round(self.total / self.count) if self.count else None,
+            "p50_ms": _round(self.get_percentile(50)),
+            "p90_ms": _round(self.get_percentile(90)),
+            "p99_ms": _round(self.get_percentile(99)),
+            "buckets": dict(
+                ("<=%s" % bound if bound is not None else ">%s" % HISTOGRAM_BUCKETS[-1], count)
+                for (bound, count) in zip(HISTOGRAM_BUCKETS + [None], self.buckets)
+                if count
+            ),
+        }
+
+
+def increment(name, value=1):
+    """
+    Increments a counter.
+
+    :param name: Name of the counter, e.g. publish_cache.hit
+    :param value: Value to add.
+    """
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def set_gauge(name, value):
+    """
+    Sets the current value of a gauge, e.g. the depth of a queue.
+
+    :param name: Name of the gauge.
+    :param value: Current value.
+    """
+    with _lock:
+        _gauges[name] = value
+
+
+def observe(name, seconds):
+    """
+    Records a latency.
+
+    :param name: Name of the histogram, e.g. publish_query
+    :param seconds: Latency in seconds.
+    """
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = Histogram()
+        histogram.add(seconds * 1000.0)
+
+
+@contextlib.contextmanager
+def timer(name):
+    """
+    Records the time spent in a with statement, even if it raised.
+
+    :param name: Name of the histogram.
+    """
+    start = time.time()
+    try:
+        yield
+    finally:
+        observe(name, time.time() - start)
+
+
+def get_snapshot():
+    """
+    Returns the current value of all the metrics.
+
+    :returns: Dictionary with the counters, the gauges, the histograms and
+              the hit ratios of the counters named <name>.hit and <name>.miss.
+    """
+    with _lock:
+        counters = dict(_counters)
+        gauges = dict(_gauges)
+        histograms = dict((name, h.to_dict()) for (name, h) in _histograms.items())
+
+    ratios = {}
+    for name in counters:
+        if name.endswith(".hit"):
+            base_name = name[:-len(".hit")]
+            misses = counters.get("%s.miss" % base_name, 0)
+            ratios[base_name] = round(float(counters[name]) / (counters[name] + misses), 4)
+
+    return {
+        "counters": counters,
+        "gauges": gauges,
+        "histograms": histograms,
+        "hit_ratios": ratios,
+    }
+
+
+def reset():
+    """
+    Discards all the metrics recorded.
+    """
+    global _started_at
+    with _lock:
+        _counters.clear()
+        _gauges.clear()
+        _histograms.clear()
+        _started_at = time.time()
+
+
+def dump(path, **info):
+    """
+    Writes the current metrics to a json file, along with details about the
+    workstation so that dumps from different machines can be compared.
+
+    :param path: Path of the file to write. It is only replaced once fully written.
+    :param info: Additional values to store, e.g. the app and engine versions.
+    """
+    data = get_snapshot()
+    data.update({
+        "host": socket.gethostname(),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "pid": os.getpid(),
+        "started_at": _started_at,
+        "dumped_at": time.time(),
+    })
+    data.update(info)
+
+    folder = os.path.dirname(path)
+    if folder and not os.path.exists(folder):
+        os.makedirs(folder)
+    tmp_path = "%s.%d.tmp" % (path, os.getpid())
+    with open(tmp_path, "w") as fh:
+        json.dump(data, fh, indent=2, sort_keys=True, default=str)
+    if os.path.exists(path):
+        os.remove(path)
+    os.rename(tmp_path, path)
+
+
+def _round(value):
+    """
+    Rounds a latency to the microsecond.
+
+    :param value: Latency in milliseconds, or None.
+    :returns: Rounded latency, or None.
+    """
+    return None if value is None else round(value, 3)
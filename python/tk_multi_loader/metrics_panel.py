@@ -0,0 +1,194 @@
+# Copyright (c) 2015 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+import os
+import socket
+
+import sgtk
+from sgtk.platform.qt import QtCore, QtGui
+
+from . import metrics
+
+# folder inside the app cache location where metrics are dumped by default
+METRICS_FOLDER_NAME = "metrics"
+
+
+def get_dump_path(bundle):
+    """
+    Returns the path of the file the metrics are dumped to.
+
+    :param bundle: The app instance.
+    :returns: Path from the metrics_dump setting, or a file named after
+              the workstation in the app cache location.
+    """
+    path = (bundle.get_setting("metrics_dump") or {}).get("path")
+    if path:
+        return os.path.expanduser(os.path.expandvars(path))
+    return os.path.join(bundle.cache_location, METRICS_FOLDER_NAME, "%s.json" % socket.gethostname())
+
+
+def dump_metrics(bundle):
+    """
+    Dumps the metrics, with the versions of the app, engine and core.
+
+    :param bundle: The app instance.
+    :returns: Path of the file written, or None if it couldn't be written.
+    """
+    path = get_dump_path(bundle)
+    try:
+        metrics.dump(path,
+                     app_version=bundle.version,
+                     engine=bundle.engine.name,
+                     engine_version=bundle.engine.version,
+                     core_version=bundle.sgtk.version)
+    except (IOError, OSError) as e:
+        bundle.log_debug("Could not dump metrics to %s: %s" % (path, e))
+        return None
+    return path
+
+
+class MetricsDumper(QtCore.QObject):
+    """
+    Dumps the metrics periodically, as set in the metrics_dump setting.
+    """
+
+    def __init__(self, parent, interval):
+        """
+        :param parent: Parent QObject.
+        :param interval: Number of seconds between dumps.
+        """
+        QtCore.QObject.__init__(self, parent)
+        self._bundle = sgtk.platform.current_bundle()
+        self._timer = QtCore.QTimer(self)
+        self._timer.setInterval(interval * 1000)
+        self._timer.timeout.connect(self.dump)
+        self._timer.start()
+
+    def destroy(self):
+        """
+        Call this method prior to destroying this object. The metrics are
+        dumped a last time.
+        """
+        self._timer.stop()
+        self.dump()
+
+    def dump(self):
+        """
+        Dumps the metrics now.
+        """
+        dump_metrics(self._bundle)
+
+
+class MetricsPanel(QtGui.QDialog):
+    """
+    Debug panel listing the metrics recorded, updated while it is shown.
+    """
+
+    def __init__(self, parent):
+        """
+        :param parent: Parent widget.
+        """
+        QtGui.QDialog.__init__(self, parent)
+        self._bundle = sgtk.platform.current_bundle()
+        self.setWindowTitle("Performance Metrics")
+        self.resize(640, 480)
+
+        self._tree = QtGui.QTreeWidget(self)
+        self._tree.setHeaderLabels(["Metric", "Value", "Details"])
+        self._tree.setRootIsDecorated(True)
+        self._tree.setAlternatingRowColors(True)
+
+        self._path_label = QtGui.QLabel(self)
+        self._path_label.setTextInteractionFlags(QtCore.Qt.TextSelectableByMouse)
+
+        reset_button = QtGui.QPushButton("Reset", self)
+        reset_button.clicked.connect(self._on_reset_clicked)
+        dump_button = QtGui.QPushButton("Dump Now", self)
+        dump_button.clicked.connect(self._on_dump_clicked)
+
+        button_layout = QtGui.QHBoxLayout()
+        button_layout.addWidget(self._path_label, 1)
+        button_layout.addWidget(reset_button)
+        button_layout.addWidget(dump_button)
+
+        layout = QtGui.QVBoxLayout(self)
+        layout.addWidget(self._tree)
+        layout.addLayout(button_layout)
+
+        self._timer = QtCore.QTimer(self)
+        self._timer.setInterval(1000)
+        self._timer.timeout.connect(self._update)
+
+    def showEvent(self, event):
+        """
+        Overridden from base class. Starts updating the metrics.
+        """
+        self._update()
+        self._timer.start()
+        QtGui.QDialog.showEvent(self, event)
+
+    def hideEvent(self, event):
+        """
+        Overridden from base class. Stops updating the metrics.
+        """
+        self._timer.stop()
+        QtGui.QDialog.hideEvent(self, event)
+
+    def _update(self):
+        """
+        Lists the current metrics, keeping the sections expanded as they were.
+        """
+        snapshot = metrics.get_snapshot()
+        if self._tree.topLevelItemCount():
+            expanded = set(
+                self._tree.topLevelItem(i).text(0) for i in range(self._tree.topLevelItemCount())
+                if self._tree.topLevelItem(i).isExpanded()
+            )
+        else:
+            # only the summaries are expanded at first
+            expanded = set(["Hit Ratios", "Histograms"])
+
+        self._tree.clear()
+        sections = [
+            ("Hit Ratios", [
+                (name, "%.1f%%" % (ratio * 100), "")
+                for (name, ratio) in snapshot["hit_ratios"].items()
+            ]),
+            ("Histograms", [
+                (name, "%d" % h["count"],
+                 "mean %.1f ms, p50 %s ms, p90 %s ms, p99 %s ms, max %.1f ms"
+                 % (h["mean_ms"], h["p50_ms"], h["p90_ms"], h["p99_ms"], h["max_ms"]))
+                for (name, h) in snapshot["histograms"].items()
+            ]),
+            ("Counters", [(name, "%d" % value, "") for (name, value) in snapshot["counters"].items()]),
+            ("Gauges", [(name, "%s" % value, "") for (name, value) in snapshot["gauges"].items()]),
+        ]
+        for (title, rows) in sections:
+            section_item = QtGui.QTreeWidgetItem(self._tree, [title])
+            for row in sorted(rows):
+                QtGui.QTreeWidgetItem(section_item, list(row))
+            section_item.setExpanded(title in expanded)
+
+        for column in range(2):
+            self._tree.resizeColumnToContents(column)
+        self._path_label.setText("Dump file: %s" % get_dump_path(self._bundle))
+
+    def _on_reset_clicked(self):
+        """
+        Discards the metrics recorded so far.
+        """
+        metrics.reset()
+        self._update()
+
+    def _on_dump_clicked(self):
+        """
+        Dumps the metrics now.
+        """
+        dump_metrics(self._bundle)
@@ -12,6 +12,10 @@ import sgtk
 from sgtk.platform.qt import QtCore, QtGui
 
 # import the shotgun_model module from the shotgun utils framework
+from .refresh_checker import RefreshChecker
+from .freshness import FreshnessPolicy
+from . import cache_manager
+
 shotgun_model = sgtk.platform.import_framework("tk-framework-shotgunutils", "shotgun_model")
 ShotgunModel = shotgun_model.ShotgunModel 
 
@@ -51,19 +55,64 @@ class SgEntityModel(ShotgunModel):
                               schema_generation=4,
                               bg_load_thumbs=True,
                               bg_task_manager=bg_task_manager)
-        fields=["image", "sg_status_list", "description"]
+
+        # only run the full query on refresh when something changed
+        self._refresh_checker = RefreshChecker(self, bg_task_manager)
+        self._refresh_checker.refresh_required.connect(self._refresh_data)
+        self._refresh_checker.set_query(entity_type, filters)
+
+        # decides whether the cached tree needs to be refreshed when displayed
+        self._freshness = FreshnessPolicy("entity")
+        self._query = (entity_type, filters, hierarchy)
+        self.data_refreshed.connect(lambda _: self._freshness.mark_refreshed(*self._query))
+
+        # keep track of the cache file usage for garbage collection
+        self.data_refreshed.connect(lambda _: cache_manager.record_model_cache_use(self))
+
+        fields=["image", "sg_status_list", "description", "updated_at"]
         self._load_data(entity_type, filters, hierarchy, fields)
+        cache_manager.record_model_cache_use(self)
     
     ############################################################################################
     # public methods
+    def destroy(self):
+        """
+        Call this method prior to destroying this object.
+        This will ensure all worker threads etc are stopped.
+        """
+        self._refresh_checker.destroy()
+        ShotgunModel.destroy(self)
+
     def async_refresh(self):
         """
         Trigger an asynchronous refresh of the model
         """
-        self._refresh_data()        
+        self._refresh_data()
+
+    def async_refresh_if_stale(self):
+        """
+        Trigger an asynchronous refresh of the model, unless the freshness
+        policy considers the cached data recent enough. The full query is
+        only run if a cheap check finds changes since the last retrieval.
+        """
+        if self._freshness.needs_refresh(self.is_data_cached(), *self._query):
+            self._refresh_checker.request_refresh()
     
     ############################################################################################
     # subclassed methods
+
+    def _before_data_processing(self, sg_data_list):
+        """
+        Called just after data has been retrieved from Shotgun but before any processing
+        takes place.
+
+        :param sg_data_list: list of shotgun dictionaries, as returned by the find() call.
+        :returns: should return a list of shotgun dictionaries, on the same form as the input.
+        """
+        # remember what was retrieved so that the next refresh can be skipped
+        # if nothing changed.
+        self._refresh_checker.update_watermark(sg_data_list)
+        return sg_data_list
     
     def _populate_default_thumbnail(self, item):
         """
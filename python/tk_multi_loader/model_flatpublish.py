@@ -0,0 +1,1519 @@
+# Copyright (c) 2015 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+import os
+import time
+import urlparse
+
+from sgtk.platform.qt import QtCore, QtGui
+
+import sgtk
+from . import utils
+from . import model_item_data
+from . import latest_publishes
+from . import delta_sync
+from . import publish_query
+from . import publish_replica
+from . import tracing
+from . import metrics
+from .publish_query import sanitize_sg_data
+from .model_latestpublish import SgLatestPublishModel, get_publish_filters, is_same_publish_query
+from .model_latestpublish import get_entity_publish_filters
+from .publish_cache import PublishListingCache
+from .compact_listing import CompactListing
+from .freshness import FreshnessPolicy
+from . import cache_manager
+from .single_flight import SingleFlightDataRetriever
+
+# import the shotgun_model module from the shotgun utils framework
+shotgun_model = sgtk.platform.import_framework("tk-framework-shotgunutils", "shotgun_model")
+shotgun_data = sgtk.platform.import_framework("tk-framework-shotgunutils", "shotgun_data")
+ShotgunModel = shotgun_model.ShotgunModel
+
+
+class _PublishRecord(object):
+    """
+    Lightweight storage for a single row in the flat publish model.
+
+    Records loaded from a cached listing only hold the columns needed for
+    display and filtering, their Shotgun data is read from the listing the
+    first time it is accessed.
+    """
+    __slots__ = [
+        "_sg_data",
+        "_listing",
+        "_listing_row",
+        "is_folder",
+        "publish_id",
+        "updated_at",
+        "display_text",
+        "field_data",
+        "type_id",
+        "type_name",
+        "search_str",
+        "facet_values",
+        "tree_view_item_hash",
+        "icon",
+        "thumb_requested",
+        "availability",
+    ]
+
+    def __init__(self):
+        self._sg_data = None
+        self._listing = None
+        self._listing_row = None
+        self.is_folder = False
+        self.publish_id = None
+        self.updated_at = None
+        self.display_text = ""
+        self.field_data = None
+        self.type_id = None
+        self.type_name = None
+        self.search_str = ""
+        self.facet_values = None
+        self.tree_view_item_hash = None
+        self.icon = None
+        self.thumb_requested = False
+        self.availability = None
+
+    @property
+    def sg_data(self):
+        """
+        Shotgun data for the row.
+        """
+        if self._listing is not None:
+            self._sg_data = self._listing.get_row(self._listing_row)
+            self._listing = None
+        return self._sg_data
+
+    @sg_data.setter
+    def sg_data(self, value):
+        self._sg_data = value
+        self._listing = None
+
+    def share_data(self, record):
+        """
+        Reads the Shotgun data from the same place as another record,
+        without loading it.
+
+        :param record: Record to share the data of.
+        """
+        self._sg_data = record._sg_data
+        self._listing = record._listing
+        self._listing_row = record._listing_row
+
+
+class _QueryPart(object):
+    """
+    The publishes linked to one of the entities of a multi-selection.
+    """
+    __slots__ = ["field", "value", "sg_filters", "cache_key", "raw_sg_data", "watermark"]
+
+    def __init__(self, field, value, sg_filters):
+        """
+        :param field: Field linking the publishes to the entity, e.g. "entity" or "task".
+        :param value: The entity dictionary.
+        :param sg_filters: Shotgun filters used when the entity is selected on its own.
+        """
+        self.field = field
+        self.value = value
+        self.sg_filters = sg_filters
+        self.cache_key = None
+        self.raw_sg_data = None
+        self.watermark = None
+
+
+class _ModelSnapshot(object):
+    """
+    The rows and query state of the model, see :meth:`SgFlatPublishModel.take_snapshot`.
+    Each slot holds the value of the model attribute with the same name
+    prefixed with an underscore.
+    """
+    __slots__ = [
+        "records",
+        "associated_items",
+        "treeview_folder_items",
+        "sg_filters",
+        "cache_key",
+        "data_cached",
+        "raw_sg_data",
+        "watermark",
+        "listing",
+        "parts",
+        "type_id_aggregates",
+    ]
+
+
+class SgFlatPublishModel(QtCore.QAbstractListModel):
+    """
+    Model which handles the main spreadsheet view which displays the latest version of all
+    publishes.
+
+    This is a drop in alternative to :class:`SgLatestPublishModel` which stores its rows
+    in a plain python list rather than in QStandardItems. Data is computed on the fly
+    in :meth:`data` and thumbnails are only requested once a row is actually displayed,
+    making it suitable for very large publish listings.
+
+    All images returned by this model will be 512x400 pixels.
+    """
+
+    # use the same roles as the standard item based model so that
+    # proxy models, delegates and the dialog can be used with both.
+    TYPE_ID_ROLE = SgLatestPublishModel.TYPE_ID_ROLE
+    IS_FOLDER_ROLE = SgLatestPublishModel.IS_FOLDER_ROLE
+    ASSOCIATED_TREE_VIEW_ITEM_ROLE = SgLatestPublishModel.ASSOCIATED_TREE_VIEW_ITEM_ROLE
+    PUBLISH_TYPE_NAME_ROLE = SgLatestPublishModel.PUBLISH_TYPE_NAME_ROLE
+    SEARCHABLE_NAME = SgLatestPublishModel.SEARCHABLE_NAME
+    AVAILABILITY_ROLE = SgLatestPublishModel.AVAILABILITY_ROLE
+    PUBLISH_ID_ROLE = SgLatestPublishModel.PUBLISH_ID_ROLE
+    FACET_VALUES_ROLE = SgLatestPublishModel.FACET_VALUES_ROLE
+    SG_DATA_ROLE = ShotgunModel.SG_DATA_ROLE
+    SG_ASSOCIATED_FIELD_ROLE = ShotgunModel.SG_ASSOCIATED_FIELD_ROLE
+
+    # number of rows to add to the model in one go
+    INSERT_BATCH_SIZE = 1000
+
+    # signals matching the ones emitted by the ShotgunModel
+    query_changed = QtCore.Signal()
+    cache_loaded = QtCore.Signal()
+    data_refreshing = QtCore.Signal()
+    data_refreshed = QtCore.Signal(bool)
+    data_refresh_fail = QtCore.Signal(str)
+
+    def __init__(self, parent, publish_type_model, bg_task_manager):
+        """
+        Model which represents the latest publishes for an entity
+        """
+        QtCore.QAbstractListModel.__init__(self, parent)
+
+        self._bundle = sgtk.platform.current_bundle()
+        self._publish_type_model = publish_type_model
+        self._folder_icon = QtGui.QIcon(QtGui.QPixmap(":/res/folder_512x400.png"))
+        self._loading_icon = QtGui.QIcon(QtGui.QPixmap(":/res/loading_512x400.png"))
+        self._download_thumbs = self._bundle.get_setting("download_thumbnails")
+
+        self._records = []
+        self._associated_items = {}
+        self._treeview_folder_items = []
+        self._query_loaded = False
+
+        self._publish_entity_type = None
+        self._publish_type_field = None
+        self._publish_fields = []
+        self._publish_order = []
+        self._sg_filters = None
+        self._cache_key = None
+        self._data_cached = False
+
+        # raw results of the current query and their high-water mark,
+        # allowing refreshes to only retrieve what changed.
+        self._raw_sg_data = None
+        self._watermark = None
+
+        # cached listing the records were loaded from, if any. Raw results
+        # are only read from it when they are needed.
+        self._listing = None
+        self._type_id_aggregates = {}
+
+        # for multi-selections, the publishes of each selected entity
+        # are retrieved and cached separately, see _QueryPart.
+        self._parts = None
+
+        self._cache = PublishListingCache()
+        self._freshness = FreshnessPolicy("publish")
+
+        # local replica of the publishes of the project, if enabled
+        self._replica = publish_replica.get_replica(self._bundle)
+        self._replica_sync_uid = None
+
+        # keep track of pending requests, thumbnail requests hold the
+        # row and the record they were made for.
+        self._current_find_uid = None
+        self._thumb_requests = {}
+
+        # publish changes reported while a refresh was in progress, they
+        # are applied once it completed.
+        self._queued_changed_ids = []
+        self._queued_removed_ids = []
+        self.data_refreshed.connect(self._apply_queued_publish_changes)
+        self.data_refresh_fail.connect(self._apply_queued_publish_changes)
+
+        # trace spans of the pending requests, only while tracing is enabled
+        self._query_span = None
+        self._query_started = None
+        self._thumb_spans = {}
+
+        self._sg_data_retriever = SingleFlightDataRetriever(self, bg_task_manager)
+        self._sg_data_retriever.work_completed.connect(self._on_data_retriever_work_completed)
+        self._sg_data_retriever.work_failure.connect(self._on_data_retriever_work_failure)
+        self._sg_data_retriever.start()
+
+        # rows are built and written to the cache in the background once the
+        # publishes were retrieved, see _build_listing. These requests are
+        # not coalesced, since they are keyed on all the publishes.
+        self._current_build_uid = None
+        self._listing_retriever = shotgun_data.ShotgunDataRetriever(self, bg_task_manager=bg_task_manager)
+        self._listing_retriever.work_completed.connect(self._on_listing_built)
+        self._listing_retriever.work_failure.connect(self._on_listing_build_failure)
+        self._listing_retriever.start()
+
+    def destroy(self):
+        """
+        Call this method prior to destroying this object.
+        This will ensure all worker threads etc are stopped.
+        """
+        self._current_find_uid = None
+        self._current_build_uid = None
+        self._thumb_requests = {}
+        self._thumb_spans = {}
+        self._sg_data_retriever.stop()
+        self._listing_retriever.stop()
+        self._reset_records()
+
+    ############################################################################################
+    # public interface
+
+    def get_associated_tree_view_item(self, index):
+        """
+        Returns the entity tree view item associated with a publish folder item.
+
+        :param index: Model index of the folder.
+        :returns: item or None if not found.
+        """
+        entity_item_hash = index.data(self.ASSOCIATED_TREE_VIEW_ITEM_ROLE)
+        return self._associated_items.get(entity_item_hash)
+
+    def is_data_cached(self):
+        """
+        Determine if the model has any cached data for the current query.
+
+        :returns: True if cached data was loaded, False otherwise.
+        """
+        return self._data_cached
+
+    def load_data(self, items, child_folders, show_sub_items, additional_sg_filters):
+        """
+        Clears the model and sets it up for a particular entity.
+        Loads any cached data that exists. If the query is the one already
+        loaded, the current rows are refreshed in place instead.
+
+        :param items: Selected items in the treeview, None if nothing is selected.
+        :param child_folders: List of items ('folders') from the tree view. These are to be
+                              added to the model in addition to the publishes, so that you get a mix
+                              of folders and files.
+        :param show_sub_items: Indicates whether or not to use the sub items mode. This mode shows all publishes
+                               'below' the selected item in Shotgun and hides any folders items.
+        :param additional_sg_filters: List of shotgun filters to add to the shotgun query when retrieving publishes.
+        """
+        with tracing.span("build_publish_filters", items=len(items or [])):
+            (sg_filters, child_folders) = get_publish_filters(items,
+                                                              child_folders,
+                                                              show_sub_items,
+                                                              additional_sg_filters)
+            entity_filters = get_entity_publish_filters(items, show_sub_items, additional_sg_filters)
+
+        self._do_load_data(sg_filters, child_folders, entity_filters)
+
+    def async_refresh(self):
+        """
+        Refresh the current data set. The full query is run, since changes made
+        to linked fields don't update the publishes and would be missed by an
+        incremental retrieval, but cached data is kept and only rows which
+        changed are updated.
+        """
+        self._watermark = None
+        for part in self._parts or []:
+            part.watermark = None
+        self._refresh_data()
+
+    def apply_publish_changes(self, changed_ids, removed_ids):
+        """
+        Applies changes made to publishes, as reported by the event log watcher.
+        Only the changed publishes matching the current query are retrieved and
+        merged into the current rows.
+
+        :param changed_ids: Ids of the publishes which were created or changed.
+        :param removed_ids: Ids of the publishes which were retired.
+        """
+        if self._sg_filters is None or (self._raw_sg_data is None and self._listing is None):
+            # nothing loaded yet
+            return
+
+        if self._current_find_uid is not None or self._current_build_uid is not None:
+            # a refresh is already in progress, and may not include these
+            # changes. The event log watcher won't report them again.
+            self._queue_publish_changes(changed_ids, removed_ids)
+            return
+
+        if self._parts is not None:
+            # the changes will be picked up by the publishes of each entity
+            self._refresh_data()
+            return
+
+        self._current_find_uid = self._sg_data_retriever.execute_method(delta_sync.fetch_records,
+                                                                        self._publish_entity_type,
+                                                                        self._sg_filters,
+                                                                        self._publish_fields,
+                                                                        self._publish_order,
+                                                                        changed_ids,
+                                                                        removed_ids)
+
+    def hard_refresh(self):
+        """
+        Reloads the current query from Shotgun, ignoring any cached data.
+        Rows which are unchanged are kept as they are.
+        """
+        self._data_cached = False
+        self._watermark = None
+        for part in self._parts or []:
+            part.watermark = None
+        self._refresh_data()
+
+    def get_cache_paths(self):
+        """
+        Returns the paths of the cache files used for the current query.
+
+        :returns: List of paths.
+        """
+        if self._parts is not None:
+            return [self._cache.get_path(part.cache_key) for part in self._parts]
+        if self._cache_key is None:
+            return []
+        return [self._cache.get_path(self._cache_key)]
+
+    def get_query_fields(self):
+        """
+        Returns what is retrieved from Shotgun for a publish query, so that
+        queries can be run elsewhere, e.g. to prefetch publishes.
+
+        :returns: Tuple with the publish entity type, the list of fields and the order.
+        """
+        self._setup_query_fields()
+        return (self._publish_entity_type, self._publish_fields, self._publish_order)
+
+    def is_query_cached(self, sg_filters):
+        """
+        Checks whether the publishes for a query are stored in the cache.
+
+        :param sg_filters: Shotgun filters of the query, as returned by :meth:`get_publish_filters`.
+        :returns: True if the query is cached, False otherwise.
+        """
+        self._setup_query_fields()
+        cache_key = self._cache.compute_key(self._publish_entity_type,
+                                            sg_filters,
+                                            self._publish_fields,
+                                            self._publish_order)
+        return os.path.exists(self._cache.get_path(cache_key))
+
+    def get_prefetch_args(self, sg_filters):
+        """
+        Returns the arguments to pass to :meth:`publish_query.prefetch_listing` to
+        retrieve the publishes for a query and store them in the cache in the
+        background, without displaying them. They are then loaded from the cache
+        when the query is loaded, once :meth:`mark_prefetched` was called.
+
+        :param sg_filters: Shotgun filters of the query, as returned by :meth:`get_publish_filters`.
+        :returns: Tuple of arguments.
+        """
+        self._setup_query_fields()
+        cache_key = self._cache.compute_key(self._publish_entity_type,
+                                            sg_filters,
+                                            self._publish_fields,
+                                            self._publish_order)
+        return (self._bundle,
+                self._cache,
+                cache_key,
+                self._publish_entity_type,
+                sg_filters,
+                self._publish_fields,
+                self._publish_order,
+                self._publish_type_field)
+
+    def mark_prefetched(self, sg_filters):
+        """
+        Records that the publishes for a query were stored in the cache by
+        :meth:`publish_query.prefetch_listing`.
+
+        :param sg_filters: Shotgun filters of the query, as returned by :meth:`get_publish_filters`.
+        """
+        cache_key = self._cache.compute_key(self._publish_entity_type,
+                                            sg_filters,
+                                            self._publish_fields,
+                                            self._publish_order)
+        self._record_cache_use(cache_key)
+        self._freshness.mark_refreshed(self._publish_entity_type, sg_filters)
+
+    def clear(self):
+        """
+        Removes all rows from the model.
+        """
+        self._current_find_uid = None
+        self._current_build_uid = None
+        self._thumb_requests = {}
+        self._thumb_spans = {}
+        self._sg_filters = None
+        self._cache_key = None
+        self._data_cached = False
+        self._raw_sg_data = None
+        self._watermark = None
+        self._parts = None
+        self._treeview_folder_items = []
+        self._associated_items = {}
+        self._query_loaded = False
+        self._reset_records()
+
+    def take_snapshot(self):
+        """
+        Captures the rows and the query currently loaded, so that they can be
+        displayed again instantly with :meth:`restore_snapshot`.
+
+        The snapshot takes ownership of the cached listing the rows may be
+        read from, so this should only be called right before loading a
+        different query.
+
+        :returns: Snapshot object or None if no query is loaded.
+        """
+        if not self._query_loaded:
+            return None
+
+        snapshot = _ModelSnapshot()
+        for attr in _ModelSnapshot.__slots__:
+            setattr(snapshot, attr, getattr(self, "_%s" % attr))
+
+        # the listing is closed when the snapshot records are released
+        self._listing = None
+        return snapshot
+
+    def restore_snapshot(self, snapshot):
+        """
+        Replaces the contents of the model with a snapshot taken by
+        :meth:`take_snapshot` and revalidates it in the background.
+        A snapshot can only be restored once.
+
+        :param snapshot: Snapshot object to restore.
+        """
+        # discard any pending requests for the current query
+        self._current_find_uid = None
+        self._current_build_uid = None
+        self._thumb_requests = {}
+        self._thumb_spans = {}
+        self._close_listing()
+
+        self.beginResetModel()
+        try:
+            for attr in _ModelSnapshot.__slots__:
+                setattr(self, "_%s" % attr, getattr(snapshot, attr))
+            self._query_loaded = True
+            # thumbnails requested before the snapshot was taken were discarded
+            for record in self._records:
+                if record.icon is None:
+                    record.thumb_requested = False
+        finally:
+            self.endResetModel()
+
+        self._log_debug("Restored %d rows from snapshot." % len(self._records))
+        self._publish_type_model.set_active_types(self._type_id_aggregates)
+        self._record_cache_use()
+        for part in self._parts or []:
+            self._record_cache_use(part.cache_key)
+
+        self.query_changed.emit()
+        if self._data_cached:
+            self.cache_loaded.emit()
+
+        # the snapshot may be out of date, so always check with Shotgun
+        self._refresh_data()
+
+    ############################################################################################
+    # QAbstractListModel overrides
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        """
+        Returns the number of rows in the model.
+
+        :param parent: Parent index. Since this is a flat list, only the
+                       invalid root index has children.
+        """
+        if parent.isValid():
+            return 0
+        return len(self._records)
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        """
+        Returns the data stored under the given role for the given index.
+
+        :param index: Model index to retrieve data for.
+        :param role: Qt role to retrieve.
+        :returns: The associated data or None.
+        """
+        if not index.isValid() or index.row() >= len(self._records):
+            return None
+
+        record = self._records[index.row()]
+
+        if role == QtCore.Qt.DisplayRole:
+            return record.display_text
+
+        elif role == QtCore.Qt.DecorationRole:
+            if not record.thumb_requested:
+                self._request_thumbnail(index.row(), record)
+            if record.icon:
+                return record.icon
+            return self._folder_icon if record.is_folder else self._loading_icon
+
+        elif role == QtCore.Qt.ToolTipRole:
+            if record.is_folder or record.sg_data is None:
+                return None
+            return utils.get_publish_tooltip(record.sg_data)
+
+        elif role == self.SG_DATA_ROLE:
+            return record.sg_data
+
+        elif role == self.SG_ASSOCIATED_FIELD_ROLE:
+            return record.field_data
+
+        elif role == self.IS_FOLDER_ROLE:
+            return record.is_folder
+
+        elif role == self.TYPE_ID_ROLE:
+            return record.type_id
+
+        elif role == self.PUBLISH_TYPE_NAME_ROLE:
+            return record.type_name
+
+        elif role == self.SEARCHABLE_NAME:
+            return record.search_str
+
+        elif role == self.ASSOCIATED_TREE_VIEW_ITEM_ROLE:
+            return record.tree_view_item_hash
+
+        elif role == self.AVAILABILITY_ROLE:
+            return record.availability
+
+        elif role == self.PUBLISH_ID_ROLE:
+            return record.publish_id
+
+        elif role == self.FACET_VALUES_ROLE:
+            return record.facet_values
+
+        return None
+
+    def setData(self, index, value, role=QtCore.Qt.EditRole):
+        """
+        Sets the data of the given index. Only the availability of the
+        publishes can be set.
+
+        :param index: Model index to set data for.
+        :param value: Value to set.
+        :param role: Qt role to set.
+        :returns: True if the data was set.
+        """
+        if role != self.AVAILABILITY_ROLE or not index.isValid() or index.row() >= len(self._records):
+            return False
+
+        record = self._records[index.row()]
+        if record.availability != value:
+            record.availability = value
+            self.dataChanged.emit(index, index)
+        return True
+
+    def flags(self, index):
+        """
+        Returns the item flags for the given index.
+
+        :param index: Model index to retrieve flags for.
+        """
+        if not index.isValid():
+            return QtCore.Qt.NoItemFlags
+        return QtCore.Qt.ItemIsEnabled | QtCore.Qt.ItemIsSelectable
+
+    ############################################################################################
+    # private methods
+
+    def _do_load_data(self, sg_filters, treeview_folder_items, entity_filters=None):
+        """
+        Load and refresh data.
+
+        :param sg_filters: Shotgun filters to use for the search.
+        :param treeview_folder_items: List of items ('folders') from the tree view. These are to be
+                                      added to the model in addition to the publishes, so that you get a mix
+                                      of folders and files.
+        :param entity_filters: For multi-selections, list of (link field, linked entity, shotgun filters)
+                               tuples for each selected entity, as returned by
+                               :meth:`get_entity_publish_filters`. The publishes are then composed from
+                               the results of each entity.
+        """
+        # first figure out which fields to get from shotgun
+        self._setup_query_fields()
+
+        if self._query_loaded and is_same_publish_query(sg_filters,
+                                                        treeview_folder_items,
+                                                        self._sg_filters,
+                                                        self._treeview_folder_items):
+            # same query as the one already loaded, so just update the
+            # existing rows rather than rebuilding the model. This keeps
+            # the selection, the scroll position and loaded thumbnails.
+            self._log_debug("Query unchanged, refreshing current rows.")
+            self._refresh_data()
+            return
+
+        # discard any pending requests for the previous query
+        self._current_find_uid = None
+        self._current_build_uid = None
+        self._thumb_requests = {}
+        self._thumb_spans = {}
+
+        self._sg_filters = sg_filters
+        self._treeview_folder_items = treeview_folder_items
+        self._query_loaded = True
+        self._data_cached = False
+        self.query_changed.emit()
+
+        folder_records = self._create_folder_records()
+
+        # load cached data
+        listing = None
+        self._cache_key = None
+        self._raw_sg_data = None
+        self._watermark = None
+        self._parts = None
+        if self._sg_filters is not None and entity_filters:
+            self._load_parts(folder_records, entity_filters)
+            return
+
+        if self._sg_filters is not None:
+            self._cache_key = self._cache.compute_key(self._publish_entity_type,
+                                                      self._sg_filters,
+                                                      self._publish_fields,
+                                                      self._publish_order)
+            listing = self._cache.load(self._cache_key)
+            metrics.increment("flat_publish_model.cache.hit" if listing else "flat_publish_model.cache.miss")
+            self._record_cache_use()
+
+        if listing:
+            self._log_debug("Loaded %d publishes from cache." % listing.row_count)
+            self._data_cached = True
+            self._watermark = listing.meta.get("watermark")
+            self._set_listing_records(folder_records, listing)
+            self.cache_loaded.emit()
+        else:
+            self._set_records(folder_records, [])
+
+        # and now trigger a refresh, unless the cached data is recent enough
+        if self._freshness.needs_refresh(self._data_cached, self._publish_entity_type, self._sg_filters):
+            self._refresh_data()
+
+    def _queue_publish_changes(self, changed_ids, removed_ids):
+        """
+        Keeps publish changes until the refresh in progress completed, only
+        keeping the latest state of each publish.
+
+        :param changed_ids: Ids of the publishes which were created or changed.
+        :param removed_ids: Ids of the publishes which were retired.
+        """
+        for publish_id in changed_ids:
+            if publish_id in self._queued_removed_ids:
+                self._queued_removed_ids.remove(publish_id)
+            if publish_id not in self._queued_changed_ids:
+                self._queued_changed_ids.append(publish_id)
+        for publish_id in removed_ids:
+            if publish_id in self._queued_changed_ids:
+                self._queued_changed_ids.remove(publish_id)
+            if publish_id not in self._queued_removed_ids:
+                self._queued_removed_ids.append(publish_id)
+
+    def _apply_queued_publish_changes(self, *args):
+        """
+        Applies the publish changes reported while a refresh was in progress.
+        """
+        if self._current_find_uid is not None or self._current_build_uid is not None:
+            return
+        if not self._queued_changed_ids and not self._queued_removed_ids:
+            return
+
+        (changed_ids, removed_ids) = (self._queued_changed_ids, self._queued_removed_ids)
+        self._queued_changed_ids = []
+        self._queued_removed_ids = []
+        self._log_debug("Applying %d publish changes reported during the refresh."
+                        % (len(changed_ids) + len(removed_ids)))
+        self.apply_publish_changes(changed_ids, removed_ids)
+
+    def _setup_query_fields(self):
+        """
+        Figures out the entity type, fields and order of the publish queries.
+        """
+        (self._publish_entity_type, self._publish_fields, self._publish_order) = \
+            publish_query.get_publish_query_fields()
+        self._publish_type_field = latest_publishes.get_publish_type_field()
+
+    def _refresh_data(self):
+        """
+        Requests the publishes for the current query from Shotgun.
+        """
+        if self._sg_filters is None:
+            # no publishes should be displayed for the current selection
+            self._current_find_uid = None
+            self.data_refreshed.emit(False)
+            return
+
+        self.data_refreshing.emit()
+
+        if self._parts is not None:
+            # only retrieve the publishes of the entities which were never
+            # retrieved, and the changes for the others.
+            self._current_find_uid = self._sg_data_retriever.execute_method(
+                delta_sync.fetch_parts,
+                self._publish_entity_type,
+                self._parts[0].sg_filters[1:],
+                self._publish_fields,
+                self._publish_order,
+                [
+                    {
+                        "field": part.field,
+                        "value": part.value,
+                        "watermark": part.watermark if part.raw_sg_data is not None else None,
+                        "known_ids": [sg_data["id"] for sg_data in part.raw_sg_data or []],
+                    }
+                    for part in self._parts
+                ]
+            )
+
+        elif self._replica and self._replica.can_answer(self._sg_filters):
+            # answer the query locally, the replica is synchronized first if needed
+            self._current_find_uid = self._sg_data_retriever.execute_method(publish_replica.query_replica,
+                                                                            self._replica,
+                                                                            self._sg_filters)
+
+        elif self._watermark is not None and (self._raw_sg_data is not None or self._listing is not None):
+            # only ask for what changed since the data was last retrieved
+            if self._raw_sg_data is not None:
+                known_ids = [sg_data["id"] for sg_data in self._raw_sg_data]
+            else:
+                known_ids = self._listing.get_raw_ids()
+            self._current_find_uid = self._sg_data_retriever.execute_method(delta_sync.fetch_changes,
+                                                                            self._publish_entity_type,
+                                                                            self._sg_filters,
+                                                                            self._publish_fields,
+                                                                            self._publish_order,
+                                                                            self._watermark,
+                                                                            known_ids)
+        else:
+            self._current_find_uid = self._sg_data_retriever.execute_find(self._publish_entity_type,
+                                                                          self._sg_filters,
+                                                                          self._publish_fields,
+                                                                          self._publish_order)
+
+        # a query still running is superseded by this one
+        tracing.end(self._query_span, superseded=True)
+        self._query_started = time.time()
+        self._query_span = tracing.begin("shotgun_query",
+                                         entity_type=self._publish_entity_type,
+                                         incremental=self._watermark is not None)
+
+        if self._replica and not self._replica.is_warm and self._replica_sync_uid is None:
+            # build the replica in the background, queries go to Shotgun until it is ready
+            self._replica_sync_uid = self._sg_data_retriever.execute_method(publish_replica.sync_replica,
+                                                                            self._replica)
+
+    def _load_parts(self, folder_records, entity_filters):
+        """
+        Loads the cached publishes of each entity of a multi-selection, displays
+        their union and refreshes the entities which need it.
+
+        :param folder_records: List of folder records to display first.
+        :param entity_filters: List of (link field, linked entity, shotgun filters) tuples.
+        """
+        self._parts = []
+        needs_refresh = False
+        for (field, value, sg_filters) in entity_filters:
+            part = _QueryPart(field, value, sg_filters)
+            part.cache_key = self._cache.compute_key(self._publish_entity_type,
+                                                     sg_filters,
+                                                     self._publish_fields,
+                                                     self._publish_order)
+            listing = self._cache.load(part.cache_key)
+            metrics.increment("flat_publish_model.cache.hit" if listing else "flat_publish_model.cache.miss")
+            self._record_cache_use(part.cache_key)
+            if listing:
+                try:
+                    part.raw_sg_data = listing.get_raw_rows()
+                    part.watermark = listing.meta.get("watermark")
+                finally:
+                    listing.close()
+
+            if self._freshness.needs_refresh(part.raw_sg_data is not None,
+                                             self._publish_entity_type,
+                                             sg_filters):
+                needs_refresh = True
+            self._parts.append(part)
+
+        cached_parts = [part for part in self._parts if part.raw_sg_data is not None]
+        self._log_debug("Loaded publishes for %d of %d selected entities from cache."
+                        % (len(cached_parts), len(self._parts)))
+
+        self._set_records(folder_records, self._get_parts_sg_data())
+        if cached_parts:
+            self._data_cached = True
+            self.cache_loaded.emit()
+
+        if needs_refresh:
+            self._refresh_data()
+
+    def _get_parts_sg_data(self):
+        """
+        Returns the union of the raw publishes of each entity of a multi-selection.
+
+        :returns: List of shotgun publish dictionaries, sorted by creation time.
+        """
+        sg_data_by_id = {}
+        for part in self._parts:
+            for sg_data in part.raw_sg_data or []:
+                sg_data_by_id[sg_data["id"]] = sg_data
+        return sorted(sg_data_by_id.values(), key=lambda sg_data: sg_data.get("created_at"))
+
+    def _on_parts_retrieved(self, results):
+        """
+        Merges the publishes retrieved for each entity of a multi-selection.
+
+        :param results: Results for each part, as returned by :meth:`delta_sync.fetch_parts`.
+        """
+        refreshed = 0
+        # the freshness of all the parts is recorded at once
+        with self._freshness.batch():
+            for (part, result) in zip(self._parts, results):
+                if "sg" in result:
+                    sg_data_list = [sanitize_sg_data(sg_data) for sg_data in result["sg"]]
+                else:
+                    changes = result["changes"]
+                    if not changes["updated"] and not changes["removed_ids"]:
+                        self._freshness.mark_refreshed(self._publish_entity_type, part.sg_filters)
+                        continue
+                    changes["updated"] = [sanitize_sg_data(sg_data) for sg_data in changes["updated"]]
+                    sg_data_list = delta_sync.merge_changes(part.raw_sg_data, changes, "created_at")
+
+                part.raw_sg_data = sg_data_list
+                part.watermark = delta_sync.compute_watermark(sg_data_list)
+                self._save_part(part)
+                self._freshness.mark_refreshed(self._publish_entity_type, part.sg_filters)
+                refreshed += 1
+
+        self._log_debug("Retrieved publishes for %d of %d selected entities."
+                        % (refreshed, len(self._parts)))
+        if not refreshed:
+            self.data_refreshed.emit(False)
+            return
+
+        # the union of the parts isn't cached, each part is
+        self._build_listing(self._get_parts_sg_data(), None)
+
+    def _save_part(self, part):
+        """
+        Stores the publishes of an entity of a multi-selection in the cache, where
+        they are also found when the entity is selected on its own.
+
+        :param part: :class:`_QueryPart` to store.
+        """
+        publish_query.save_listing(self._bundle,
+                                   self._cache,
+                                   part.cache_key,
+                                   part.raw_sg_data,
+                                   part.watermark,
+                                   self._publish_type_field)
+        self._record_cache_use(part.cache_key)
+
+    def _create_folder_records(self):
+        """
+        Creates the records for the tree view items which are displayed
+        as folders in the main view.
+
+        :returns: List of records.
+        """
+        records = []
+        self._associated_items = {}
+
+        for tree_view_item in self._treeview_folder_items:
+
+            # compute and store a hash for the tree view item so that we can access it later
+            tree_view_item_hash = str(hash(tree_view_item))
+
+            # Extract the Shotgun data and field value from the tree view item.
+            (tree_view_sg_data, field_value) = model_item_data.get_item_data(tree_view_item)
+
+            record = _PublishRecord()
+            record.is_folder = True
+            record.display_text = tree_view_item.text()
+            record.search_str = tree_view_item.text()
+            record.tree_view_item_hash = tree_view_item_hash
+            record.sg_data = tree_view_sg_data
+            # Since this data will be consumed by SgPublishListDelegate._format_folder() and
+            # SgPublishThumbDelegate._format_folder(), key "value" is the only key needed.
+            record.field_data = {"value": field_value}
+            records.append(record)
+
+            # store original item, allowing us to do a reverse lookup
+            self._associated_items[tree_view_item_hash] = tree_view_item
+
+        return records
+
+    def _create_publish_records(self, sg_data_list):
+        """
+        Runs the publish filtering logic on raw Shotgun data and creates
+        a record for each of the resulting publishes. The publish type
+        model is updated with the types found.
+
+        :param sg_data_list: List of shotgun publish dictionaries.
+        :returns: List of records.
+        """
+        (records, type_id_aggregates) = self._build_publish_records(sg_data_list)
+
+        # tell the type model to reshuffle and reformat itself
+        # based on the types contained in this search
+        self._type_id_aggregates = type_id_aggregates
+        self._publish_type_model.set_active_types(type_id_aggregates)
+
+        return records
+
+    def _build_publish_records(self, sg_data_list):
+        """
+        Runs the publish filtering logic on raw Shotgun data and creates
+        a record for each of the resulting publishes.
+
+        :param sg_data_list: List of shotgun publish dictionaries.
+        :returns: Tuple with the list of records and a dictionary with the
+                  number of publishes for each type id.
+        """
+        with tracing.span("build_records", rows_in=len(sg_data_list)) as span:
+            (rows, type_id_aggregates) = publish_query.build_listing_rows(self._bundle,
+                                                                          sg_data_list,
+                                                                          self._publish_type_field)
+            span.set(rows_out=len(rows))
+        return (self._create_row_records(rows), type_id_aggregates)
+
+    def _create_row_records(self, rows):
+        """
+        Creates a record for each row built by :meth:`publish_query.build_listing_rows`.
+
+        :param rows: List of (sg_data, type_id, display_text, type_name, search_str,
+                     facet_values) tuples.
+        :returns: List of records.
+        """
+        records = []
+        for (sg_data, type_id, display_text, type_name, search_str, facet_values) in rows:
+            record = _PublishRecord()
+            record.sg_data = sg_data
+            record.publish_id = sg_data["id"]
+            record.updated_at = sg_data.get("updated_at")
+            record.type_id = type_id
+            record.display_text = display_text
+            record.type_name = type_name
+            record.search_str = search_str
+            record.facet_values = facet_values
+            record.field_data = {"name": "code", "value": display_text}
+            records.append(record)
+        return records
+
+    def _create_listing_records(self, listing):
+        """
+        Creates a record for each row of a cached listing. Their Shotgun data
+        is only read from the listing when it is accessed.
+
+        :param listing: :class:`CompactListing` to create records for.
+        :returns: List of records.
+        """
+        records = []
+        for row in range(listing.row_count):
+            record = _PublishRecord()
+            record._listing = listing
+            record._listing_row = row
+            (record.type_id,
+             record.display_text,
+             record.type_name,
+             record.search_str,
+             record.publish_id,
+             record.updated_at,
+             record.facet_values) = listing.get_columns(row)
+            record.field_data = {"name": "code", "value": record.display_text}
+            records.append(record)
+        return records
+
+    def _set_records(self, folder_records, sg_data_list):
+        """
+        Replaces the contents of the model.
+
+        :param folder_records: List of folder records to display first.
+        :param sg_data_list: List of raw shotgun publish dictionaries.
+        """
+        records = folder_records + self._create_publish_records(sg_data_list)
+        self._reset_records()
+        self._append_records(records)
+
+    def _set_listing_records(self, folder_records, listing):
+        """
+        Replaces the contents of the model with a cached listing. The rows
+        are served from the listing and their Shotgun data is only read
+        when it is accessed.
+
+        :param folder_records: List of folder records to display first.
+        :param listing: :class:`CompactListing` to display.
+        """
+        records = folder_records + self._create_listing_records(listing)
+
+        self._type_id_aggregates = listing.meta.get("type_id_aggregates", {})
+        self._publish_type_model.set_active_types(self._type_id_aggregates)
+
+        self._reset_records()
+        self._listing = listing
+        self._append_records(records)
+
+    def _reset_records(self):
+        """
+        Removes all the records from the model and closes the cached
+        listing they may have been loaded from.
+        """
+        self.beginResetModel()
+        try:
+            self._records = []
+        finally:
+            self.endResetModel()
+        self._close_listing()
+
+    def _close_listing(self):
+        """
+        Closes the cached listing the records were loaded from. Records
+        which still need their data must have read it beforehand.
+        """
+        if self._listing is not None:
+            self._listing.close()
+            self._listing = None
+
+    def _build_listing(self, sg_data_list, cache_key):
+        """
+        Runs the publish filtering logic on a new set of publishes in the
+        background, and writes the resulting rows to the cache. The rows are
+        merged into the model once they are ready, see :meth:`_on_listing_built`.
+
+        :param sg_data_list: List of raw shotgun publish dictionaries.
+        :param cache_key: Key to cache the rows under, or None if they shouldn't be cached.
+        """
+        # store the raw data before it went through any hook processing
+        # so that it can be merged with further changes.
+        self._current_build_uid = self._listing_retriever.execute_method(publish_query.build_listing,
+                                                                         self._bundle,
+                                                                         self._cache,
+                                                                         cache_key,
+                                                                         sg_data_list,
+                                                                         self._watermark,
+                                                                         self._publish_type_field)
+
+    def _replace_listing(self, listing):
+        """
+        Moves a listing written in the background into place in the cache, once
+        the records were merged from it. The listing previously loaded is closed.
+
+        :param listing: :class:`CompactListing` opened from the temporary cache file.
+        """
+        self._close_listing()
+        self._cache.commit(self._cache_key, listing)
+        self._listing = listing
+        self._record_cache_use()
+
+    def _append_records(self, records):
+        """
+        Adds records at the end of the model.
+
+        :param records: List of records to add.
+        """
+        # add rows in batches so that views can start displaying
+        # the first rows without having to deal with one signal per row.
+        with tracing.span("populate_items", rows=len(records)):
+            for start in range(0, len(records), self.INSERT_BATCH_SIZE):
+                batch = records[start:start + self.INSERT_BATCH_SIZE]
+                first = len(self._records)
+                self.beginInsertRows(QtCore.QModelIndex(), first, first + len(batch) - 1)
+                try:
+                    self._records.extend(batch)
+                finally:
+                    self.endInsertRows()
+
+    def _merge_records(self, folder_records, publish_records):
+        """
+        Updates the contents of the model with a new set of records.
+
+        Rows are matched by entity id, only rows that were removed, added or
+        modified are signaled to the views. Existing rows keep their position
+        and new rows are appended at the end.
+
+        :param folder_records: List of folder records to display first.
+        :param publish_records: List of the new publish records.
+        :returns: True if the model contents changed, False otherwise.
+        """
+        new_records = folder_records + publish_records
+        new_records_by_key = dict((self._get_record_key(r), r) for r in new_records)
+
+        # find rows to remove and rows to update
+        removed_rows = []
+        changed_rows = []
+        for (row, record) in enumerate(self._records):
+            new_record = new_records_by_key.pop(self._get_record_key(record), None)
+            if new_record is None:
+                removed_rows.append(row)
+            elif self._update_record(record, new_record):
+                changed_rows.append(row)
+
+        # whatever remains in the dictionary are new rows. Preserve
+        # the order in which they were returned.
+        added_records = [r for r in new_records if self._get_record_key(r) in new_records_by_key]
+
+        # start with the updates since row numbers are still valid
+        for (first, last) in _get_row_ranges(changed_rows):
+            self.dataChanged.emit(self.index(first, 0), self.index(last, 0))
+
+        # remove rows from the bottom up so that row numbers stay valid
+        for (first, last) in reversed(_get_row_ranges(removed_rows)):
+            self.beginRemoveRows(QtCore.QModelIndex(), first, last)
+            try:
+                del self._records[first:last + 1]
+            finally:
+                self.endRemoveRows()
+
+        self._append_records(added_records)
+
+        self._log_debug(
+            "Refresh: %d rows added, %d removed, %d updated."
+            % (len(added_records), len(removed_rows), len(changed_rows))
+        )
+        return bool(added_records or removed_rows or changed_rows)
+
+    def _update_record(self, record, new_record):
+        """
+        Updates a record in place with the data of a more recent one.
+
+        :param record: Record currently in the model.
+        :param new_record: Record holding the updated data.
+        :returns: True if the record changed, False otherwise.
+        """
+        if record.is_folder:
+            if (record.display_text == new_record.display_text and
+                    record.sg_data == new_record.sg_data):
+                return False
+        elif not self._publish_changed(record, new_record):
+            # read the refreshed data from now on, since signed thumbnail
+            # urls will have changed.
+            record.share_data(new_record)
+            return False
+
+        # only discard the loaded thumbnail if a different image is associated
+        old_image = (record.sg_data or {}).get("image")
+        new_image = (new_record.sg_data or {}).get("image")
+        keep_thumbnail = _strip_url_query(old_image) == _strip_url_query(new_image)
+
+        for attr in _PublishRecord.__slots__:
+            if keep_thumbnail and attr in ("icon", "thumb_requested"):
+                continue
+            setattr(record, attr, getattr(new_record, attr))
+
+        return True
+
+    def _publish_changed(self, record, new_record):
+        """
+        Compares two publish records on their update time and on the columns
+        stored in the listing index, without reading their Shotgun data.
+
+        Changes made to linked fields, e.g. the status of the associated
+        version, don't change the update time of a publish. They are only
+        signaled to the views if they change one of these columns, the rows
+        otherwise display the refreshed data the next time they are drawn.
+
+        :param record: Record currently held in the model.
+        :param new_record: Record just built from the refreshed data.
+        :returns: True if the records differ, False otherwise.
+        """
+        return (record.updated_at != new_record.updated_at or
+                record.type_id != new_record.type_id or
+                record.display_text != new_record.display_text or
+                record.type_name != new_record.type_name or
+                record.search_str != new_record.search_str or
+                record.facet_values != new_record.facet_values)
+
+    def _record_cache_use(self, cache_key=None):
+        """
+        Records that a cache file was used, for cache garbage collection.
+
+        :param cache_key: Key of the cache file, the one for the current query if not specified.
+        """
+        cache_key = cache_key or self._cache_key
+        if cache_key is None:
+            return
+        cache_manager.get_cache_manager().record_use(
+            self.__class__.__name__,
+            self._cache.get_path(cache_key)
+        )
+
+    def _get_record_key(self, record):
+        """
+        Returns a key uniquely identifying a record in the model.
+
+        :param record: Record to compute the key for.
+        :returns: Hashable key.
+        """
+        if record.is_folder:
+            return ("folder", record.tree_view_item_hash)
+        return ("publish", record.publish_id)
+
+    def _request_thumbnail(self, row, record):
+        """
+        Requests the thumbnail for a record in the background.
+
+        :param row: Row of the record in the model.
+        :param record: The record to load a thumbnail for.
+        """
+        record.thumb_requested = True
+
+        sg_data = record.sg_data
+        if not self._download_thumbs or not sg_data or not sg_data.get("image"):
+            return
+
+        uid = self._sg_data_retriever.request_thumbnail(sg_data["image"],
+                                                        sg_data["type"],
+                                                        sg_data["id"],
+                                                        "image",
+                                                        load_image=True)
+        self._thumb_requests[uid] = (row, record)
+        metrics.set_gauge("thumbnail_queue_depth", len(self._thumb_requests))
+        if tracing.is_enabled():
+            self._thumb_spans[uid] = tracing.begin("thumbnail_fetch", row=row)
+
+    def _on_data_retriever_work_completed(self, uid, request_type, data):
+        """
+        Signaled whenever the data retriever completes some work.
+
+        :param uid: The unique id of the work that completed
+        :param request_type: Type of work completed
+        :param data: Result of the work
+        """
+        uid = shotgun_model.sanitize_qt(uid)
+        data = shotgun_model.sanitize_qt(data)
+
+        if uid == self._current_find_uid:
+            self._current_find_uid = None
+
+            if self._parts is not None:
+                # multi-selection, the publishes of each entity are merged separately
+                self._end_query(parts=len(self._parts))
+                self._on_parts_retrieved(data["return_value"])
+                return
+
+            if request_type == "method" and isinstance(data["return_value"], list):
+                # full results read from the local replica
+                sg_data_list = data["return_value"]
+                self._log_debug("Read %d publishes from the local replica." % len(sg_data_list))
+            elif request_type == "method":
+                # incremental refresh, merge the changes into the current data
+                changes = data["return_value"]
+                if not changes["updated"] and not changes["removed_ids"]:
+                    self._log_debug("No publishes changed.")
+                    self._end_query(rows=0)
+                    self._freshness.mark_refreshed(self._publish_entity_type, self._sg_filters)
+                    self.data_refreshed.emit(False)
+                    return
+                changes["updated"] = [sanitize_sg_data(sg_data) for sg_data in changes["updated"]]
+                self._log_debug("Retrieved %d updated and %d removed publishes from Shotgun."
+                                % (len(changes["updated"]), len(changes["removed_ids"])))
+                if self._raw_sg_data is None:
+                    self._raw_sg_data = self._listing.get_raw_rows()
+                sg_data_list = delta_sync.merge_changes(self._raw_sg_data, changes, "created_at")
+            else:
+                sg_data_list = [sanitize_sg_data(sg_data) for sg_data in data["sg"]]
+                self._log_debug("Retrieved %d publishes from Shotgun." % len(sg_data_list))
+
+            self._end_query(request_type=request_type, rows=len(sg_data_list))
+
+            self._raw_sg_data = sg_data_list
+            self._watermark = delta_sync.compute_watermark(sg_data_list)
+            self._build_listing(sg_data_list, self._cache_key)
+
+        elif uid == self._replica_sync_uid:
+            # the replica only marks itself as warm once it was fully built,
+            # a failed synchronization is retried with the next refresh.
+            self._replica_sync_uid = None
+
+        elif uid in self._thumb_requests:
+            (row, record) = self._thumb_requests.pop(uid)
+            metrics.set_gauge("thumbnail_queue_depth", len(self._thumb_requests))
+            image = data.get("image")
+            tracing.end(self._thumb_spans.pop(uid, None), bytes=image.byteCount() if image else 0)
+            if not image:
+                return
+
+            # pass the thumbnail through out special image compositing methods
+            # before associating it with the model
+            with tracing.span("thumbnail_composite", width=image.width(), height=image.height()), \
+                    metrics.timer("thumbnail_composite"):
+                if record.is_folder:
+                    thumb = utils.create_overlayed_folder_thumbnail(image)
+                else:
+                    thumb = utils.create_overlayed_publish_thumbnail(image)
+                record.icon = QtGui.QIcon(thumb)
+
+            # rows are only appended or removed, so the record is usually still
+            # at the row it was requested for. Only look for it if rows were
+            # removed in the meantime.
+            if row >= len(self._records) or self._records[row] is not record:
+                try:
+                    row = self._records.index(record)
+                except ValueError:
+                    return
+            idx = self.index(row, 0)
+            self.dataChanged.emit(idx, idx)
+
+    def _on_listing_built(self, uid, request_type, data):
+        """
+        Signaled when the rows for a new set of publishes were built in the
+        background, see :meth:`_build_listing`. They are merged into the model.
+
+        :param uid: The unique id of the work that completed
+        :param request_type: Type of work completed
+        :param data: Result of the work
+        """
+        uid = shotgun_model.sanitize_qt(uid)
+        data = shotgun_model.sanitize_qt(data)
+        result = data["return_value"]
+
+        if uid != self._current_build_uid:
+            # superseded by another refresh or another query
+            if result["path"] is not None and os.path.exists(result["path"]):
+                os.remove(result["path"])
+            return
+        self._current_build_uid = None
+
+        listing = None
+        if result["path"] is not None:
+            try:
+                listing = CompactListing(result["path"])
+            except Exception as e:
+                self._log_warning("Could not read the publishes written to %s: %s" % (result["path"], e))
+                self.data_refresh_fail.emit(str(e))
+                return
+            publish_records = self._create_listing_records(listing)
+        else:
+            publish_records = self._create_row_records(result["rows"])
+
+        # tell the type model to reshuffle and reformat itself
+        # based on the types contained in this search
+        self._type_id_aggregates = result["type_id_aggregates"]
+        self._publish_type_model.set_active_types(self._type_id_aggregates)
+
+        changed = self._merge_records(self._create_folder_records(), publish_records)
+
+        if listing is not None:
+            # all the rows now read their data from the new listing
+            self._replace_listing(listing)
+        if self._parts is None:
+            self._freshness.mark_refreshed(self._publish_entity_type, self._sg_filters)
+
+        self.data_refreshed.emit(changed)
+
+    def _on_listing_build_failure(self, uid, msg):
+        """
+        Signaled when the rows for a new set of publishes could not be built.
+
+        :param uid: The unique id of the work that failed
+        :param msg: The error message
+        """
+        uid = shotgun_model.sanitize_qt(uid)
+        msg = shotgun_model.sanitize_qt(msg)
+
+        if uid == self._current_build_uid:
+            self._current_build_uid = None
+            self._log_warning("Could not process publishes: %s" % msg)
+            self.data_refresh_fail.emit(msg)
+
+    def _end_query(self, **args):
+        """
+        Records the end of the current query, see :meth:`_refresh_data`.
+
+        :param args: Values recorded with the trace span, e.g. row counts.
+        """
+        tracing.end(self._query_span, **args)
+        self._query_span = None
+        if self._query_started is not None:
+            metrics.observe("flat_publish_model.query", time.time() - self._query_started)
+            self._query_started = None
+
+    def _on_data_retriever_work_failure(self, uid, msg):
+        """
+        Signaled whenever the data retriever fails to complete some work.
+
+        :param uid: The unique id of the work that failed
+        :param msg: The error message
+        """
+        uid = shotgun_model.sanitize_qt(uid)
+        msg = shotgun_model.sanitize_qt(msg)
+
+        if uid == self._replica_sync_uid:
+            self._replica_sync_uid = None
+            self._log_debug("Could not synchronize the local replica: %s" % msg)
+
+        elif uid == self._current_find_uid:
+            self._current_find_uid = None
+            metrics.increment("flat_publish_model.query.failed")
+            self._end_query(error=msg)
+            self._log_warning("Could not retrieve publishes: %s" % msg)
+            self.data_refresh_fail.emit(msg)
+
+        elif uid in self._thumb_requests:
+            del self._thumb_requests[uid]
+            metrics.set_gauge("thumbnail_queue_depth", len(self._thumb_requests))
+            tracing.end(self._thumb_spans.pop(uid, None), error=msg)
+            self._log_debug("Could not retrieve thumbnail: %s" % msg)
+
+    def _log_debug(self, msg):
+        """
+        Convenience wrapper around debug logging
+
+        :param msg: debug message
+        """
+        self._bundle.log_debug("[%s] %s" % (self.__class__.__name__, msg))
+
+    def _log_warning(self, msg):
+        """
+        Convenience wrapper around warning logging
+
+        :param msg: warning message
+        """
+        self._bundle.log_warning("[%s] %s" % (self.__class__.__name__, msg))
+
+
+def _strip_url_query(url):
+    """
+    Removes the query string from a url, e.g. the signature of a thumbnail url.
+
+    :param url: Url to process. Non string values are returned as is.
+    :returns: Url without the query string.
+    """
+    if not isinstance(url, basestring):
+        return url
+    return urlparse.urlsplit(url)[:3]
+
+
+def _get_row_ranges(rows):
+    """
+    Groups a sorted list of row numbers into contiguous ranges.
+
+    :param rows: Sorted list of row numbers.
+    :returns: List of (first, last) tuples.
+    """
+    ranges = []
+    for row in rows:
+        if ranges and ranges[-1][1] == row - 1:
+            ranges[-1] = (ranges[-1][0], row)
+        else:
+            ranges.append((row, row))
+    return ranges
@@ -172,9 +172,13 @@ def get_item_data(item):
         model = item.model()
         if isinstance(model, QtGui.QAbstractProxyModel):
             model = model.sourceModel()
+        # imported here to avoid a circular import, the flat publish model
+        # relies on this module to extract data from tree view items.
+        from .model_flatpublish import SgFlatPublishModel
         if isinstance(model, shotgun_model.ShotgunHierarchyModel):
             type_hierarchy = True
-        elif isinstance(model, shotgun_model.ShotgunModel):
+        elif isinstance(model, (shotgun_model.ShotgunModel, SgFlatPublishModel)):
+            # The flat publish model stores its data using the ShotgunModel formats.
             type_hierarchy = False
         else:
             raise TankError("Unknown item '%s' model type '%s'!" % (text_data, type(model)))
@@ -8,13 +8,20 @@
 # agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
 # not expressly granted therein are reserved by Shotgun Software Inc.
 
+import time
 from collections import defaultdict
 from sgtk.platform.qt import QtCore, QtGui
 
 import sgtk
-import datetime
 from . import utils, constants
 from . import model_item_data
+from . import latest_publishes
+from .publish_query import get_link_filter
+from .refresh_checker import RefreshChecker
+from .freshness import FreshnessPolicy
+from . import cache_manager
+from . import tracing
+from . import metrics
 
 # import the shotgun_model module from the shotgun utils framework
 shotgun_model = sgtk.platform.import_framework("tk-framework-shotgunutils", "shotgun_model")
@@ -34,6 +41,13 @@ class SgLatestPublishModel(ShotgunModel):
     ASSOCIATED_TREE_VIEW_ITEM_ROLE = QtCore.Qt.UserRole + 103
     PUBLISH_TYPE_NAME_ROLE = QtCore.Qt.UserRole + 104
     SEARCHABLE_NAME = QtCore.Qt.UserRole + 105
+    # whether the files of a publish are on disk, see the availability module.
+    # Only set when availability badges are enabled.
+    AVAILABILITY_ROLE = QtCore.Qt.UserRole + 106
+    # publish id and facet values, see the facets module. Only served by the
+    # flat publish model, they are read from the shotgun data otherwise.
+    PUBLISH_ID_ROLE = QtCore.Qt.UserRole + 107
+    FACET_VALUES_ROLE = QtCore.Qt.UserRole + 108
 
     def __init__(self, parent, publish_type_model, bg_task_manager):
         """
@@ -44,6 +58,11 @@ class SgLatestPublishModel(ShotgunModel):
         self._folder_icon = QtGui.QIcon(QtGui.QPixmap(":/res/folder_512x400.png"))
         self._loading_icon = QtGui.QIcon(QtGui.QPixmap(":/res/loading_512x400.png"))
         self._associated_items = {}
+        self._treeview_folder_items = []
+        self._sg_filters = None
+        self._query_loaded = False
+        self._query_span = None
+        self._query_started = None
 
         app = sgtk.platform.current_bundle()
 
@@ -55,6 +74,18 @@ class SgLatestPublishModel(ShotgunModel):
                              bg_load_thumbs=True,
                              bg_task_manager=bg_task_manager)
 
+        # only run the full query on refresh when something changed
+        self._refresh_checker = RefreshChecker(self, bg_task_manager)
+        self._refresh_checker.refresh_required.connect(self._refresh_data)
+
+        # decides whether cached publishes need to be refreshed
+        self._freshness = FreshnessPolicy("publish")
+        self.data_refreshed.connect(self._on_data_refreshed)
+
+        # trace the queries run by the base class
+        self.data_refreshing.connect(self._on_data_refreshing)
+        self.data_refresh_fail.connect(self._on_data_refresh_fail)
+
     ############################################################################################
     # public interface
 
@@ -62,6 +93,7 @@ class SgLatestPublishModel(ShotgunModel):
         """
         Returns the entity tree view item associated with a publish folder item.
 
+        :param item: Publish folder item or its model index.
         :returns: item or None if not found.
         """
         entity_item_hash = item.data(self.ASSOCIATED_TREE_VIEW_ITEM_ROLE)
@@ -70,9 +102,10 @@ class SgLatestPublishModel(ShotgunModel):
     def load_data(self, items, child_folders, show_sub_items, additional_sg_filters):
         """
         Clears the model and sets it up for a particular entity.
-        Loads any cached data that exists.
+        Loads any cached data that exists. If the query is the one already
+        loaded, the current rows are refreshed in place instead.
 
-        :param item: Selected item in the treeview, None if nothing is selected.
+        :param items: Selected items in the treeview, None if nothing is selected.
         :param child_folders: List of items ('folders') from the tree view. These are to be
                               added to the model in addition to the publishes, so that you get a mix
                               of folders and files.
@@ -80,131 +113,43 @@ class SgLatestPublishModel(ShotgunModel):
                                'below' the selected item in Shotgun and hides any folders items.
         :param additional_sg_filters: List of shotgun filters to add to the shotgun query when retrieving publishes.
         """
-        app = sgtk.platform.current_bundle()
-
-        if items is None:
-            # nothing selected in the treeview
-            # passing none to _load_data indicates that no query should be executed
-            sg_filters = None
-
-        elif isinstance(items, (list, tuple)):
-            # we have a multi selection!
-            # new logic for handling multiple entity selections
-            # for simplicity sake i have removed the sub-folder logic
-            if show_sub_items:
-                # special mode -- in this case we don't show any of the
-                # child folders and only the partial matches of all the leaf nodes
-
-                # for example, this may return
-                # entity type shot, [["sequence", "is", "xxx"]] or
-                # entity type shot, [["status", "is", "ip"]] or
-
-                # note! Because of nasty bug https://bugreports.qt-project.org/browse/PYSIDE-158,
-                # we cannot pull the model directly from the item but have to pull it from
-                # the model index instead.
-                model_idx = item.index()
-                model = model_idx.model()
-                partial_filters = model.get_filters(item)
-                entity_type = model.get_entity_type()
-
-                # now get a list of matches from the above query from
-                # shotgun - note that this is a synchronous call so
-                # it may 'pause' execution briefly for the user
-                data = app.shotgun.find(entity_type, partial_filters)
-
-
-                # now create the final query for the model - this will be
-                # a big in statement listing all the ids returned from
-                # the previous query, asking the model to only show the
-                # items matching the previous query.
-                #
-                # note that for tasks, we link via the task field
-                # rather than the std entity link field
-                #
-
-                # New sg_filter for tags. We need to pull the tag applied to the Version associated with the publish
-                # In the context of a media library it should be assumed that any PublishedFile WILL have a Version associated with it.
-                # We may need to add logic to cover cases where the published file has no version.
-                if entity_type == "Task":
-                    sg_filters = [["task", "in", data]]
-                elif entity_type == "Tag":
-                    sg_filters = [["version.Version.tags", "in", data ]]
-                else:
-                    sg_filters = [["entity", "in", data]]
-
-                # lastly, when we are in this special mode, the main view
-                # is no longer functioning as a browsable hierarchy
-                # but is switching into more of a paradigm of an inverse
-                # database. Indicate the difference by not showing any folders
-                child_folders = []
-            else:
-                # standard mode - show folders and items for the currently selected item
-                # for leaf nodes and for tree nodes which are connected to an entity,
-                # show matches.
-
-                # because we might have multiple entities selected, we need to create a list to hold all our filters
-                sg_filters = []
-
-                # loop through the selected items
-                for item in items:
-                    # Extract the Shotgun data and field value from the node item.
-                    (sg_data, field_value) = model_item_data.get_item_data(item)
-
-                    if sg_data:
-                        # leaf node!
-                        # show the items associated. Handle tasks
-                        # via the task field instead of the entity field
-                        # handle tags via the publish file's Version's tags field. (Tags should always be applied
-                        # to the Version rather than the PublishedFile as we also want to be able to filter by tag
-                        # from the media page (which is shows only versions and as the published_files field in
-                        # versions is ulti-entity, we cant filter by published_files.PublishedFile.tag)
-                        if sg_data.get("type") == "Task":
-                            sg_filters.append(["task", "is", {"type": sg_data["type"], "id": sg_data["id"]} ])
-                        elif sg_data.get("type") == "Tag":
-                            sg_filters.append(["version.Version.tags", "in", {"type": sg_data["type"], "id": sg_data["id"]} ])
-                        else:
-                            sg_filters.append(["entity", "is", {"type": sg_data["type"], "id": sg_data["id"]} ])
-
-                    else:
-                        # intermediate node.
-
-                        if isinstance(field_value, dict) and "name" in field_value and "type" in field_value:
-                            # this is an intermediate node like a sequence or an asset which
-                            # can have publishes of its own associated
-                            sg_filters = [["entity", "is", field_value ]]
-
-                        else:
-                            # this is an intermediate node like status or asset type which does not
-                            # have any publishes of its own, because the value (e.g. the status or the asset type)
-                            # is nothing that you could link up a publish to.
-                            sg_filters = None
-
-        # now if sg_filters is not None (None indicates that no data should be fetched by the model),
-        # add our external filter settings
-        if sg_filters:
-            # first apply any global sg filters, as specified in the config that we should append
-            # to the main entity filters before getting publishes from shotgun. This may be stuff
-            # like 'only status appproved'
-            pub_filters = app.get_setting("publish_filters", [])
-            sg_filters.extend(pub_filters)
-
-            # now, on top of that, apply any session specific filters
-            # these typically come from the treeview and are pulled from a per-tab config setting,
-            # allowing users to configure tabs with different publish filters, so that one
-            # tab can contain approved shot publishes, another can contain only items from
-            # your current department, etc.
-            sg_filters.extend(additional_sg_filters)
+        with tracing.span("build_publish_filters", items=len(items or [])):
+            (sg_filters, child_folders) = get_publish_filters(items,
+                                                              child_folders,
+                                                              show_sub_items,
+                                                              additional_sg_filters)
 
         # now that we have establishes the sg filters and which
         # folders to load, set up the actual model
         self._do_load_data(sg_filters, child_folders)
 
+    def apply_publish_changes(self, changed_ids, removed_ids):
+        """
+        Applies changes made to publishes, as reported by the event log watcher.
+
+        The base class can't patch its data in place, so this triggers a
+        refresh, which is skipped if the current query isn't affected.
+
+        :param changed_ids: Ids of the publishes which were created or changed.
+        :param removed_ids: Ids of the publishes which were retired.
+        """
+        if self._query_loaded:
+            self._refresh_checker.request_refresh()
+
     def async_refresh(self):
         """
         Refresh the current data set
         """
         self._refresh_data()
 
+    def destroy(self):
+        """
+        Call this method prior to destroying this object.
+        This will ensure all worker threads etc are stopped.
+        """
+        self._refresh_checker.destroy()
+        ShotgunModel.destroy(self)
+
     def _set_tooltip(self, item, sg_item):
         """
         Sets a tooltip for this model item.
@@ -212,32 +157,7 @@ class SgLatestPublishModel(ShotgunModel):
         :param item: ShotgunStandardItem associated with the publish.
         :param sg_item: Publish information from Shotgun.
         """
-        tooltip = "<b>Name:</b> %s" % (sg_item.get("code") or "No name given.")
-
-        # Version 012 by John Smith at 2014-02-23 10:34
-        if not isinstance(sg_item.get("created_at"), datetime.datetime):
-            created_unixtime = sg_item.get("created_at") or 0
-            date_str = datetime.datetime.fromtimestamp(created_unixtime).strftime('%Y-%m-%d %H:%M')
-        else:
-            date_str = sg_item.get("created_at").strftime('%Y-%m-%d %H:%M')
-
-        # created_by is set to None if the user has been deleted.
-        if sg_item.get("created_by") and sg_item["created_by"].get("name"):
-            author_str = sg_item["created_by"].get("name")
-        else:
-            author_str = "Unspecified User"
-
-        version = sg_item.get("version_number")
-        vers_str = "%03d" % version if version is not None else "N/A"
-
-        tooltip += "<br><br><b>Version:</b> %s by %s at %s" % (
-            vers_str,
-            author_str,
-            date_str
-        )
-        tooltip += "<br><br><b>Path:</b> %s" % ((sg_item.get("path") or {}).get("local_path"))
-        tooltip += "<br><br><b>Description:</b> %s" % (sg_item.get("description") or "No description given.")
-
+        tooltip = utils.get_publish_tooltip(sg_item)
         item.setToolTip(tooltip)
 
     ############################################################################################
@@ -255,25 +175,42 @@ class SgLatestPublishModel(ShotgunModel):
         # first figure out which fields to get from shotgun
         app = sgtk.platform.current_bundle()
         publish_entity_type = sgtk.util.get_published_file_entity_type(app.tank)
+        self._publish_type_field = latest_publishes.get_publish_type_field()
+
+        publish_fields = [self._publish_type_field, "updated_at"] + constants.PUBLISHED_FILES_FIELDS
+
+        if self._query_loaded and is_same_publish_query(sg_filters,
+                                                        treeview_folder_items,
+                                                        self._sg_filters,
+                                                        self._treeview_folder_items):
+            # same query as the one already loaded. The base class will diff
+            # the refreshed data against the current rows rather than rebuilding
+            # the model, which keeps the selection and loaded thumbnails.
+            self._log_debug("Query unchanged, refreshing current rows.")
+            self._refresh_checker.request_refresh()
+            return
 
-        if publish_entity_type == "PublishedFile":
-            self._publish_type_field = "published_file_type"
-        else:
-            self._publish_type_field = "tank_type"
-
-        publish_fields = [self._publish_type_field] + constants.PUBLISHED_FILES_FIELDS
+        self._sg_filters = sg_filters
+        self._publish_entity_type = publish_entity_type
+        self._query_loaded = True
+        self._refresh_checker.set_query(publish_entity_type, sg_filters)
 
         # first add our folders to the model
         # make gc happy by keeping handle to all items
         self._treeview_folder_items = treeview_folder_items
 
         # load cached data
-        ShotgunModel._load_data(self,
-                               entity_type=publish_entity_type,
-                               filters=sg_filters,
-                               hierarchy=["code"],
-                               fields=publish_fields,
-                               order=[{"field_name":"created_at", "direction":"asc"}])
+        with tracing.span("cache_read") as span:
+            ShotgunModel._load_data(self,
+                                   entity_type=publish_entity_type,
+                                   filters=sg_filters,
+                                   hierarchy=["code"],
+                                   fields=publish_fields,
+                                   order=[{"field_name":"created_at", "direction":"asc"}])
+            span.set(rows=self.invisibleRootItem().rowCount())
+        cache_manager.record_model_cache_use(self)
+        metrics.increment("latest_publish_model.cache.hit" if self.is_data_cached()
+                          else "latest_publish_model.cache.miss")
 
         # now calculate type aggregates
         type_id_aggregates = defaultdict(int)
@@ -282,8 +219,51 @@ class SgLatestPublishModel(ShotgunModel):
             type_id_aggregates[type_id] += 1
         self._publish_type_model.set_active_types(type_id_aggregates)
 
-        # and now trigger a refresh
-        self._refresh_data()
+        # and now trigger a refresh, unless the cached data is recent enough
+        if self._freshness.needs_refresh(self.is_data_cached(), publish_entity_type, sg_filters):
+            self._refresh_data()
+
+    def _on_data_refreshed(self, changed):
+        """
+        Called when the data has been refreshed from Shotgun.
+
+        :param changed: True if the data changed, False otherwise.
+        """
+        self._end_query(changed=changed, rows=self.invisibleRootItem().rowCount())
+
+        self._freshness.mark_refreshed(self._publish_entity_type, self._sg_filters)
+
+        # the refresh may have written the cache file
+        cache_manager.record_model_cache_use(self)
+
+    def _on_data_refreshing(self):
+        """
+        Called when the data starts being refreshed from Shotgun.
+        """
+        tracing.end(self._query_span, superseded=True)
+        self._query_started = time.time()
+        self._query_span = tracing.begin("shotgun_query", entity_type=self._publish_entity_type)
+
+    def _on_data_refresh_fail(self, msg):
+        """
+        Called when the data could not be refreshed from Shotgun.
+
+        :param msg: Error message.
+        """
+        metrics.increment("latest_publish_model.query.failed")
+        self._end_query(error=msg)
+
+    def _end_query(self, **args):
+        """
+        Records the end of the current query, see :meth:`_on_data_refreshing`.
+
+        :param args: Values recorded with the trace span, e.g. row counts.
+        """
+        tracing.end(self._query_span, **args)
+        self._query_span = None
+        if self._query_started is not None:
+            metrics.observe("latest_publish_model.query", time.time() - self._query_started)
+            self._query_started = None
 
     ############################################################################################
     # subclassed methods
@@ -431,12 +411,14 @@ class SgLatestPublishModel(ShotgunModel):
         # pass the thumbnail through out special image compositing methods
         # before associating it with the model
         is_folder = item.data(SgLatestPublishModel.IS_FOLDER_ROLE)
-        if is_folder:
-            # composite the thumbnail nicely on top of the folder icon
-            thumb = utils.create_overlayed_folder_thumbnail(image)
-        else:
-            thumb = utils.create_overlayed_publish_thumbnail(image)
-        item.setIcon(QtGui.QIcon(thumb))
+        with tracing.span("thumbnail_composite", width=image.width(), height=image.height()), \
+                metrics.timer("thumbnail_composite"):
+            if is_folder:
+                # composite the thumbnail nicely on top of the folder icon
+                thumb = utils.create_overlayed_folder_thumbnail(image)
+            else:
+                thumb = utils.create_overlayed_publish_thumbnail(image)
+            item.setIcon(QtGui.QIcon(thumb))
 
     def _before_data_processing(self, sg_data_list):
         """
@@ -450,9 +432,13 @@ class SgLatestPublishModel(ShotgunModel):
         """
         app = sgtk.platform.current_bundle()
 
+        # remember what was retrieved so that the next refresh can be skipped
+        # if nothing changed.
+        self._refresh_checker.update_watermark(sg_data_list)
+
         # First, let the filter_publishes hook have a chance to filter the list
         # of publishes:
-        sg_data_list = utils.filter_publishes(app, sg_data_list)
+        sg_data_list = latest_publishes.filter_publishes(app, sg_data_list)
 
         # filter the shotgun data so that we only return the latest publish for each file.
         # also perform aggregate computations and push those summaries into the associated
@@ -463,85 +449,12 @@ class SgLatestPublishModel(ShotgunModel):
             self._publish_type_model.set_active_types({})
             return []
 
-        # and process sg publish data
-
-        # add data to our model and also collect a distinct
-        # list of type ids contained within this data set.
-        # count the number of times each type is used
-        type_id_aggregates = defaultdict(int)
-
-        # FIRST PASS!
-        # get a dict with only the latest versions, grouped by type and task
-        # rely on the fact that versions are returned in asc order from sg.
-        # (see filter query above)
-        #
-        # for example, if there are these publishes:
-        # name FOO, version 1, task ANIM, type XXX
-        # name FOO, version 2, task ANIM, type XXX
-        # name FOO, version 3, task ANIM, type XXX
-        # name FOO, version 1, task ANIM, type YYY
-        # name FOO, version 2, task ANIM, type YYY
-        # name FOO, version 5, task LAY,  type YYY
-        # name FOO, version 6, task LAY,  type YYY
-        # name FOO, version 7, task LAY,  type YYY
-        #
-        # three items should show up:
-        # - Foo v3 (type XXX)
-        # - Foo v2 (type YYY, task ANIM)
-        # - Foo v7 (type YYY, task LAY)
-                
-        # also, if there are cases where there are two items with the same name and the same type, 
-        # but with different tasks, indicate this with a special boolean flag
-                
-        unique_data = {}
-        name_type_aggregates = defaultdict(int)
-        
-        for sg_item in sg_data_list:
-            
-            # get the associated type
-            type_id = None
-            type_link = sg_item[self._publish_type_field]
-            if type_link:
-                type_id = type_link["id"]
-
-            # also get the associated task
-            task_id = None
-            task_link = sg_item["task"]
-            if task_link:
-                task_id = task_link["id"]  
-
-            # key publishes in dict by type and name
-            unique_data[ (sg_item["name"], type_id, task_id) ] = {"sg_item": sg_item, "type_id": type_id}
-            
-            # count how many items of this type we have
-            name_type_aggregates[ (sg_item["name"], type_id) ] += 1
-        
-        # SECOND PASS
-        # We now have the latest versions only
-        # Go ahead count types for the aggregate
-        # and assemble filtered sg data set
-        new_sg_data = []
-        for second_pass_data in unique_data.values():
-
-            # get the shotgun data for this guy
-            sg_item = second_pass_data["sg_item"]
-            
-            # now add a flag to indicate if this item is "task unique" or not
-            # e.g. if there are other items in the listing with the same name 
-            # and same type but with a different task
-            if name_type_aggregates[ (sg_item["name"], second_pass_data["type_id"]) ] > 1:
-                # there are more than one item with this same name/type combo!
-                sg_item["task_uniqueness"] = False
-            else: 
-                # no other item with this task/name/type combo
-                sg_item["task_uniqueness"] = True
-                
-            # append to new sg data
-            new_sg_data.append(sg_item)
-
-            # update our aggregate counts for the publish type view
-            type_id = second_pass_data["type_id"]
-            type_id_aggregates[type_id] += 1
+        # and process sg publish data, keeping only the latest version of
+        # each publish and counting how many times each type is used.
+        (new_sg_data, type_id_aggregates) = latest_publishes.compute_latest_publishes(
+            sg_data_list,
+            self._publish_type_field
+        )
 
         # tell the type model to reshuffle and reformat itself
         # based on the types contained in this search
@@ -565,3 +478,208 @@ class SgLatestPublishModel(ShotgunModel):
         """
         self._bundle.log_info("[%s] %s" % (self.__class__.__name__, msg))
 
+
+def get_publish_filters(items, child_folders, show_sub_items, additional_sg_filters):
+    """
+    Computes the Shotgun filters to use when retrieving the publishes associated
+    with a selection in the tree view.
+
+    :param items: Selected items in the treeview, None if nothing is selected.
+                  A single item is also accepted.
+    :param child_folders: List of items ('folders') from the tree view. These are to be
+                          added to the model in addition to the publishes, so that you get a mix
+                          of folders and files.
+    :param show_sub_items: Indicates whether or not to use the sub items mode. This mode shows all publishes
+                           'below' the selected item in Shotgun and hides any folders items.
+    :param additional_sg_filters: List of shotgun filters to add to the shotgun query when retrieving publishes.
+    :returns: Tuple with the shotgun filters and the list of child folders to display.
+              The filters are None if no publishes should be retrieved.
+    """
+    app = sgtk.platform.current_bundle()
+
+    if items is not None and not isinstance(items, (list, tuple)):
+        # a single item was passed in
+        items = [items]
+
+    if items is not None:
+        # a None entry in the list means that nothing is selected in the treeview
+        items = [item for item in items if item is not None]
+
+    # a multi-selection of entities is the union of each entity selected on its own
+    entity_filters = get_entity_publish_filters(items, show_sub_items, [])
+
+    if not items:
+        # nothing selected in the treeview
+        # passing none to _load_data indicates that no query should be executed
+        sg_filters = None
+
+    elif show_sub_items:
+        # special mode -- in this case we don't show any of the
+        # child folders and only the partial matches of all the leaf nodes
+
+        # for example, this may return
+        # entity type shot, [["sequence", "is", "xxx"]] or
+        # entity type shot, [["status", "is", "ip"]] or
+        data = []
+        for item in items:
+            # note! Because of nasty bug https://bugreports.qt-project.org/browse/PYSIDE-158,
+            # we cannot pull the model directly from the item but have to pull it from
+            # the model index instead.
+            model_idx = item.index()
+            model = model_idx.model()
+            partial_filters = model.get_filters(item)
+            entity_type = model.get_entity_type()
+
+            # now get a list of matches from the above query from
+            # shotgun - note that this is a synchronous call so
+            # it may 'pause' execution briefly for the user
+            data.extend(app.shotgun.find(entity_type, partial_filters))
+
+        # now create the final query for the model - this will be
+        # a big in statement listing all the ids returned from
+        # the previous query, asking the model to only show the
+        # items matching the previous query.
+        #
+        # note that for tasks, we link via the task field
+        # rather than the std entity link field
+        #
+
+        # New sg_filter for tags. We need to pull the tag applied to the Version associated with the publish
+        # In the context of a media library it should be assumed that any PublishedFile WILL have a Version associated with it.
+        # We may need to add logic to cover cases where the published file has no version.
+        if entity_type == "Task":
+            sg_filters = [["task", "in", data]]
+        elif entity_type == "Tag":
+            sg_filters = [["version.Version.tags", "in", data]]
+        else:
+            sg_filters = [["entity", "in", data]]
+
+        # lastly, when we are in this special mode, the main view
+        # is no longer functioning as a browsable hierarchy
+        # but is switching into more of a paradigm of an inverse
+        # database. Indicate the difference by not showing any folders
+        child_folders = []
+
+    elif entity_filters:
+        # multi-selection of entities - show the publishes linked to any of
+        # them, the union of the publishes displayed for each entity on its own.
+        link_filters = [sg_filters[0] for (_, _, sg_filters) in entity_filters]
+        sg_filters = [{"filter_operator": "any", "filters": link_filters}]
+
+    else:
+        # standard mode - show folders and items for the currently selected item
+        # for leaf nodes and for tree nodes which are connected to an entity,
+        # show matches.
+
+        # because we might have multiple entities selected, we need to create a list to hold all our filters
+        sg_filters = []
+
+        # loop through the selected items
+        for item in items:
+            # Extract the Shotgun data and field value from the node item.
+            (sg_data, field_value) = model_item_data.get_item_data(item)
+
+            if sg_data:
+                # leaf node!
+                # show the items associated, tasks and tags are linked
+                # through other fields than the entity field.
+                sg_filters.append(get_link_filter(sg_data))
+
+            else:
+                # intermediate node.
+
+                if isinstance(field_value, dict) and "name" in field_value and "type" in field_value:
+                    # this is an intermediate node like a sequence or an asset which
+                    # can have publishes of its own associated
+                    sg_filters = [["entity", "is", field_value]]
+
+                else:
+                    # this is an intermediate node like status or asset type which does not
+                    # have any publishes of its own, because the value (e.g. the status or the asset type)
+                    # is nothing that you could link up a publish to.
+                    sg_filters = None
+
+    # now if sg_filters is not None (None indicates that no data should be fetched by the model),
+    # add our external filter settings
+    if sg_filters:
+        # first apply any global sg filters, as specified in the config that we should append
+        # to the main entity filters before getting publishes from shotgun. This may be stuff
+        # like 'only status appproved'
+        pub_filters = app.get_setting("publish_filters", [])
+        sg_filters.extend(pub_filters)
+
+        # now, on top of that, apply any session specific filters
+        # these typically come from the treeview and are pulled from a per-tab config setting,
+        # allowing users to configure tabs with different publish filters, so that one
+        # tab can contain approved shot publishes, another can contain only items from
+        # your current department, etc.
+        sg_filters.extend(additional_sg_filters)
+
+    return (sg_filters, child_folders)
+
+
+def get_entity_publish_filters(items, show_sub_items, additional_sg_filters):
+    """
+    Computes the Shotgun filters to use for each entity of a multi-selection in the
+    tree view. The filters of each entity are the ones used when the entity is
+    selected on its own. The publishes of a multi-selection are the union of the
+    publishes of each entity, whether they are composed from the results of each
+    entity or retrieved with the combined filters of :meth:`get_publish_filters`.
+
+    :param items: Selected items in the treeview, None if nothing is selected.
+    :param show_sub_items: Indicates whether or not the sub items mode is used.
+    :param additional_sg_filters: List of shotgun filters to add to the shotgun query when retrieving publishes.
+    :returns: List of (link field, linked entity, shotgun filters) tuples, one per
+              selected entity, or None if the selection can't be split by entity,
+              e.g. because a single item is selected or the sub items mode is used.
+    """
+    if show_sub_items or not isinstance(items, (list, tuple)) or len(items) < 2:
+        return None
+
+    entity_filters = []
+    seen = set()
+    for item in items:
+        if item is None:
+            return None
+
+        (sg_filters, _) = get_publish_filters([item], [], False, additional_sg_filters)
+        if not sg_filters:
+            return None
+
+        # the first filter links the publishes to the selected entity
+        (field, operator, value) = sg_filters[0]
+        if operator != "is" or not isinstance(value, dict):
+            return None
+
+        key = (field, value.get("type"), value.get("id"))
+        if key not in seen:
+            seen.add(key)
+            entity_filters.append((field, value, sg_filters))
+
+    if len(entity_filters) < 2:
+        return None
+    return entity_filters
+
+
+def is_same_publish_query(sg_filters, treeview_folder_items, other_sg_filters, other_treeview_folder_items):
+    """
+    Checks if two publish queries, as returned by :meth:`get_publish_filters`, are identical.
+
+    :param sg_filters: Shotgun filters of the first query.
+    :param treeview_folder_items: List of tree view items displayed as folders by the first query.
+    :param other_sg_filters: Shotgun filters of the second query.
+    :param other_treeview_folder_items: List of tree view items displayed as folders by the second query.
+    :returns: True if both queries are identical, False otherwise.
+    """
+    if sg_filters != other_sg_filters:
+        return False
+
+    if len(treeview_folder_items) != len(other_treeview_folder_items):
+        return False
+
+    # tree view items are compared by identity
+    for (item, other_item) in zip(treeview_folder_items, other_treeview_folder_items):
+        if item is not other_item:
+            return False
+
+    return True
@@ -12,18 +12,39 @@ import sgtk
 from sgtk.platform.qt import QtCore, QtGui
 
 from . import utils, constants
+from . import latest_publishes
+from .refresh_checker import RefreshChecker
+from .freshness import FreshnessPolicy
+from . import cache_manager
+from . import metrics
+from .avatar_store import AvatarStore
+from .publish_query import sanitize_sg_data
 
 # import the shotgun_model module from the shotgun utils framework
 shotgun_model = sgtk.platform.import_framework("tk-framework-shotgunutils", "shotgun_model")
+shotgun_data = sgtk.platform.import_framework("tk-framework-shotgunutils", "shotgun_data")
 ShotgunModel = shotgun_model.ShotgunModel
 
 class SgPublishHistoryModel(ShotgunModel):
     """
     This model represents the version history for a publish.
+
+    Long histories are loaded in pages, see the history_page_size setting:
+    the newest versions are loaded and cached like any other query, older
+    ones are retrieved a page at a time when the view is scrolled to the
+    bottom and appended to the model, see :meth:`fetchMore`.
     """
 
     USER_THUMB_ROLE = QtCore.Qt.UserRole + 101
     PUBLISH_THUMB_ROLE = QtCore.Qt.UserRole + 102
+    PUBLISH_THUMB_LOADED_ROLE = QtCore.Qt.UserRole + 103
+
+    # requests made for versions which are not handled by the base class:
+    # the next page of older versions, versions pushed out of the first page
+    # by newer ones, and appended versions reported as changed.
+    _PAGE_OLDER = "older"
+    _PAGE_GAP = "gap"
+    _PAGE_UPDATE = "update"
 
     def __init__(self, parent, bg_task_manager):
         """
@@ -31,7 +52,19 @@ class SgPublishHistoryModel(ShotgunModel):
         """
         # folder icon
         self._loading_icon = QtGui.QPixmap(":/res/loading_100x100.png")
+        # all versions share the same icon until their thumbnails arrived
+        self._loading_thumb = QtGui.QIcon(
+            utils.create_overlayed_user_publish_thumbnail(self._loading_icon, None)
+        )
         app = sgtk.platform.current_bundle()
+        self._download_thumbs = app.get_setting("download_thumbnails")
+
+        # number of versions loaded at a time, 0 to load the full history
+        self._page_size = app.get_setting("history_page_size") or 0
+        self._has_more = False
+        self._entity_type = None
+        self._fields = None
+
         ShotgunModel.__init__(self,
                               parent,
                               download_thumbs=app.get_setting("download_thumbnails"),
@@ -39,6 +72,40 @@ class SgPublishHistoryModel(ShotgunModel):
                               bg_load_thumbs=True,
                               bg_task_manager=bg_task_manager)
 
+        # only run the full query on refresh when something changed
+        self._refresh_checker = RefreshChecker(self, bg_task_manager)
+        self._refresh_checker.refresh_required.connect(self._refresh_data)
+
+        # decides whether a cached history needs to be refreshed
+        self._freshness = FreshnessPolicy("history")
+        self._filters = None
+        self.data_refreshed.connect(
+            lambda _: self._freshness.mark_refreshed(self._filters)
+        )
+
+        # keep track of the cache file usage for garbage collection
+        self.data_refreshed.connect(lambda _: cache_manager.record_model_cache_use(self))
+
+        # the avatars of the authors are shared by all their versions
+        self._avatar_store = AvatarStore(self, bg_task_manager)
+        self._avatar_store.avatar_loaded.connect(self._on_avatar_loaded)
+
+        # older versions are retrieved outside of the base class, which
+        # only handles the newest page. The version number of the oldest
+        # version retrieved is kept so that the next page starts below it,
+        # and the items appended are kept, by id, to help the GC.
+        self._page_requests = {}
+        self._oldest_version = None
+        self._page_items = {}
+        self._page_retriever = shotgun_data.ShotgunDataRetriever(self, bg_task_manager=bg_task_manager)
+        self._page_retriever.work_completed.connect(self._on_page_retrieved)
+        self._page_retriever.work_failure.connect(self._on_page_failure)
+        self._page_retriever.start()
+
+        # the appended pages are dropped whenever the base class rebuilds the model
+        self.modelReset.connect(self._discard_pages)
+        self.data_refreshed.connect(self._on_first_page_refreshed)
+
 
     ############################################################################################
     # public interface
@@ -60,7 +127,7 @@ class SgPublishHistoryModel(ShotgunModel):
             publish_type_field = "tank_type"
 
         # fields to pull down
-        fields = [publish_type_field] + constants.PUBLISHED_FILES_FIELDS
+        fields = [publish_type_field, "updated_at"] + constants.PUBLISHED_FILES_FIELDS
 
         # when we filter out which other publishes are associated with this one,
         # to effectively get the "version history", we look for items
@@ -78,14 +145,75 @@ class SgPublishHistoryModel(ShotgunModel):
         pub_filters = app.get_setting("publish_filters", [])
         filters.extend(pub_filters)
 
-        ShotgunModel._load_data(self,
-                                entity_type=publish_entity_type,
-                                filters=filters,
-                                hierarchy=["version_number"],
-                                fields=fields)
+        self._refresh_checker.set_query(publish_entity_type, filters)
 
-        self._refresh_data()
+        # start with the newest versions, whatever the length of the history
+        self._entity_type = publish_entity_type
+        self._fields = fields
+        self._filters = filters
+        self._discard_pages()
+        self._load_first_page()
+        metrics.increment("publish_history_model.cache.hit" if self.is_data_cached()
+                          else "publish_history_model.cache.miss")
+
+        if self._freshness.needs_refresh(self.is_data_cached(), filters):
+            self._refresh_data()
+
+    def canFetchMore(self, parent):
+        """
+        Overridden from base class. Checks whether older versions can be loaded.
+
+        :param parent: Model index of the parent.
+        :returns: True if more versions may exist.
+        """
+        if parent.isValid():
+            return ShotgunModel.canFetchMore(self, parent)
+        return self._has_more
+
+    def fetchMore(self, parent):
+        """
+        Overridden from base class. Called by views when they are scrolled to
+        the bottom, retrieves the next page of older versions, which are
+        appended to the model once retrieved.
+
+        :param parent: Model index of the parent.
+        """
+        if parent.isValid():
+            return ShotgunModel.fetchMore(self, parent)
+        if not self._has_more or any(
+                kind == self._PAGE_OLDER for (kind, _) in self._page_requests.values()):
+            return
+
+        oldest_version = self._get_oldest_version()
+        if oldest_version is None:
+            self._has_more = False
+            return
+
+        self._log_debug("Retrieving %d versions older than v%03d." % (self._page_size, oldest_version))
+        self._request_versions(self._PAGE_OLDER,
+                               [["version_number", "less_than", oldest_version]],
+                               limit=self._page_size)
+
+
+    def apply_publish_changes(self, changed_ids, removed_ids):
+        """
+        Applies changes made to publishes, as reported by the event log watcher.
+
+        The base class can't patch its data in place, so this triggers a
+        refresh, which is skipped if the current history isn't affected.
+
+        :param changed_ids: Ids of the publishes which were created or changed.
+        :param removed_ids: Ids of the publishes which were retired.
+        """
+        if self.rowCount() == 0:
+            # no history displayed, e.g. the model was cleared
+            return
+        self._refresh_checker.request_refresh()
 
+        # the base class doesn't know about the older versions appended
+        page_ids = [x for x in list(changed_ids) + list(removed_ids) if x in self._page_items]
+        if page_ids:
+            self._request_versions(self._PAGE_UPDATE, [["id", "in", page_ids]], page_ids=page_ids)
 
     def async_refresh(self):
         """
@@ -93,6 +221,17 @@ class SgPublishHistoryModel(ShotgunModel):
         """
         self._refresh_data()
 
+    def destroy(self):
+        """
+        Call this method prior to destroying this object.
+        This will ensure all worker threads etc are stopped.
+        """
+        self._refresh_checker.destroy()
+        self._avatar_store.destroy()
+        self._page_requests = {}
+        self._page_retriever.stop()
+        ShotgunModel.destroy(self)
+
     ############################################################################################
     # subclassed methods
 
@@ -120,15 +259,12 @@ class SgPublishHistoryModel(ShotgunModel):
             item.setText("%03d" % sg_data.get("version_number"))
 
 
-        # see if we can get a thumbnail for the user
+        # see if we can get a thumbnail for the user. A history usually has
+        # a handful of authors, so avatars are only downloaded once per user.
         if sg_data.get("created_by.HumanUser.image"):
-            # get the thumbnail - store the unique id we get back from
-            # the data retrieve in a dict for fast lookup later
-            self._request_thumbnail_download(item,
-                                             "created_by.HumanUser.image",
-                                             sg_data["created_by.HumanUser.image"],
-                                             sg_data["created_by"]["type"],
-                                             sg_data["created_by"]["id"])
+            if self._avatar_store.request_avatar(sg_data["created_by"],
+                                                 sg_data["created_by.HumanUser.image"]):
+                self._set_avatar(item, sg_data["created_by"]["id"])
 
 
     def _before_data_processing(self, sg_data_list):
@@ -143,7 +279,16 @@ class SgPublishHistoryModel(ShotgunModel):
         """
         app = sgtk.platform.current_bundle()
 
-        return utils.filter_publishes(app, sg_data_list)
+        # remember what was retrieved so that the next refresh can be skipped
+        # if nothing changed.
+        self._refresh_checker.update_watermark(sg_data_list)
+
+        # older versions exist if the first page is full, before any filtering.
+        # Once older pages were appended, the last one tells.
+        if self._oldest_version is None:
+            self._has_more = bool(self._page_size) and len(sg_data_list) >= self._page_size
+
+        return latest_publishes.filter_publishes(app, sg_data_list)
 
 
     def _populate_default_thumbnail(self, item):
@@ -156,9 +301,9 @@ class SgPublishHistoryModel(ShotgunModel):
         """
         # set up publishes with a "thumbnail loading" icon
         item.setData(self._loading_icon, SgPublishHistoryModel.PUBLISH_THUMB_ROLE)
-        thumb = utils.create_overlayed_user_publish_thumbnail(item.data(SgPublishHistoryModel.PUBLISH_THUMB_ROLE),
-                                                              None)
-        item.setIcon(QtGui.QIcon(thumb))
+        item.setIcon(self._loading_thumb)
+        # the avatar may already be known, e.g. when the publish has no thumbnail
+        self._update_thumbnail(item)
 
     def _populate_thumbnail_image(self, item, field, image, path):
         """
@@ -182,16 +327,255 @@ class SgPublishHistoryModel(ShotgunModel):
         :param field: The Shotgun field which the thumbnail is associated with.
         :param path: A path on disk to the thumbnail. This is a file in jpeg format.
         """
-        if field == "image":
-            thumb = QtGui.QPixmap.fromImage(image)
-            item.setData(thumb, SgPublishHistoryModel.PUBLISH_THUMB_ROLE)
-        else:
-            thumb = QtGui.QPixmap.fromImage(image)
-            item.setData(thumb, SgPublishHistoryModel.USER_THUMB_ROLE)
+        if field != "image":
+            # avatars are downloaded by the avatar store
+            return
+
+        thumb = QtGui.QPixmap.fromImage(image)
+        item.setData(thumb, SgPublishHistoryModel.PUBLISH_THUMB_ROLE)
+        item.setData(True, SgPublishHistoryModel.PUBLISH_THUMB_LOADED_ROLE)
+        self._update_thumbnail(item)
+
+    ############################################################################################
+    # private methods
+
+    def _load_first_page(self):
+        """
+        Loads the newest versions of the history, from the cache if possible.
+        """
+        ShotgunModel._load_data(self,
+                                entity_type=self._entity_type,
+                                filters=self._filters,
+                                hierarchy=["version_number"],
+                                fields=self._fields,
+                                order=[{"field_name": "version_number", "direction": "desc"}],
+                                limit=self._page_size or None)
+        cache_manager.record_model_cache_use(self)
+
+        # assume older versions exist if the cached page is full,
+        # this is checked again when the history is retrieved.
+        self._has_more = bool(self._page_size) and self.rowCount() >= self._page_size
+
+    def _discard_pages(self):
+        """
+        Forgets about the older pages appended to the model, e.g. when
+        another history is loaded.
+        """
+        self._page_requests = {}
+        self._oldest_version = None
+        self._page_items = {}
+
+    def _get_oldest_version(self):
+        """
+        Returns the version number the next page of older versions starts below.
+
+        :returns: Version number, or None if no version is loaded.
+        """
+        if self._oldest_version is not None:
+            return self._oldest_version
+        version_numbers = self._get_version_numbers(first_page=True)
+        return min(version_numbers) if version_numbers else None
+
+    def _get_version_numbers(self, first_page):
+        """
+        Returns the version numbers loaded by the base class, or appended.
+
+        :param first_page: True for the versions loaded by the base class,
+                           False for the versions appended.
+        :returns: List of version numbers.
+        """
+        version_numbers = []
+        root = self.invisibleRootItem()
+        for row in range(root.rowCount()):
+            sg_data = root.child(row).get_sg_data()
+            if not sg_data or sg_data.get("version_number") is None:
+                continue
+            if (sg_data["id"] in self._page_items) != first_page:
+                version_numbers.append(sg_data["version_number"])
+        return version_numbers
+
+    def _on_first_page_refreshed(self, changed):
+        """
+        Called when the base class refreshed the newest versions. New versions
+        push the oldest ones out of the first page, they are retrieved again
+        if older versions were appended below them.
+
+        :param changed: True if the versions changed.
+        """
+        if not changed or not self._page_items:
+            return
+
+        first_page_versions = self._get_version_numbers(first_page=True)
+        appended_versions = self._get_version_numbers(first_page=False)
+        if not first_page_versions or not appended_versions:
+            return
+
+        self._request_versions(self._PAGE_GAP, [
+            ["version_number", "less_than", min(first_page_versions)],
+            ["version_number", "greater_than", max(appended_versions)],
+        ])
+
+    def _request_versions(self, kind, filters, limit=None, page_ids=None):
+        """
+        Retrieves versions of the history in the background.
+
+        :param kind: Kind of request, one of the _PAGE constants.
+        :param filters: Shotgun filters added to the filters of the history.
+        :param limit: Maximum number of versions to retrieve.
+        :param page_ids: Ids of the appended versions updated by a _PAGE_UPDATE request.
+        """
+        uid = self._page_retriever.execute_find(
+            self._entity_type,
+            self._filters + filters,
+            self._fields,
+            [{"field_name": "version_number", "direction": "desc"}],
+            limit=limit or 0
+        )
+        self._page_requests[uid] = (kind, page_ids or [])
+
+    def _on_page_retrieved(self, uid, request_type, data):
+        """
+        Signaled whenever the page data retriever completes some work.
+
+        :param uid: The unique id of the work that completed
+        :param request_type: Type of work completed
+        :param data: Result of the work
+        """
+        uid = shotgun_model.sanitize_qt(uid)
+        if uid not in self._page_requests:
+            return
+        (kind, page_ids) = self._page_requests.pop(uid)
+
+        data = shotgun_model.sanitize_qt(data)
+        sg_data_list = [sanitize_sg_data(sg_data) for sg_data in data["sg"]]
+        self._log_debug("Retrieved %d versions (%s)." % (len(sg_data_list), kind))
+
+        if kind == self._PAGE_OLDER:
+            self._has_more = len(sg_data_list) >= self._page_size
+            if sg_data_list:
+                self._oldest_version = min(sg_data["version_number"] for sg_data in sg_data_list)
+            else:
+                self._oldest_version = self._get_oldest_version()
+
+        app = sgtk.platform.current_bundle()
+        sg_data_list = latest_publishes.filter_publishes(app, sg_data_list)
+
+        # appended versions which don't match the history anymore are
+        # removed, the others are updated in place.
+        updated_ids = set(sg_data["id"] for sg_data in sg_data_list)
+        for publish_id in page_ids:
+            item = self._page_items.get(publish_id)
+            if item is not None and publish_id not in updated_ids:
+                del self._page_items[publish_id]
+                self.removeRow(item.row())
+
+        for sg_data in sg_data_list:
+            item = self._page_items.get(sg_data["id"])
+            if item is not None:
+                item.setData(sg_data, SgPublishHistoryModel.SG_DATA_ROLE)
+            else:
+                self._append_version(sg_data)
+
+    def _on_page_failure(self, uid, msg):
+        """
+        Signaled whenever the page data retriever fails to complete some work.
 
-        # composite the user thumbnail and the publish thumb into a single image
-        thumb = utils.create_overlayed_user_publish_thumbnail(item.data(SgPublishHistoryModel.PUBLISH_THUMB_ROLE),
-                                                              item.data(SgPublishHistoryModel.USER_THUMB_ROLE))
+        :param uid: The unique id of the work that failed
+        :param msg: The error message
+        """
+        uid = shotgun_model.sanitize_qt(uid)
+        if uid not in self._page_requests:
+            return
+        (kind, _) = self._page_requests.pop(uid)
+        # older versions are retrieved again the next time the view is scrolled
+        self._log_debug("Could not retrieve versions (%s): %s" % (kind, msg))
+
+    def _append_version(self, sg_data):
+        """
+        Appends an older version to the model, set up the same way as the
+        versions loaded by the base class.
+
+        :param sg_data: Shotgun data of the version.
+        """
+        item = shotgun_model.ShotgunStandardItem(str(sg_data.get("version_number")))
+        item.setEditable(False)
+        item.setData(sg_data, SgPublishHistoryModel.SG_DATA_ROLE)
+        item.setData(
+            {"name": "version_number", "value": sg_data.get("version_number")},
+            SgPublishHistoryModel.SG_ASSOCIATED_FIELD_ROLE
+        )
+        self._populate_default_thumbnail(item)
+        self._populate_item(item, sg_data)
+        if self._download_thumbs and sg_data.get("image"):
+            self._request_thumbnail_download(item, "image", sg_data["image"], sg_data["type"], sg_data["id"])
+
+        self.appendRow(item)
+        self._page_items[sg_data["id"]] = item
+
+    def _on_avatar_loaded(self, user_id):
+        """
+        Called when the avatar of a user was downloaded, or couldn't be.
+
+        :param user_id: Id of the user.
+        """
+        root = self.invisibleRootItem()
+        for row in range(root.rowCount()):
+            item = root.child(row)
+            sg_data = item.get_sg_data()
+            if sg_data and (sg_data.get("created_by") or {}).get("id") == user_id:
+                self._set_avatar(item, user_id)
+
+    def _set_avatar(self, item, user_id):
+        """
+        Associates the avatar of its author with a version, once it was downloaded.
+
+        :param item: QStandardItem of the version.
+        :param user_id: Id of the author.
+        """
+        avatar = self._avatar_store.get_avatar(user_id)
+        if avatar:
+            item.setData(avatar, SgPublishHistoryModel.USER_THUMB_ROLE)
+        self._update_thumbnail(item)
+
+    def _update_thumbnail(self, item):
+        """
+        Composites the user thumbnail and the publish thumb into a single image,
+        once both were downloaded. Versions keep the loading icon until then, so
+        that each version is only composited once.
+
+        :param item: QStandardItem of the version.
+        """
+        sg_data = item.get_sg_data()
+        if not sg_data:
+            return
+
+        publish_loaded = bool(item.data(SgPublishHistoryModel.PUBLISH_THUMB_LOADED_ROLE))
+        if not publish_loaded and self._download_thumbs and sg_data.get("image"):
+            # waiting for the publish thumbnail
+            return
+
+        user_thumb = item.data(SgPublishHistoryModel.USER_THUMB_ROLE)
+        if (sg_data.get("created_by.HumanUser.image") and
+                not self._avatar_store.is_avatar_loaded(sg_data["created_by"]["id"])):
+            # waiting for the avatar
+            return
+
+        if not publish_loaded and not user_thumb:
+            # nothing to composite, the loading icon is kept
+            return
+
+        with metrics.timer("history_thumbnail_composite"):
+            thumb = utils.create_overlayed_user_publish_thumbnail(
+                item.data(SgPublishHistoryModel.PUBLISH_THUMB_ROLE),
+                user_thumb
+            )
         item.setIcon(QtGui.QIcon(thumb))
 
+    def _log_debug(self, msg):
+        """
+        Convenience wrapper around debug logging
 
+        :param msg: debug message
+        """
+        app = sgtk.platform.current_bundle()
+        app.log_debug("[%s] %s" % (self.__class__.__name__, msg))
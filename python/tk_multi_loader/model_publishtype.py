@@ -12,6 +12,9 @@ import sgtk
 from sgtk.platform.qt import QtCore, QtGui
 
 # import the shotgun_model module from the shotgun utils framework
+from .freshness import FreshnessPolicy
+from . import tracing
+
 shotgun_model = sgtk.platform.import_framework("tk-framework-shotgunutils", "shotgun_model") 
 ShotgunModel = shotgun_model.ShotgunModel 
 
@@ -79,8 +82,14 @@ class SgPublishTypeModel(ShotgunModel):
                                 fields=["code", "id"],
                                 seed=mappings_str)
         
-        # and finally ask model to refresh itself
-        self._refresh_data()
+        # and finally ask model to refresh itself, unless the
+        # cached publish types are recent enough.
+        self._freshness = FreshnessPolicy("publish_type")
+        self.data_refreshed.connect(
+            lambda _: self._freshness.mark_refreshed(publish_type_field, mappings_str)
+        )
+        if self._freshness.needs_refresh(self.is_data_cached(), publish_type_field, mappings_str):
+            self._refresh_data()
 
     def destroy(self):
         """
@@ -158,6 +167,7 @@ class SgPublishTypeModel(ShotgunModel):
         return type_ids
         
         
+    @tracing.traced("type_aggregation")
     def set_active_types(self, type_aggregates):
         """
         Specifies which types are currently active. Also adjust the sort role,
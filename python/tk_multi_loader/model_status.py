@@ -12,6 +12,8 @@ import sgtk
 from sgtk.platform.qt import QtCore, QtGui
 
 # import the shotgun_model module from the shotgun utils framework
+from .freshness import FreshnessPolicy
+
 shotgun_model = sgtk.platform.import_framework("tk-framework-shotgunutils", "shotgun_model") 
 ShotgunModel = shotgun_model.ShotgunModel 
 
@@ -31,7 +33,12 @@ class SgStatusModel(ShotgunModel):
                               bg_task_manager=bg_task_manager)
         fields=["bg_color", "icon", "code", "name"]
         self._load_data("Status", [], ["code"], fields)
-        self._refresh_data()
+
+        # statuses rarely change, only refresh them when the cache is stale
+        self._freshness = FreshnessPolicy("status")
+        self.data_refreshed.connect(lambda _: self._freshness.mark_refreshed("Status", fields))
+        if self._freshness.needs_refresh(self.is_data_cached(), "Status", fields):
+            self._refresh_data()
     
     ############################################################################################
     # public methods
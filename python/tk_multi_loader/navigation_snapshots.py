@@ -0,0 +1,107 @@
+# Copyright (c) 2015 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Snapshots of the publish view for recently visited selections, allowing the
+back and forward buttons to restore a previous selection instantly, in the
+same way as the back-forward cache of a web browser.
+"""
+
+# number of snapshots to keep
+MAX_SNAPSHOTS = 10
+
+
+class NavigationSnapshot(object):
+    """
+    State of the publish view for a selection in the tree view.
+    """
+    __slots__ = ["model_snapshot", "selected_rows", "scroll_position"]
+
+    def __init__(self, model_snapshot, selected_rows, scroll_position):
+        """
+        :param model_snapshot: Snapshot of the publish model rows, as returned
+                               by :meth:`SgFlatPublishModel.take_snapshot`.
+        :param selected_rows: List of the selected rows in the publish model.
+        :param scroll_position: Position of the vertical scroll bar of the publish view.
+        """
+        self.model_snapshot = model_snapshot
+        self.selected_rows = selected_rows
+        self.scroll_position = scroll_position
+
+
+class NavigationSnapshotCache(object):
+    """
+    Bounded cache of navigation snapshots, the least recently stored
+    snapshots are discarded first.
+    """
+
+    def __init__(self, max_snapshots=MAX_SNAPSHOTS):
+        """
+        :param max_snapshots: Maximum number of snapshots to keep.
+        """
+        self._max_snapshots = max_snapshots
+        # list of (query, snapshot) tuples, most recent last
+        self._entries = []
+
+    def store(self, query, snapshot):
+        """
+        Stores the snapshot for a publish query, replacing any previous one.
+
+        :param query: Publish query, see :meth:`is_same_publish_query`.
+        :param snapshot: :class:`NavigationSnapshot` to store.
+        """
+        self.take(query)
+        self._entries.append((query, snapshot))
+        del self._entries[:-self._max_snapshots]
+
+    def take(self, query):
+        """
+        Removes and returns the snapshot for a publish query.
+
+        :param query: Publish query, see :meth:`is_same_publish_query`.
+        :returns: :class:`NavigationSnapshot` or None if there is none.
+        """
+        for (i, (entry_query, snapshot)) in enumerate(self._entries):
+            if is_same_publish_query(query, entry_query):
+                del self._entries[i]
+                return snapshot
+        return None
+
+    def clear(self):
+        """
+        Discards all the snapshots.
+        """
+        self._entries = []
+
+
+def is_same_publish_query(query, other_query):
+    """
+    Checks whether two publish queries are identical.
+
+    :param query: Tuple with the selected tree view items, the child folders,
+                  the sub items mode and the publish filters.
+    :param other_query: Query to compare with.
+    :returns: True if both queries are identical, False otherwise.
+    """
+    (items, child_folders, show_sub_items, publish_filters) = query
+    (other_items, other_child_folders, other_show_sub_items, other_publish_filters) = other_query
+
+    if show_sub_items != other_show_sub_items or publish_filters != other_publish_filters:
+        return False
+
+    # tree view items are compared by identity
+    for (a, b) in [(items, other_items), (child_folders, other_child_folders)]:
+        if len(a) != len(b):
+            return False
+        for (item, other_item) in zip(a, b):
+            if item is not other_item:
+                return False
+
+    return True
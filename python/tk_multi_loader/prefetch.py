@@ -0,0 +1,189 @@
+# Copyright (c) 2015 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Background prefetching of the publishes users are likely to look at next,
+e.g. the ones of the context entity, of their tasks or of the siblings of
+the selected entity, so that selecting them displays cached data straight away.
+"""
+
+import sgtk
+from sgtk.platform.qt import QtCore
+
+from . import publish_query
+from .single_flight import SingleFlightDataRetriever
+
+shotgun_model = sgtk.platform.import_framework("tk-framework-shotgunutils", "shotgun_model")
+
+# budget used when not configured
+DEFAULT_MAX_TASKS = 5
+DEFAULT_MAX_SIBLINGS = 10
+DEFAULT_MAX_CONCURRENT_REQUESTS = 2
+DEFAULT_MAX_RECORDS = 20000
+DEFAULT_IDLE_DELAY = 3
+
+
+class PublishPrefetcher(QtCore.QObject):
+    """
+    Retrieves publishes in the background and stores them in the cache of
+    a :class:`SgFlatPublishModel`, within the budget set by the prefetch setting:
+
+    - max_tasks: number of the user's tasks to prefetch.
+    - max_siblings: number of siblings of the selected entity to prefetch.
+    - max_concurrent_requests: number of queries run at the same time.
+    - max_records: number of publishes which can be retrieved during the session.
+    - idle_delay: number of seconds without any call to :meth:`prefetch`
+      before queries are started.
+
+    Each query and the processing and caching of its results run in a single
+    background task, so that large listings don't block the UI. Prefetches go
+    through the single flight layer, so the same query is never prefetched
+    twice at the same time.
+    """
+
+    def __init__(self, parent, publish_model, bg_task_manager):
+        """
+        :param parent: Parent QObject.
+        :param publish_model: :class:`SgFlatPublishModel` to prefetch publishes for.
+        :param bg_task_manager: Background task manager to use to run queries.
+        """
+        QtCore.QObject.__init__(self, parent)
+        self._bundle = sgtk.platform.current_bundle()
+        self._publish_model = publish_model
+
+        settings = self._bundle.get_setting("prefetch") or {}
+        self._max_tasks = settings.get("max_tasks", DEFAULT_MAX_TASKS)
+        self._max_siblings = settings.get("max_siblings", DEFAULT_MAX_SIBLINGS)
+        self._max_concurrent_requests = settings.get("max_concurrent_requests", DEFAULT_MAX_CONCURRENT_REQUESTS)
+        self._remaining_records = settings.get("max_records", DEFAULT_MAX_RECORDS)
+
+        # queries waiting to be run and queries in flight, keyed by request uid
+        self._queue = []
+        self._pending = {}
+
+        self._idle_timer = QtCore.QTimer(self)
+        self._idle_timer.setSingleShot(True)
+        self._idle_timer.setInterval(settings.get("idle_delay", DEFAULT_IDLE_DELAY) * 1000)
+        self._idle_timer.timeout.connect(self._run_queries)
+
+        self._sg_data_retriever = SingleFlightDataRetriever(self, bg_task_manager)
+        self._sg_data_retriever.work_completed.connect(self._on_data_retriever_work_completed)
+        self._sg_data_retriever.work_failure.connect(self._on_data_retriever_work_failure)
+        self._sg_data_retriever.start()
+
+    @property
+    def max_tasks(self):
+        """
+        Number of the user's tasks to prefetch publishes for.
+        """
+        return self._max_tasks
+
+    @property
+    def max_siblings(self):
+        """
+        Number of siblings of the selected entity to prefetch publishes for.
+        """
+        return self._max_siblings
+
+    def destroy(self):
+        """
+        Call this method prior to destroying this object.
+        """
+        self.cancel()
+        self._sg_data_retriever.stop()
+
+    def prefetch(self, sg_filters_list):
+        """
+        Schedules publish queries to be run once the loader is idle. Queries
+        which are already cached are skipped. This replaces any query which
+        was scheduled but not started yet.
+
+        :param sg_filters_list: List of shotgun filters of the queries to run,
+                                most important first.
+        """
+        self._queue = []
+        in_flight = self._pending.values()
+        for sg_filters in sg_filters_list:
+            if sg_filters in self._queue or sg_filters in in_flight:
+                continue
+            if self._publish_model.is_query_cached(sg_filters):
+                continue
+            self._queue.append(sg_filters)
+
+        # wait for the user to settle before using any bandwidth
+        self._idle_timer.start()
+
+    def cancel(self):
+        """
+        Cancels all the queries, results of queries in flight are discarded.
+        """
+        self._idle_timer.stop()
+        self._queue = []
+        self._pending = {}
+
+    def _run_queries(self):
+        """
+        Starts queries from the queue, within the budget.
+        """
+        while self._queue and len(self._pending) < self._max_concurrent_requests:
+            if self._remaining_records <= 0:
+                self._log_debug("Record budget exhausted, not prefetching anymore.")
+                self._queue = []
+                return
+
+            sg_filters = self._queue.pop(0)
+            uid = self._sg_data_retriever.execute_method(publish_query.prefetch_listing,
+                                                         *self._publish_model.get_prefetch_args(sg_filters))
+            self._pending[uid] = sg_filters
+
+    def _on_data_retriever_work_completed(self, uid, request_type, data):
+        """
+        Signaled whenever the data retriever completes some work.
+
+        :param uid: The unique id of the work that completed
+        :param request_type: Type of work completed
+        :param data: Result of the work
+        """
+        uid = shotgun_model.sanitize_qt(uid)
+        if uid not in self._pending:
+            return
+        sg_filters = self._pending.pop(uid)
+
+        # the publishes were already stored in the cache in the background
+        record_count = shotgun_model.sanitize_qt(data)["return_value"]
+        self._remaining_records -= record_count
+        self._publish_model.mark_prefetched(sg_filters)
+        self._log_debug("Prefetched %d publishes for %s." % (record_count, sg_filters))
+
+        self._run_queries()
+
+    def _on_data_retriever_work_failure(self, uid, msg):
+        """
+        Signaled whenever the data retriever fails to complete some work.
+
+        :param uid: The unique id of the work that failed
+        :param msg: The error message
+        """
+        uid = shotgun_model.sanitize_qt(uid)
+        if uid not in self._pending:
+            return
+        del self._pending[uid]
+
+        # prefetching is only an optimization, don't bother the user
+        self._log_debug("Could not prefetch publishes: %s" % shotgun_model.sanitize_qt(msg))
+        self._run_queries()
+
+    def _log_debug(self, msg):
+        """
+        Convenience wrapper around debug logging
+
+        :param msg: debug message
+        """
+        self._bundle.log_debug("[%s] %s" % (self.__class__.__name__, msg))
@@ -12,6 +12,7 @@ import sgtk
 from sgtk.platform.qt import QtCore, QtGui
 
 from . import constants
+from . import metrics
 
 shotgun_model = sgtk.platform.import_framework("tk-framework-shotgunutils", "shotgun_model")
 
@@ -84,6 +85,8 @@ class SgEntityProxyModel(QtGui.QSortFilterProxyModel):
         if cache_len > 0:
             ratio = (float)(self._cache_hits) / (float)(cache_len) * 100.0
             app.log_debug("Search efficiency: %s items %4f%% cache hit ratio." % (cache_len, ratio))
+            metrics.increment("entity_proxy_model.search_cache.hit", self._cache_hits)
+            metrics.increment("entity_proxy_model.search_cache.miss", cache_len)
 
         self._cache_hits = 0
         self._cache = {}
@@ -95,11 +98,13 @@ class SgEntityProxyModel(QtGui.QSortFilterProxyModel):
 
             # ensure model is fully loaded before we attempt any searching
             app.log_debug("Loading up all nodes in tree so we can search...")
-            self.sourceModel().ensure_data_is_loaded()
+            with metrics.timer("entity_tree_full_load"):
+                self.sourceModel().ensure_data_is_loaded()
             app.log_debug("...done")
 
             # call base class
-            return QtGui.QSortFilterProxyModel.setFilterFixedString(self, pattern)
+            with metrics.timer("entity_proxy_filter"):
+                return QtGui.QSortFilterProxyModel.setFilterFixedString(self, pattern)
 
         else:
             return QtGui.QSortFilterProxyModel.setFilterFixedString(self, "")
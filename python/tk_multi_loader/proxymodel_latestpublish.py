@@ -12,12 +12,14 @@ import sgtk
 from sgtk.platform.qt import QtCore, QtGui
 
 from .model_latestpublish import SgLatestPublishModel
+from . import tracing
+from . import metrics
 
 shotgun_model = sgtk.platform.import_framework("tk-framework-shotgunutils", "shotgun_model")
 
 class SgLatestPublishProxyModel(QtGui.QSortFilterProxyModel):
     """
-    Filter model to be used in conjunction with SgLatestPublishModel
+    Filter model to be used in conjunction with SgLatestPublishModel or SgFlatPublishModel
     """
     
     # signal which is emitted whenever a filter changes
@@ -28,6 +30,7 @@ class SgLatestPublishProxyModel(QtGui.QSortFilterProxyModel):
         self._valid_type_ids = None
         self._show_folders = True
         self._search_filter = ""
+        self._facet_ids = None
         
     def set_search_query(self, search_filter):
         """
@@ -36,7 +39,7 @@ class SgLatestPublishProxyModel(QtGui.QSortFilterProxyModel):
         :param search_filter: search filter string
         """
         self._search_filter = search_filter
-        self.invalidateFilter()
+        self._invalidate_filter()
         self.filter_changed.emit()
         
     def set_filter_by_type_ids(self, type_ids, show_folders):
@@ -46,9 +49,28 @@ class SgLatestPublishProxyModel(QtGui.QSortFilterProxyModel):
         self._valid_type_ids = type_ids
         self._show_folders = show_folders
         # tell model to repush data
-        self.invalidateFilter()
+        self._invalidate_filter()
         self.filter_changed.emit()
         
+    def set_facet_ids(self, ids):
+        """
+        Specify which publishes the facet filters allow through
+
+        :param ids: Set of publish ids, or None to allow all publishes
+        """
+        self._facet_ids = ids
+        self._invalidate_filter()
+        self.filter_changed.emit()
+
+    def _invalidate_filter(self):
+        """
+        Filters all the rows again
+        """
+        with tracing.span("proxy_filter") as span, metrics.timer("publish_proxy_filter"):
+            self.invalidateFilter()
+            if tracing.is_enabled() and self.sourceModel():
+                span.set(rows_in=self.sourceModel().rowCount(), rows_out=self.rowCount())
+
     def filterAcceptsRow(self, source_row, source_parent_idx):
         """
         Overridden from base class.
@@ -57,19 +79,19 @@ class SgLatestPublishProxyModel(QtGui.QSortFilterProxyModel):
         model and see if we should let it pass or not.    
         """
         
-        if self._valid_type_ids is None:
+        if self._valid_type_ids is None and self._facet_ids is None:
             # accept all!
             return True
         
         model = self.sourceModel()
         
-        current_item = model.invisibleRootItem().child(source_row)  # assume non-tree structure
+        current_index = model.index(source_row, 0, source_parent_idx)
         
         # first analyze any search filtering
         if self._search_filter:
             
             # there is a search filter entered
-            field_data = shotgun_model.get_sanitized_data(current_item, SgLatestPublishModel.SEARCHABLE_NAME)
+            field_data = shotgun_model.get_sanitized_data(current_index, SgLatestPublishModel.SEARCHABLE_NAME)
                         
             # all input we are getting from pyside is as unicode objects
             # all data from shotgun is utf-8. By converting to utf-8,
@@ -81,15 +103,24 @@ class SgLatestPublishProxyModel(QtGui.QSortFilterProxyModel):
                 return False
         
         # now check if folders should be shown
-        is_folder = current_item.data(SgLatestPublishModel.IS_FOLDER_ROLE)
+        is_folder = shotgun_model.get_sanitized_data(current_index, SgLatestPublishModel.IS_FOLDER_ROLE)
         if is_folder:
             return self._show_folders
+
+        # then check the facet filters
+        if self._facet_ids is not None:
+            publish_id = shotgun_model.get_sanitized_data(current_index, SgLatestPublishModel.PUBLISH_ID_ROLE)
+            if publish_id is None:
+                sg_data = shotgun_model.get_sg_data(current_index)
+                publish_id = sg_data.get("id") if sg_data else None
+            if publish_id not in self._facet_ids:
+                return False
             
         # lastly, check out type filter checkboxes
-        sg_type_id = current_item.data(SgLatestPublishModel.TYPE_ID_ROLE) 
+        sg_type_id = shotgun_model.get_sanitized_data(current_index, SgLatestPublishModel.TYPE_ID_ROLE)
         
-        if sg_type_id is None:
-            # no type. So always show.
+        if sg_type_id is None or self._valid_type_ids is None:
+            # no type or no type filter. So always show.
             return True
         elif sg_type_id in self._valid_type_ids:
             return True
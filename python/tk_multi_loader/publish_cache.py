@@ -0,0 +1,215 @@
+# Copyright (c) 2015 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+On disk cache for the publish listings displayed by the flat publish model.
+
+Each Shotgun query is stored in its own file, keyed by a hash of the query,
+so that switching back and forth between entities can show cached results
+immediately while a refresh is running in the background.
+
+Listings are stored in the compact format implemented in :mod:`compact_listing`,
+which is memory-mapped when loaded so that rows are only unpickled when they
+are accessed.
+"""
+
+import os
+import uuid
+import hashlib
+
+import sgtk
+
+from . import tracing
+from .compact_listing import CompactListing, write_listing
+
+# folder inside the app cache location where listings are stored
+CACHE_FOLDER_NAME = "publish_listings"
+
+
+class PublishListingCache(object):
+    """
+    Stores publish listings and the raw records returned by a Shotgun query on disk.
+    """
+
+    def __init__(self, cache_root=None):
+        """
+        :param cache_root: Folder to store the cache files in. If not specified,
+                           a folder inside the app's cache location is used.
+        """
+        self._bundle = sgtk.platform.current_bundle()
+        if cache_root is None:
+            cache_root = os.path.join(self._bundle.cache_location, CACHE_FOLDER_NAME)
+        self._cache_root = cache_root
+
+    @property
+    def cache_root(self):
+        """
+        The folder where cache files are stored.
+        """
+        return self._cache_root
+
+    def compute_key(self, entity_type, filters, fields, order):
+        """
+        Computes a key uniquely identifying a query.
+
+        :param entity_type: Shotgun entity type.
+        :param filters: List of Shotgun filters.
+        :param fields: List of Shotgun fields.
+        :param order: Shotgun order specification.
+        :returns: Key as a string.
+        """
+        return get_query_key(entity_type, filters, sorted(fields), order)
+
+    def get_path(self, key):
+        """
+        Returns the path to the cache file for a given key.
+
+        :param key: Key as returned by :meth:`compute_key`.
+        :returns: Path on disk.
+        """
+        return os.path.join(self._cache_root, "%s.listing" % key)
+
+    def load(self, key):
+        """
+        Opens the listing stored for a given key.
+
+        :param key: Key as returned by :meth:`compute_key`.
+        :returns: :class:`CompactListing` or None if nothing is cached. The
+                  listing must be closed once it isn't needed anymore.
+        """
+        path = self.get_path(key)
+        if not os.path.exists(path):
+            return None
+
+        with tracing.span("cache_read") as span:
+            try:
+                listing = CompactListing(path)
+            except Exception as e:
+                self._log_debug("Could not read cache file %s: %s" % (path, e))
+                return None
+            if tracing.is_enabled():
+                span.set(rows=listing.row_count, bytes=os.path.getsize(path))
+            return listing
+
+    def save(self, key, rows, raw_rows, **meta):
+        """
+        Stores a publish listing for a given key.
+
+        The listing previously loaded for this key must be closed first,
+        since mapped files can't be replaced on all platforms.
+
+        :param key: Key as returned by :meth:`compute_key`.
+        :param rows: List of (sg_data, type_id, display_text, type_name, search_str,
+                     facet_values) tuples for the publishes to display.
+        :param raw_rows: List of (sanitized) Shotgun dictionaries returned by the query.
+        :param meta: Additional values to store alongside the rows.
+        """
+        tmp_path = self.write(key, rows, raw_rows, **meta)
+        if tmp_path is None:
+            return
+
+        path = self.get_path(key)
+        try:
+            if os.path.exists(path):
+                os.remove(path)
+            os.rename(tmp_path, path)
+        except Exception as e:
+            self._log_debug("Could not write cache file %s: %s" % (path, e))
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def write(self, key, rows, raw_rows, **meta):
+        """
+        Writes a publish listing for a given key to a temporary file, which is
+        then moved into place with :meth:`commit`. This can run in a background
+        thread while the listing previously loaded for this key is still in use.
+
+        :param key: Key as returned by :meth:`compute_key`.
+        :param rows: List of (sg_data, type_id, display_text, type_name, search_str,
+                     facet_values) tuples for the publishes to display.
+        :param raw_rows: List of (sanitized) Shotgun dictionaries returned by the query.
+        :param meta: Additional values to store alongside the rows.
+        :returns: Path to the temporary file, or None if it couldn't be written.
+        """
+        path = self.get_path(key)
+        # several listings for the same key may be written at the same time
+        tmp_path = "%s.%d.%s.tmp" % (path, os.getpid(), uuid.uuid4().hex)
+        try:
+            if not os.path.exists(self._cache_root):
+                os.makedirs(self._cache_root)
+
+            # write to a temporary file first so that a crash never
+            # leaves a half written cache file behind.
+            with tracing.span("cache_write", rows=len(rows)) as span:
+                with open(tmp_path, "wb") as fh:
+                    write_listing(fh, rows, raw_rows, meta)
+                    span.set(bytes=fh.tell())
+            return tmp_path
+        except Exception as e:
+            self._log_debug("Could not write cache file %s: %s" % (tmp_path, e))
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return None
+
+    def commit(self, key, listing):
+        """
+        Moves a listing written with :meth:`write` into place. The listing
+        previously loaded for this key must be closed first.
+
+        :param key: Key as returned by :meth:`compute_key`.
+        :param listing: :class:`CompactListing` opened from the temporary file.
+                        It stays open and is read from its final location afterwards.
+        :returns: True if the listing was moved, False otherwise.
+        """
+        path = self.get_path(key)
+        try:
+            listing.move(path)
+        except Exception as e:
+            self._log_debug("Could not write cache file %s: %s" % (path, e))
+            return False
+        return True
+
+    def _log_debug(self, msg):
+        """
+        Convenience wrapper around debug logging
+
+        :param msg: debug message
+        """
+        self._bundle.log_debug("[%s] %s" % (self.__class__.__name__, msg))
+
+
+def get_query_key(*query):
+    """
+    Computes a key uniquely identifying a query. The key is stable
+    between sessions.
+
+    :param query: Values identifying the query, e.g. entity type, filters and fields.
+    :returns: Key as a string.
+    """
+    return hashlib.md5(_make_hashable_str(list(query))).hexdigest()
+
+
+def _make_hashable_str(value):
+    """
+    Converts a structure of lists and dictionaries into a string which
+    is stable between sessions, e.g. dictionary keys are always sorted.
+
+    :param value: Value to convert.
+    :returns: String representation.
+    """
+    if isinstance(value, dict):
+        items = ["%s:%s" % (_make_hashable_str(k), _make_hashable_str(value[k])) for k in sorted(value)]
+        return "{%s}" % ",".join(items)
+    elif isinstance(value, (list, tuple)):
+        return "[%s]" % ",".join([_make_hashable_str(x) for x in value])
+    elif isinstance(value, unicode):
+        return repr(value.encode("utf-8"))
+    else:
+        return repr(value)
@@ -0,0 +1,386 @@
+# Copyright (c) 2015 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Headless access to the latest publishes, as displayed by the loader.
+
+This module is deliberately free of any Qt dependencies so that scripts and
+farm jobs can get the exact same answer as the loader, through
+:meth:`MultiLoader.find_latest_publishes`, without building any widgets.
+It runs the same queries, the same filter_publishes hook and the same latest
+version logic as the flat publish model, and shares its on disk cache.
+"""
+
+import time
+import datetime
+
+import sgtk
+
+from . import constants
+from . import delta_sync
+from . import latest_publishes
+from . import facets
+from .publish_cache import PublishListingCache
+from .freshness import FreshnessPolicy
+
+# number of entities queried in a single Shotgun request by default
+DEFAULT_BATCH_SIZE = 100
+
+
+def get_publish_query_fields():
+    """
+    Returns what the loader retrieves from Shotgun for a publish query.
+
+    :returns: Tuple with the publish entity type, the list of fields and the order.
+    """
+    app = sgtk.platform.current_bundle()
+    publish_entity_type = sgtk.util.get_published_file_entity_type(app.sgtk)
+    publish_type_field = latest_publishes.get_publish_type_field()
+    fields = ["code", "updated_at", publish_type_field] + constants.PUBLISHED_FILES_FIELDS
+    order = [{"field_name": "created_at", "direction": "asc"}]
+    return (publish_entity_type, fields, order)
+
+
+def get_link_filter(entity):
+    """
+    Returns the Shotgun filter matching the publishes linked to an entity.
+
+    Tasks are linked through the task field rather than the entity field.
+    Tags are applied to the Version associated with a publish rather than to
+    the publish itself, so that they can also be filtered on from the media
+    page, which only shows versions.
+
+    :param entity: Shotgun entity dictionary, with at least type and id.
+    :returns: Shotgun filter.
+    """
+    if entity["type"] == "Task":
+        field = "task"
+    elif entity["type"] == "Tag":
+        field = "version.Version.tags"
+    else:
+        field = "entity"
+    return [field, "is", {"type": entity["type"], "id": entity["id"]}]
+
+
+def get_entity_publish_filters(app, entity, additional_sg_filters=None):
+    """
+    Computes the Shotgun filters used by the loader when an entity is selected
+    on its own in the tree view.
+
+    :param app: The app instance.
+    :param entity: Shotgun entity dictionary, with at least type and id.
+    :param additional_sg_filters: List of shotgun filters to add, e.g. the
+                                  publish_filters of an entities tab.
+    :returns: List of shotgun filters, the first one linking the publishes to the entity.
+    """
+    sg_filters = [get_link_filter(entity)]
+    sg_filters.extend(app.get_setting("publish_filters", []))
+    sg_filters.extend(additional_sg_filters or [])
+    return sg_filters
+
+
+def build_listing_rows(app, sg_data_list, publish_type_field):
+    """
+    Runs the filter_publishes hook and the latest version logic on the raw
+    results of a publish query, and computes the columns the loader displays.
+
+    :param app: The app instance.
+    :param sg_data_list: List of shotgun publish dictionaries. They are not modified.
+    :param publish_type_field: Name of the publish type field.
+    :returns: Tuple with the list of (sg_data, type_id, display_text, type_name, search_str,
+              facet_values) tuples for the latest publishes and a dictionary with the
+              number of publishes for each type id.
+    """
+    # work on copies so that the raw data, e.g. held for incremental
+    # refreshes, is not modified by the processing below.
+    sg_data_list = [dict(sg_data) for sg_data in sg_data_list]
+
+    # First, let the filter_publishes hook have a chance to filter the list
+    # of publishes:
+    sg_data_list = latest_publishes.filter_publishes(app, sg_data_list)
+
+    # keep only the latest version of each publish and count
+    # how many times each type is used.
+    (sg_data_list, type_id_aggregates) = latest_publishes.compute_latest_publishes(
+        sg_data_list,
+        publish_type_field
+    )
+
+    rows = []
+    for sg_data in sg_data_list:
+        type_id = None
+
+        # start figuring out the searchable tokens for this item
+        search_str = ""
+
+        # add the associated publish type (both id and name)
+        type_link = sg_data.get(publish_type_field)
+        if type_link:
+            type_id = type_link["id"]
+            type_name = type_link["name"]
+            search_str += "%s " % type_link["name"]
+        else:
+            type_name = "No Type"
+
+        # add name and version to search string
+        if sg_data.get("name"):
+            search_str += " %s" % sg_data["name"]
+        if sg_data.get("version_number"):
+            # add this in as "v012" to make it easy to search for say all versions 12 but
+            # exclude v112:s
+            search_str += " v%03d" % sg_data["version_number"]
+
+        rows.append((sg_data,
+                     type_id,
+                     sg_data.get("code"),
+                     type_name,
+                     search_str,
+                     facets.get_record_facet_values(sg_data, publish_type_field)))
+
+    return (rows, type_id_aggregates)
+
+
+def save_listing(app, cache, cache_key, sg_data_list, watermark, publish_type_field):
+    """
+    Stores the results of a publish query in the cache, in the form loaded
+    by the flat publish model.
+
+    :param app: The app instance.
+    :param cache: :class:`PublishListingCache` to store the results in.
+    :param cache_key: Key of the query.
+    :param sg_data_list: List of sanitized shotgun publish dictionaries returned by the query.
+    :param watermark: High-water mark of the results.
+    :param publish_type_field: Name of the publish type field.
+    :returns: Dictionary with the number of publishes for each type id.
+    """
+    (rows, type_id_aggregates) = build_listing_rows(app, sg_data_list, publish_type_field)
+    cache.save(cache_key,
+               rows,
+               sg_data_list,
+               watermark=watermark,
+               type_id_aggregates=type_id_aggregates)
+    return type_id_aggregates
+
+
+def prefetch_listing(sg, app, cache, cache_key, entity_type, filters, fields, order, publish_type_field):
+    """
+    Runs a publish query and stores its results in the cache, without
+    displaying them. This is meant to run in a background thread, through
+    ``execute_method``.
+
+    :param sg: Shotgun API instance.
+    :param app: The app instance.
+    :param cache: :class:`PublishListingCache` to store the results in.
+    :param cache_key: Key of the query.
+    :param entity_type: Publish entity type.
+    :param filters: Shotgun filters of the query.
+    :param fields: Shotgun fields to retrieve.
+    :param order: Shotgun order specification.
+    :param publish_type_field: Name of the publish type field.
+    :returns: Number of publishes retrieved.
+    """
+    sg_data_list = [sanitize_sg_data(sg_data) for sg_data in sg.find(entity_type, filters, fields, order)]
+    save_listing(app,
+                 cache,
+                 cache_key,
+                 sg_data_list,
+                 delta_sync.compute_watermark(sg_data_list),
+                 publish_type_field)
+    return len(sg_data_list)
+
+
+def build_listing(sg, app, cache, cache_key, sg_data_list, watermark, publish_type_field):
+    """
+    Builds the rows displayed for the results of a publish query and writes
+    them to a temporary cache file, see :meth:`PublishListingCache.write`.
+
+    This is meant to run in a background thread, through ``execute_method``,
+    so that the filter_publishes hook, the latest version logic and the cache
+    write don't block the UI.
+
+    :param sg: Shotgun API instance, not used.
+    :param app: The app instance.
+    :param cache: :class:`PublishListingCache` to write the results to.
+    :param cache_key: Key of the query, or None if the results shouldn't be cached.
+    :param sg_data_list: List of sanitized shotgun publish dictionaries returned by the query.
+    :param watermark: High-water mark of the results.
+    :param publish_type_field: Name of the publish type field.
+    :returns: Dictionary with the path to the temporary cache file under "path",
+              the number of publishes for each type id under "type_id_aggregates"
+              and, only if no cache file was written, the rows under "rows".
+    """
+    (rows, type_id_aggregates) = build_listing_rows(app, sg_data_list, publish_type_field)
+    path = None
+    if cache_key is not None:
+        path = cache.write(cache_key,
+                           rows,
+                           sg_data_list,
+                           watermark=watermark,
+                           type_id_aggregates=type_id_aggregates)
+    return {
+        "path": path,
+        "type_id_aggregates": type_id_aggregates,
+        "rows": rows if path is None else None,
+    }
+
+
+def find_latest_publishes(app, entities, publish_types=None, additional_sg_filters=None,
+                          batch_size=DEFAULT_BATCH_SIZE, use_cache=True):
+    """
+    Returns the latest publishes linked to a list of entities, exactly as the
+    loader displays them when each entity is selected.
+
+    Cached results are reused and only the changes since they were cached are
+    retrieved. Entities are queried in batches, so that many entities only
+    take a few Shotgun requests.
+
+    Values are sanitized the same way the loader caches them: datetimes are
+    unix time stamps and strings are utf-8 encoded.
+
+    :param app: The app instance.
+    :param entities: List of Shotgun entity dictionaries, with at least type and id.
+    :param publish_types: List of publish type names to return. All types are
+                          returned if not specified.
+    :param additional_sg_filters: List of shotgun filters to add to the queries,
+                                  e.g. the publish_filters of an entities tab.
+    :param batch_size: Maximum number of entities queried in a single request.
+    :param use_cache: Whether to use and update the loader's cache.
+    :returns: Dictionary keyed by (entity type, entity id) holding the list of
+              the latest publishes linked to each entity.
+    """
+    (entity_type, fields, order) = get_publish_query_fields()
+    publish_type_field = latest_publishes.get_publish_type_field()
+    cache = PublishListingCache()
+    freshness = FreshnessPolicy("publish")
+
+    parts = []
+    seen = set()
+    for entity in entities:
+        key = (entity["type"], entity["id"])
+        if key in seen:
+            continue
+        seen.add(key)
+
+        sg_filters = get_entity_publish_filters(app, entity, additional_sg_filters)
+        part = {
+            "key": key,
+            "field": sg_filters[0][0],
+            "value": sg_filters[0][2],
+            "sg_filters": sg_filters,
+            "cache_key": cache.compute_key(entity_type, sg_filters, fields, order),
+            "raw_sg_data": None,
+            "watermark": None,
+        }
+        if use_cache:
+            listing = cache.load(part["cache_key"])
+            if listing:
+                try:
+                    part["raw_sg_data"] = listing.get_raw_rows()
+                    part["watermark"] = listing.meta.get("watermark")
+                finally:
+                    listing.close()
+        parts.append(part)
+
+    stale_parts = [
+        part for part in parts
+        if not use_cache or freshness.needs_refresh(part["raw_sg_data"] is not None,
+                                                    entity_type,
+                                                    part["sg_filters"])
+    ]
+    start = time.time()
+    for first in range(0, len(stale_parts), batch_size):
+        _refresh_parts(app, cache, stale_parts[first:first + batch_size], use_cache)
+    app.log_debug(
+        "Retrieved publishes for %d of %d entities in %.2fs."
+        % (len(stale_parts), len(parts), time.time() - start)
+    )
+
+    results = {}
+    for part in parts:
+        (rows, _) = build_listing_rows(app, part["raw_sg_data"] or [], publish_type_field)
+        results[part["key"]] = [
+            sg_data for (sg_data, _, _, type_name, _, _) in rows
+            if publish_types is None or type_name in publish_types
+        ]
+    return results
+
+
+def _refresh_parts(app, cache, parts, use_cache):
+    """
+    Retrieves the publishes of a batch of entities with as few requests as
+    possible, and stores them in the cache.
+
+    :param app: The app instance.
+    :param cache: :class:`PublishListingCache` to store the results in.
+    :param parts: List of part dictionaries, as built by :meth:`find_latest_publishes`.
+                  Their raw data and watermark are updated.
+    :param use_cache: Whether to store the results in the cache.
+    """
+    (entity_type, fields, order) = get_publish_query_fields()
+    publish_type_field = latest_publishes.get_publish_type_field()
+    freshness = FreshnessPolicy("publish")
+
+    # all the parts share the filters following the link filter
+    results = delta_sync.fetch_parts(
+        app.shotgun,
+        entity_type,
+        parts[0]["sg_filters"][1:],
+        fields,
+        order,
+        [
+            {
+                "field": part["field"],
+                "value": part["value"],
+                "watermark": part["watermark"] if part["raw_sg_data"] is not None else None,
+                "known_ids": [sg_data["id"] for sg_data in part["raw_sg_data"] or []],
+            }
+            for part in parts
+        ]
+    )
+
+    # the freshness of all the parts is recorded at once
+    with freshness.batch():
+        for (part, result) in zip(parts, results):
+            if "sg" in result:
+                sg_data_list = [sanitize_sg_data(sg_data) for sg_data in result["sg"]]
+            else:
+                changes = result["changes"]
+                if not changes["updated"] and not changes["removed_ids"]:
+                    if use_cache:
+                        freshness.mark_refreshed(entity_type, part["sg_filters"])
+                    continue
+                changes["updated"] = [sanitize_sg_data(sg_data) for sg_data in changes["updated"]]
+                sg_data_list = delta_sync.merge_changes(part["raw_sg_data"], changes, "created_at")
+
+            part["raw_sg_data"] = sg_data_list
+            part["watermark"] = delta_sync.compute_watermark(sg_data_list)
+            if use_cache:
+                save_listing(app, cache, part["cache_key"], sg_data_list, part["watermark"], publish_type_field)
+                freshness.mark_refreshed(entity_type, part["sg_filters"])
+
+
+def sanitize_sg_data(value):
+    """
+    Converts Shotgun data into a form which can be cached and which matches
+    what the ShotgunModel stores: datetimes are turned into unix time stamps
+    and unicode strings are encoded as utf-8.
+
+    :param value: Shotgun value to sanitize.
+    :returns: Sanitized value.
+    """
+    if isinstance(value, dict):
+        return dict((k, sanitize_sg_data(v)) for (k, v) in value.iteritems())
+    elif isinstance(value, list):
+        return [sanitize_sg_data(v) for v in value]
+    elif isinstance(value, unicode):
+        return value.encode("UTF-8")
+    elif isinstance(value, datetime.datetime):
+        return time.mktime(value.timetuple())
+    return value
@@ -0,0 +1,485 @@
+# Copyright (c) 2015 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Local replica of the publishes of a project, stored in SQLite.
+
+The replica holds the fields retrieved by the loader for every publish of the
+current project. It is built in the background the first time it is needed,
+then kept current by only retrieving the publishes created or updated since
+the last synchronization, see :mod:`delta_sync`. Publish queries are answered
+with indexed lookups on the entity, task, type, name and version, and the
+remaining filters are evaluated locally. Queries using filters which can't be
+evaluated locally, or made while the replica is still cold, go to Shotgun.
+
+Like the other incremental refreshes, changes to linked fields which don't
+update the publishes themselves, e.g. the status of their task, are only
+picked up once the publishes are updated.
+
+This module is deliberately free of any Qt dependencies.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import threading
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+import sgtk
+
+from . import delta_sync
+from . import latest_publishes
+from .publish_query import get_publish_query_fields, sanitize_sg_data
+
+# folder inside the app cache location where replicas are stored
+REPLICA_FOLDER_NAME = "publish_replica"
+
+# bump when the schema or the fields stored change
+SCHEMA_VERSION = 1
+
+# number of seconds between two synchronizations when not configured
+DEFAULT_SYNC_INTERVAL = 60
+
+# number of values passed to a single sql "in" clause
+_SQL_BATCH_SIZE = 500
+
+# the replica shared by all models, keyed by path
+_replicas = {}
+
+
+def get_replica(bundle):
+    """
+    Returns the replica for the current project, if enabled.
+
+    :param bundle: The app instance.
+    :returns: :class:`PublishReplica` or None if replicas are disabled or
+              there is no project in the current context.
+    """
+    settings = bundle.get_setting("publish_replica") or {}
+    project = bundle.context.project
+    if not settings.get("enabled") or not project:
+        return None
+
+    path = os.path.join(bundle.cache_location, REPLICA_FOLDER_NAME, "p%d.sqlite" % project["id"])
+    if path not in _replicas:
+        _replicas[path] = PublishReplica(
+            path,
+            project,
+            settings.get("sync_interval", DEFAULT_SYNC_INTERVAL)
+        )
+    return _replicas[path]
+
+
+def sync_replica(sg, replica):
+    """
+    Synchronizes a replica with Shotgun. Meant to be run in a background
+    thread, e.g. through ``ShotgunDataRetriever.execute_method``.
+
+    :param sg: Shotgun API instance.
+    :param replica: :class:`PublishReplica` to synchronize.
+    """
+    replica.sync(sg)
+
+
+def query_replica(sg, replica, filters):
+    """
+    Synchronizes a replica if needed and returns the publishes matching a
+    query. Meant to be run in a background thread, e.g. through
+    ``ShotgunDataRetriever.execute_method``.
+
+    :param sg: Shotgun API instance.
+    :param replica: :class:`PublishReplica` to query.
+    :param filters: Shotgun filters of the query.
+    :returns: List of publishes, on the same form as the loader's publish queries.
+    """
+    replica.sync(sg, wait=False)
+    return replica.find(filters)
+
+
+class PublishReplica(object):
+    """
+    Replica of the publishes of a project. Each method opens its own connection
+    to the database, so that the replica can be used from any thread.
+    """
+
+    def __init__(self, path, project, sync_interval):
+        """
+        :param path: Path to the database file.
+        :param project: Project entity dictionary.
+        :param sync_interval: Minimum number of seconds between two synchronizations.
+        """
+        self._bundle = sgtk.platform.current_bundle()
+        self._path = path
+        self._project = {"type": project["type"], "id": project["id"]}
+        self._sync_interval = sync_interval
+        self._sync_lock = threading.Lock()
+        self._schema_lock = threading.Lock()
+        self._schema_checked = False
+        self._warm = None
+
+        (self._entity_type, self._fields, self._order) = get_publish_query_fields()
+        self._publish_type_field = latest_publishes.get_publish_type_field()
+
+    @property
+    def is_warm(self):
+        """
+        Whether the replica was fully built and can answer queries.
+        """
+        if not self._warm:
+            try:
+                self._warm = self._get_meta("watermark") is not None
+            except Exception as e:
+                self._log_debug("Could not read %s: %s" % (self._path, e))
+                self._warm = False
+        return self._warm
+
+    def can_answer(self, filters):
+        """
+        Checks whether a query can be answered by the replica.
+
+        :param filters: Shotgun filters of the query.
+        :returns: True if the replica is warm and the filters can be evaluated locally.
+        """
+        if not filters or not self.is_warm:
+            return False
+        return _is_supported(filters, self._fields)
+
+    def sync(self, sg, wait=True):
+        """
+        Retrieves what changed since the last synchronization, or all the
+        publishes of the project if the replica is cold. Nothing is done if
+        the last synchronization is more recent than the sync interval.
+
+        :param sg: Shotgun API instance.
+        :param wait: Whether to wait for a synchronization in progress in
+                     another thread, rather than returning straight away.
+        """
+        if not self._sync_lock.acquire(wait):
+            return
+        try:
+            self._sync(sg)
+        except Exception as e:
+            # the replica is only an optimization, queries fall back on Shotgun
+            self._log_debug("Could not synchronize %s: %s" % (self._path, e))
+        finally:
+            self._sync_lock.release()
+
+    def find(self, filters):
+        """
+        Returns the publishes matching a query, sorted by creation time.
+
+        :param filters: Shotgun filters of the query, see :meth:`can_answer`.
+        :returns: List of publishes.
+        """
+        (where, params) = _get_index_clause(filters)
+        connection = self._connect()
+        try:
+            sg_data_list = []
+            for (clause, clause_params) in _split_in_clause(where, params):
+                sql = "SELECT data FROM publishes"
+                if clause:
+                    sql += " WHERE %s" % clause
+                for (data,) in connection.execute(sql, clause_params):
+                    sg_data = pickle.loads(str(data))
+                    if _matches(sg_data, filters):
+                        sg_data_list.append(sg_data)
+        finally:
+            connection.close()
+
+        sg_data_list.sort(key=lambda sg_data: (sg_data.get("created_at"), sg_data["id"]))
+        return sg_data_list
+
+    def _sync(self, sg):
+        """
+        Synchronizes the replica, see :meth:`sync`.
+
+        :param sg: Shotgun API instance.
+        """
+        synced_at = self._get_meta("synced_at")
+        if synced_at is not None and time.time() - synced_at < self._sync_interval:
+            return
+
+        start = time.time()
+        filters = [["project", "is", self._project]]
+        watermark = self._get_meta("watermark")
+
+        connection = self._connect()
+        try:
+            if watermark is None:
+                updated = sg.find(self._entity_type, filters, self._fields, self._order)
+                removed_ids = []
+            else:
+                known_ids = [row[0] for row in connection.execute("SELECT id FROM publishes")]
+                changes = delta_sync.fetch_changes(
+                    sg, self._entity_type, filters, self._fields, self._order, watermark, known_ids
+                )
+                (updated, removed_ids) = (changes["updated"], changes["removed_ids"])
+
+            with connection:
+                connection.executemany(
+                    "INSERT OR REPLACE INTO publishes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    [self._get_row(sanitize_sg_data(sg_data)) for sg_data in updated]
+                )
+                for first in range(0, len(removed_ids), _SQL_BATCH_SIZE):
+                    batch = removed_ids[first:first + _SQL_BATCH_SIZE]
+                    connection.execute(
+                        "DELETE FROM publishes WHERE id IN (%s)" % ",".join("?" * len(batch)), batch
+                    )
+
+                # the high-water mark covers the whole replica
+                (count, max_id, max_updated_at, id_sum) = connection.execute(
+                    "SELECT COUNT(*), MAX(id), MAX(updated_at), SUM(id) FROM publishes"
+                ).fetchone()
+                watermark = {
+                    "updated_at": max_updated_at, "id": max_id or 0, "count": count, "id_sum": id_sum or 0
+                }
+                self._set_meta(connection, "watermark", watermark)
+                self._set_meta(connection, "synced_at", time.time())
+        finally:
+            connection.close()
+
+        self._warm = True
+        self._log_debug(
+            "Synchronized %d updated and %d removed publishes in %.2fs, %d publishes in replica."
+            % (len(updated), len(removed_ids), time.time() - start, watermark["count"])
+        )
+
+    def _get_row(self, sg_data):
+        """
+        Returns the database row for a publish.
+
+        :param sg_data: Sanitized Shotgun dictionary.
+        :returns: Tuple of column values.
+        """
+        entity = sg_data.get("entity") or {}
+        task = sg_data.get("task") or {}
+        publish_type = sg_data.get(self._publish_type_field) or {}
+        return (
+            sg_data["id"],
+            entity.get("type"),
+            entity.get("id"),
+            task.get("id"),
+            publish_type.get("id"),
+            sg_data.get("name"),
+            sg_data.get("version_number"),
+            sg_data.get("updated_at"),
+            sqlite3.Binary(pickle.dumps(sg_data, pickle.HIGHEST_PROTOCOL)),
+        )
+
+    def _connect(self):
+        """
+        Opens a connection to the database, creating it if needed.
+
+        :returns: sqlite3 connection.
+        """
+        if not os.path.exists(os.path.dirname(self._path)):
+            os.makedirs(os.path.dirname(self._path))
+
+        connection = sqlite3.connect(self._path, timeout=30)
+        # values are stored as utf-8 encoded strings, as everywhere else in the cache
+        connection.text_factory = str
+        # allow queries while the replica is being synchronized
+        connection.execute("PRAGMA journal_mode=WAL")
+
+        with self._schema_lock:
+            if not self._schema_checked:
+                self._check_schema(connection)
+                self._schema_checked = True
+        return connection
+
+    def _check_schema(self, connection):
+        """
+        Creates the tables, discarding any replica built with another schema.
+
+        :param connection: Connection to use.
+        """
+        version = connection.execute("PRAGMA user_version").fetchone()[0]
+        if version != SCHEMA_VERSION:
+            with connection:
+                connection.execute("DROP TABLE IF EXISTS publishes")
+                connection.execute("DROP TABLE IF EXISTS meta")
+                connection.execute(
+                    "CREATE TABLE publishes (id INTEGER PRIMARY KEY, entity_type TEXT, entity_id INTEGER, "
+                    "task_id INTEGER, type_id INTEGER, name TEXT, version_number INTEGER, "
+                    "updated_at REAL, data BLOB)"
+                )
+                connection.execute("CREATE INDEX publishes_entity ON publishes (entity_id, entity_type)")
+                connection.execute("CREATE INDEX publishes_task ON publishes (task_id)")
+                connection.execute("CREATE INDEX publishes_type ON publishes (type_id)")
+                connection.execute("CREATE INDEX publishes_name ON publishes (name, version_number)")
+                connection.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+                connection.execute("PRAGMA user_version = %d" % SCHEMA_VERSION)
+
+    def _get_meta(self, key):
+        """
+        Reads a value stored with the replica.
+
+        :param key: Name of the value.
+        :returns: The value or None if it isn't set.
+        """
+        connection = self._connect()
+        try:
+            row = connection.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        finally:
+            connection.close()
+        return json.loads(row[0]) if row else None
+
+    def _set_meta(self, connection, key, value):
+        """
+        Stores a value with the replica.
+
+        :param connection: Connection to use.
+        :param key: Name of the value.
+        :param value: Value which can be serialized in json.
+        """
+        connection.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, json.dumps(value)))
+
+    def _log_debug(self, msg):
+        """
+        Convenience wrapper around debug logging
+
+        :param msg: debug message
+        """
+        self._bundle.log_debug("[%s] %s" % (self.__class__.__name__, msg))
+
+
+# operators which can be evaluated locally
+_OPERATORS = ["is", "is_not", "in", "not_in", "greater_than", "less_than"]
+
+
+def _is_supported(filters, fields):
+    """
+    Checks whether filters can be evaluated locally.
+
+    :param filters: List of Shotgun filters, or a filter group dictionary.
+    :param fields: Fields stored in the replica.
+    :returns: True if all the filters can be evaluated.
+    """
+    if isinstance(filters, dict):
+        if filters.get("filter_operator") not in ("all", "and", "any", "or"):
+            return False
+        return _is_supported(filters.get("filters", []), fields)
+
+    for sg_filter in filters:
+        if isinstance(sg_filter, dict):
+            if not _is_supported(sg_filter, fields):
+                return False
+        elif len(sg_filter) != 3 or sg_filter[0] not in fields or sg_filter[1] not in _OPERATORS:
+            return False
+    return True
+
+
+def _matches(sg_data, filters):
+    """
+    Evaluates filters against a publish.
+
+    :param sg_data: Sanitized Shotgun dictionary.
+    :param filters: List of Shotgun filters, or a filter group dictionary.
+    :returns: True if the publish matches.
+    """
+    if isinstance(filters, dict):
+        results = [_matches(sg_data, [sg_filter]) for sg_filter in filters["filters"]]
+        if filters["filter_operator"] in ("any", "or"):
+            return any(results)
+        return all(results)
+
+    for sg_filter in filters:
+        if isinstance(sg_filter, dict):
+            if not _matches(sg_data, sg_filter):
+                return False
+            continue
+
+        (field, operator, value) = sg_filter
+        actual = _get_comparable(sg_data.get(field))
+        if operator in ("in", "not_in"):
+            values = value if isinstance(value, (list, tuple)) else [value]
+            found = actual in [_get_comparable(sanitize_sg_data(v)) for v in values]
+            if found != (operator == "in"):
+                return False
+        elif operator in ("is", "is_not"):
+            if (actual == _get_comparable(sanitize_sg_data(value))) != (operator == "is"):
+                return False
+        elif actual is None:
+            return False
+        elif operator == "greater_than" and not actual > sanitize_sg_data(value):
+            return False
+        elif operator == "less_than" and not actual < sanitize_sg_data(value):
+            return False
+    return True
+
+
+def _get_comparable(value):
+    """
+    Returns a value which can be compared with a filter value. Entities
+    are compared by type and id only.
+
+    :param value: Sanitized Shotgun value.
+    :returns: Comparable value.
+    """
+    if isinstance(value, dict) and "type" in value and "id" in value:
+        return (value["type"], value["id"])
+    return value
+
+
+def _get_index_clause(filters):
+    """
+    Returns a sql clause selecting candidate rows with the indexes, from the
+    top level filters on the entity, task, type or name. The filters still
+    need to be evaluated on the selected rows.
+
+    :param filters: List of Shotgun filters.
+    :returns: Tuple with the sql clause, or None to scan all the rows, and its parameters.
+    """
+    for sg_filter in filters:
+        if isinstance(sg_filter, dict):
+            continue
+        (field, operator, value) = sg_filter
+        if operator == "is" and value is not None:
+            values = [value]
+        elif operator == "in" and isinstance(value, (list, tuple)):
+            values = list(value)
+        else:
+            continue
+
+        if field == "entity" and all(isinstance(v, dict) for v in values):
+            return ("entity_id IN (%s)", [v["id"] for v in values])
+        if field == "task" and all(isinstance(v, dict) for v in values):
+            return ("task_id IN (%s)", [v["id"] for v in values])
+        if field in ("published_file_type", "tank_type") and all(isinstance(v, dict) for v in values):
+            return ("type_id IN (%s)", [v["id"] for v in values])
+        if field == "name":
+            return ("name IN (%s)", [sanitize_sg_data(v) for v in values])
+
+    return (None, [])
+
+
+def _split_in_clause(clause, params):
+    """
+    Splits a sql "in" clause so that each statement stays within the
+    number of parameters sqlite accepts.
+
+    :param clause: Sql clause with a single "%s" placeholder, or None.
+    :param params: List of parameters.
+    :returns: List of (clause, parameters) tuples.
+    """
+    if clause is None:
+        return [(None, [])]
+    if not params:
+        return []
+    return [
+        (clause % ",".join("?" * len(params[first:first + _SQL_BATCH_SIZE])),
+         params[first:first + _SQL_BATCH_SIZE])
+        for first in range(0, len(params), _SQL_BATCH_SIZE)
+    ]
@@ -0,0 +1,144 @@
+# Copyright (c) 2015 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+import sgtk
+from sgtk.platform.qt import QtCore
+
+from . import delta_sync
+from .single_flight import SingleFlightDataRetriever
+
+shotgun_model = sgtk.platform.import_framework("tk-framework-shotgunutils", "shotgun_model")
+
+
+class RefreshChecker(QtCore.QObject):
+    """
+    Helper for ShotgunModel based models which avoids running a full query
+    when refreshing data which hasn't changed.
+
+    The model records a high-water mark each time data is retrieved from Shotgun.
+    When a refresh is requested, a small query checks in the background whether
+    anything was created, updated or removed since then, and the refresh_required
+    signal is only emitted if this is the case.
+
+    Changes made to linked fields are not detected, so this is only meant for
+    automatic refreshes. Refreshes requested by users should run the full query.
+    """
+
+    # emitted when the model should refresh its data
+    refresh_required = QtCore.Signal()
+
+    def __init__(self, parent, bg_task_manager):
+        """
+        :param parent: Parent QObject, typically the model.
+        :param bg_task_manager: Background task manager to use to run queries.
+        """
+        QtCore.QObject.__init__(self, parent)
+        self._bundle = sgtk.platform.current_bundle()
+
+        self._entity_type = None
+        self._filters = None
+        self._watermark = None
+        self._current_check_uid = None
+
+        self._sg_data_retriever = SingleFlightDataRetriever(self, bg_task_manager)
+        self._sg_data_retriever.work_completed.connect(self._on_data_retriever_work_completed)
+        self._sg_data_retriever.work_failure.connect(self._on_data_retriever_work_failure)
+        self._sg_data_retriever.start()
+
+    def destroy(self):
+        """
+        Call this method prior to destroying this object.
+        """
+        self._current_check_uid = None
+        self._sg_data_retriever.stop()
+
+    def set_query(self, entity_type, filters):
+        """
+        Sets the query the model is displaying. This discards any
+        previously recorded high-water mark.
+
+        :param entity_type: Shotgun entity type of the query.
+        :param filters: Shotgun filters of the query.
+        """
+        self._entity_type = entity_type
+        self._filters = filters
+        self._watermark = None
+        self._current_check_uid = None
+
+    def update_watermark(self, sg_data_list):
+        """
+        Records the high-water mark for data just retrieved from Shotgun.
+
+        This should be called with the complete, unfiltered, list of
+        records returned by the query.
+
+        :param sg_data_list: List of Shotgun dictionaries.
+        """
+        self._watermark = delta_sync.compute_watermark(sg_data_list)
+
+    def request_refresh(self):
+        """
+        Requests the model to refresh. If a high-water mark is known, Shotgun
+        is first asked whether anything changed, otherwise refresh_required is
+        emitted straight away.
+        """
+        if self._filters is None or self._watermark is None:
+            self.refresh_required.emit()
+            return
+
+        self._current_check_uid = self._sg_data_retriever.execute_method(
+            delta_sync.has_changes,
+            self._entity_type,
+            self._filters,
+            self._watermark
+        )
+
+    def _on_data_retriever_work_completed(self, uid, request_type, data):
+        """
+        Signaled whenever the data retriever completes some work.
+
+        :param uid: The unique id of the work that completed
+        :param request_type: Type of work completed
+        :param data: Result of the work
+        """
+        uid = shotgun_model.sanitize_qt(uid)
+        if uid != self._current_check_uid:
+            return
+        self._current_check_uid = None
+
+        data = shotgun_model.sanitize_qt(data)
+        if data["return_value"]:
+            self.refresh_required.emit()
+        else:
+            self._log_debug("No changes for %s %s, skipping refresh." % (self._entity_type, self._filters))
+
+    def _on_data_retriever_work_failure(self, uid, msg):
+        """
+        Signaled whenever the data retriever fails to complete some work.
+
+        :param uid: The unique id of the work that failed
+        :param msg: The error message
+        """
+        uid = shotgun_model.sanitize_qt(uid)
+        if uid != self._current_check_uid:
+            return
+        self._current_check_uid = None
+
+        # fall back on a full refresh
+        self._log_debug("Could not check for changes: %s" % msg)
+        self.refresh_required.emit()
+
+    def _log_debug(self, msg):
+        """
+        Convenience wrapper around debug logging
+
+        :param msg: debug message
+        """
+        self._bundle.log_debug("[%s] %s" % (self.__class__.__name__, msg))
@@ -0,0 +1,348 @@
+# Copyright (c) 2015 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Frame sequence scanner shared by the action hooks.
+
+Sequences are found by listing their directory once, rather than by globbing
+or checking each frame on disk. Directory listings are cached and reused
+until the modification time of the directory changes, so loading several
+publishes from the same directory, or checking a sequence before loading it,
+only lists the directory once. Listings taken within a couple of seconds of a
+modification of the directory are not reused, since files added right after
+them may not have changed its modification time.
+
+The frame pattern of a path is the last of the following tokens found in its
+file name:
+
+- ``%04d`` or ``%d``: frame numbers padded to the given number of digits.
+- ``####``: frame numbers padded to the number of hashes.
+- ``[1001-1100]``: frame numbers within the range, padded to the number of
+  digits of the first frame.
+- ``<UDIM>``, ``<udim>``, ``%(UDIM)d`` or ``_MAPID_``: four digit UDIM tiles.
+
+Hooks access this module through the app, e.g.::
+
+    sequence_scanner = self.parent.import_module("tk_multi_loader").sequence_scanner
+    frame_range = sequence_scanner.get_frame_range("/path/to/render.%04d.exr")
+
+This module is deliberately free of any Qt dependencies.
+"""
+
+import os
+import re
+import time
+import threading
+import collections
+
+# number of directory listings kept in memory
+MAX_CACHED_DIRECTORIES = 64
+
+# number of seconds after a directory was modified during which its listing
+# isn't trusted. Modification times have a coarse resolution on some file
+# systems, so files added within the same tick as the listing wouldn't change
+# the modification time of the directory.
+RACY_LISTING_DELAY = 2
+
+_FRAME_TOKEN_REGEX = re.compile(
+    r"%0?(?P<printf>\d*)d"
+    r"|(?P<hashes>#+)"
+    r"|\[(?P<first>\d+)-(?P<last>\d+)\]"
+    r"|(?P<udim><UDIM>|<udim>|%\(UDIM\)d|_MAPID_)"
+)
+
+# directory listings, keyed by directory path, holding the directory
+# modification time, or None if the listing can't be trusted, the time it
+# was last checked, the file names and the frames found for each pattern.
+_listings = collections.OrderedDict()
+_listings_lock = threading.Lock()
+
+
+class SequencePattern(object):
+    """
+    Frame pattern parsed from a path, see :meth:`parse`.
+    """
+
+    def __init__(self, folder, prefix, suffix, padding, frame_range):
+        """
+        :param folder: Directory holding the frames.
+        :param prefix: Part of the file name before the frame number.
+        :param suffix: Part of the file name after the frame number.
+        :param padding: Minimum number of digits of the frame numbers, 0 if not padded.
+        :param frame_range: Tuple with the first and last frame allowed, or None.
+        """
+        self.folder = folder
+        self.prefix = prefix
+        self.suffix = suffix
+        self.padding = padding
+        self.frame_range = frame_range
+        self._regex = re.compile("^%s(\\d+)%s$" % (re.escape(prefix), re.escape(suffix)))
+
+    def match(self, file_name):
+        """
+        Checks whether a file name is a frame of the sequence.
+
+        :param file_name: Name of the file.
+        :returns: Frame number or None if the file isn't a frame of the sequence.
+        """
+        match = self._regex.match(file_name)
+        if not match:
+            return None
+
+        digits = match.group(1)
+        # padded frame numbers only have more digits than the padding when
+        # they don't fit in it, e.g. frame 10000 of a #### sequence.
+        if len(digits) < self.padding or (len(digits) > max(self.padding, 1) and digits.startswith("0")):
+            return None
+
+        frame = int(digits)
+        if self.frame_range and not self.frame_range[0] <= frame <= self.frame_range[1]:
+            return None
+        return frame
+
+    def get_path(self, frame):
+        """
+        Returns the path of a frame of the sequence.
+
+        :param frame: Frame number.
+        :returns: Path to the frame.
+        """
+        return os.path.join(self.folder, "%s%0*d%s" % (self.prefix, self.padding, frame, self.suffix))
+
+
+def parse(path):
+    """
+    Parses the frame pattern of a path.
+
+    :param path: Path to a sequence, e.g. /path/to/render.%04d.exr
+    :returns: :class:`SequencePattern` or None if the file name holds no frame pattern.
+    """
+    (folder, file_name) = os.path.split(path)
+    matches = list(_FRAME_TOKEN_REGEX.finditer(file_name))
+    if not matches:
+        return None
+
+    match = matches[-1]
+    frame_range = None
+    if match.group("hashes"):
+        padding = len(match.group("hashes"))
+    elif match.group("first"):
+        padding = len(match.group("first"))
+        frame_range = (int(match.group("first")), int(match.group("last")))
+    elif match.group("udim"):
+        padding = 4
+    else:
+        padding = int(match.group("printf") or 0)
+
+    return SequencePattern(folder,
+                           file_name[:match.start()],
+                           file_name[match.end():],
+                           padding,
+                           frame_range)
+
+
+def is_sequence_path(path):
+    """
+    Checks whether the file name of a path holds a frame pattern.
+
+    :param path: Path to check.
+    :returns: True if the path is a sequence path.
+    """
+    return parse(path) is not None
+
+
+def get_frames(path, max_age=0):
+    """
+    Returns the frame numbers of a sequence found on disk.
+
+    :param path: Path to a sequence, e.g. /path/to/render.%04d.exr
+    :param max_age: Number of seconds during which a cached listing is used
+                    without checking whether the directory was modified.
+    :returns: Sorted list of frame numbers, empty if no frames exist, or None
+              if the path has no frame pattern.
+    """
+    pattern = parse(path)
+    if pattern is None:
+        return None
+    return list(_get_frames(pattern, max_age))
+
+
+def get_frame_range(path):
+    """
+    Returns the first and last frames of a sequence found on disk.
+
+    :param path: Path to a sequence, e.g. /path/to/render.%04d.exr
+    :returns: Tuple with the first and last frame numbers, or None if the
+              path has no frame pattern or no frames exist.
+    """
+    pattern = parse(path)
+    if pattern is None:
+        return None
+    frames = _get_frames(pattern)
+    if not frames:
+        return None
+    return (frames[0], frames[-1])
+
+
+def get_frame_paths(path):
+    """
+    Returns the paths of the frames of a sequence found on disk.
+
+    :param path: Path to a sequence, e.g. /path/to/render.%04d.exr
+    :returns: List of frame paths, sorted by frame number. Empty if no frames
+              exist or if the path has no frame pattern.
+    """
+    pattern = parse(path)
+    if pattern is None:
+        return []
+    return [pattern.get_path(frame) for frame in _get_frames(pattern)]
+
+
+def exists(path):
+    """
+    Checks whether a path exists, either as is or as a sequence with at least
+    one frame on disk.
+
+    :param path: Path to a file or a sequence.
+    :returns: True if the path exists.
+    """
+    if os.path.exists(path):
+        return True
+    pattern = parse(path)
+    return pattern is not None and len(_get_frames(pattern)) > 0
+
+
+def list_files(folder, max_age=0):
+    """
+    Returns the names of the files of a directory, from the cached listing.
+
+    :param folder: Path to the directory.
+    :param max_age: Number of seconds during which a cached listing is used
+                    without checking whether the directory was modified.
+    :returns: Frozen set of file names, or None if the directory can't be read.
+    """
+    listing = _get_listing(folder, max_age)
+    if listing is None:
+        return None
+    return listing[2]
+
+
+def clear_cache():
+    """
+    Discards all the directory listings.
+    """
+    with _listings_lock:
+        _listings.clear()
+
+
+def _get_frames(pattern, max_age=0):
+    """
+    Returns the frames of a sequence, from the cached listing of its directory.
+
+    :param pattern: :class:`SequencePattern` of the sequence.
+    :param max_age: Number of seconds during which a cached listing is used
+                    without checking whether the directory was modified.
+    :returns: Sorted tuple of frame numbers.
+    """
+    listing = _get_listing(pattern.folder, max_age)
+    if listing is None:
+        return ()
+
+    (_, _, file_names, frames_cache) = listing
+    key = (pattern.prefix, pattern.suffix, pattern.padding, pattern.frame_range)
+    frames = frames_cache.get(key)
+    if frames is None:
+        frames = []
+        for file_name in file_names:
+            frame = pattern.match(file_name)
+            if frame is not None:
+                frames.append(frame)
+        frames = tuple(sorted(frames))
+        frames_cache[key] = frames
+    return frames
+
+
+def _get_listing(folder, max_age=0):
+    """
+    Returns the listing of a directory, listing it again only if it was
+    modified since it was cached.
+
+    :param folder: Path to the directory.
+    :param max_age: Number of seconds during which a cached listing is used
+                    without checking whether the directory was modified.
+    :returns: Tuple with the modification time, None if the listing was taken
+              too soon after the directory was modified to be reused, the time
+              the directory was last checked, the frozen set of file names and
+              the dictionary caching the frames found in them, or None if the
+              directory can't be read.
+    """
+    folder = folder or os.curdir
+
+    if max_age:
+        with _listings_lock:
+            listing = _listings.get(folder)
+        if listing is not None and time.time() - listing[1] < max_age:
+            return listing
+
+    try:
+        mtime = os.stat(folder).st_mtime
+    except OSError:
+        return None
+
+    with _listings_lock:
+        listing = _listings.get(folder)
+        if listing is not None and listing[0] == mtime:
+            # most recently used directories are kept last
+            listing = (mtime, time.time()) + listing[2:]
+            del _listings[folder]
+            _listings[folder] = listing
+            return listing
+
+    try:
+        file_names = frozenset(_list_files(folder))
+    except OSError:
+        return None
+
+    # a listing taken right after the directory was modified may miss files
+    # added within the same modification time tick, so it is only reused
+    # for max_age and the directory is listed again next time.
+    listed_at = time.time()
+    if listed_at - mtime < RACY_LISTING_DELAY:
+        mtime = None
+
+    listing = (mtime, listed_at, file_names, {})
+    with _listings_lock:
+        _listings.pop(folder, None)
+        _listings[folder] = listing
+        while len(_listings) > MAX_CACHED_DIRECTORIES:
+            _listings.popitem(last=False)
+    return listing
+
+
+def _list_files(folder):
+    """
+    Lists the files of a directory with a single directory read.
+
+    :param folder: Path to the directory.
+    :returns: List of file names.
+    """
+    scandir = getattr(os, "scandir", None)
+    if scandir is None:
+        try:
+            from scandir import scandir
+        except ImportError:
+            scandir = None
+
+    if scandir is None:
+        # names which look like frames are files, don't stat each of them
+        return os.listdir(folder)
+
+    # the file type is usually known from the directory read itself
+    return [entry.name for entry in scandir(folder) if not entry.is_dir()]
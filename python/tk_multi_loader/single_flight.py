@@ -0,0 +1,280 @@
+# Copyright (c) 2015 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Coalescing of identical Shotgun requests.
+
+The same query is often issued again while it is still in flight, e.g. when
+the hierarchy model reloads the current selection or when a user clicks the
+same item twice. Requests issued through a :class:`SingleFlightDataRetriever`
+are keyed on what they ask for, and a request identical to one which is still
+pending is attached to it rather than sent to Shotgun again. Every requester
+then receives the result of the single round-trip.
+
+Requests are shared by all the retrievers using the same background task manager.
+"""
+
+import copy
+import json
+import itertools
+
+import sgtk
+from sgtk.platform.qt import QtCore
+
+shotgun_model = sgtk.platform.import_framework("tk-framework-shotgunutils", "shotgun_model")
+shotgun_data = sgtk.platform.import_framework("tk-framework-shotgunutils", "shotgun_data")
+
+# request groups, keyed by background task manager
+_groups = {}
+
+# total number of requests issued and coalesced during the session
+_stats = {"requests": 0, "coalesced": 0}
+
+# generator for the request ids returned to requesters
+_uids = itertools.count(1)
+
+
+def get_coalescing_stats():
+    """
+    Reports how many requests were issued through single flight retrievers
+    during the session and how many of them were coalesced with a request
+    already in flight.
+
+    :returns: Tuple with the number of requests and the number of coalesced requests.
+    """
+    return (_stats["requests"], _stats["coalesced"])
+
+
+class SingleFlightDataRetriever(QtCore.QObject):
+    """
+    Drop-in replacement for the ShotgunDataRetriever which coalesces identical
+    finds and method calls with those already in flight. Other requests, e.g.
+    thumbnails, are passed through to a regular retriever.
+
+    Since results can be shared by several requesters, data emitted with
+    work_completed for a coalesced request is a copy of the original result.
+    """
+
+    # same signals as the ShotgunDataRetriever
+    work_completed = QtCore.Signal(str, str, dict)
+    work_failure = QtCore.Signal(str, str)
+
+    def __init__(self, parent, bg_task_manager):
+        """
+        :param parent: Parent QObject.
+        :param bg_task_manager: Background task manager to use to run requests.
+        """
+        QtCore.QObject.__init__(self, parent)
+        self._bg_task_manager = bg_task_manager
+        self._group = None
+
+        self._sg_data_retriever = shotgun_data.ShotgunDataRetriever(self, bg_task_manager=bg_task_manager)
+        self._sg_data_retriever.work_completed.connect(self.work_completed)
+        self._sg_data_retriever.work_failure.connect(self.work_failure)
+
+    def start(self):
+        """
+        Starts processing requests.
+        """
+        self._sg_data_retriever.start()
+        if self._group is None:
+            self._group = _RequestGroup.acquire(self._bg_task_manager)
+
+    def stop(self):
+        """
+        Stops processing requests. Results of pending requests are discarded.
+        """
+        self._sg_data_retriever.stop()
+        if self._group is not None:
+            self._group.release(self)
+            self._group = None
+
+    def execute_find(self, entity_type, filters, fields, order=None):
+        """
+        Runs a Shotgun find in the background, unless the same find is in flight.
+
+        :param entity_type: Shotgun entity type to find.
+        :param filters: Shotgun filters.
+        :param fields: Fields to retrieve.
+        :param order: Shotgun order.
+        :returns: Unique id of the request.
+        """
+        key = _make_key("find", entity_type, filters, fields, order)
+        return self._group.request(
+            self,
+            key,
+            lambda retriever: retriever.execute_find(entity_type, filters, fields, order)
+        )
+
+    def execute_method(self, method, *args):
+        """
+        Runs a method in the background, unless the same call is in flight.
+        The method is called with a Shotgun connection followed by the arguments.
+
+        :param method: Method to run.
+        :param args: Arguments to pass to the method.
+        :returns: Unique id of the request.
+        """
+        key = _make_key("method", getattr(method, "__module__", None), getattr(method, "__name__", None), args)
+        return self._group.request(
+            self,
+            key,
+            lambda retriever: retriever.execute_method(method, *args)
+        )
+
+    def request_thumbnail(self, *args, **kwargs):
+        """
+        Requests a thumbnail, see ShotgunDataRetriever.request_thumbnail.
+        Thumbnail requests are not coalesced.
+
+        :returns: Unique id of the request.
+        """
+        return self._sg_data_retriever.request_thumbnail(*args, **kwargs)
+
+
+class _RequestGroup(QtCore.QObject):
+    """
+    Requests in flight for a background task manager.
+    """
+
+    @classmethod
+    def acquire(cls, bg_task_manager):
+        """
+        Returns the group for a background task manager, creating it if needed.
+
+        :param bg_task_manager: Background task manager.
+        :returns: :class:`_RequestGroup` instance.
+        """
+        group = _groups.get(id(bg_task_manager))
+        if group is None:
+            group = cls(bg_task_manager)
+            _groups[id(bg_task_manager)] = group
+        group._users += 1
+        return group
+
+    def __init__(self, bg_task_manager):
+        """
+        :param bg_task_manager: Background task manager to use to run requests.
+        """
+        QtCore.QObject.__init__(self)
+        self._bundle = sgtk.platform.current_bundle()
+        self._bg_task_manager_id = id(bg_task_manager)
+        self._users = 0
+
+        # pending requests keyed by request key, with the list of
+        # (requester, uid) tuples waiting for each of them.
+        self._pending = {}
+        # request keys keyed by the uid of the underlying request
+        self._keys = {}
+
+        self._sg_data_retriever = shotgun_data.ShotgunDataRetriever(self, bg_task_manager=bg_task_manager)
+        self._sg_data_retriever.work_completed.connect(self._on_data_retriever_work_completed)
+        self._sg_data_retriever.work_failure.connect(self._on_data_retriever_work_failure)
+        self._sg_data_retriever.start()
+
+    def release(self, requester):
+        """
+        Discards the pending requests of a requester and stops the group
+        once it isn't used anymore.
+
+        :param requester: :class:`SingleFlightDataRetriever` which is stopping.
+        """
+        for waiters in self._pending.values():
+            waiters[:] = [(r, uid) for (r, uid) in waiters if r is not requester]
+
+        self._users -= 1
+        if self._users <= 0:
+            self._pending = {}
+            self._keys = {}
+            self._sg_data_retriever.stop()
+            _groups.pop(self._bg_task_manager_id, None)
+
+    def request(self, requester, key, send):
+        """
+        Attaches a request to an identical one in flight, or sends it.
+
+        :param requester: :class:`SingleFlightDataRetriever` issuing the request.
+        :param key: Key identifying the request.
+        :param send: Callable sending the request through the retriever passed
+                     to it and returning its unique id.
+        :returns: Unique id of the request for the requester.
+        """
+        uid = "single_flight_%d" % next(_uids)
+        _stats["requests"] += 1
+
+        waiters = self._pending.get(key)
+        if waiters is not None:
+            _stats["coalesced"] += 1
+            self._log_debug(
+                "Coalesced request with one in flight, %d of %d requests coalesced so far."
+                % (_stats["coalesced"], _stats["requests"])
+            )
+            waiters.append((requester, uid))
+            return uid
+
+        self._pending[key] = [(requester, uid)]
+        self._keys[send(self._sg_data_retriever)] = key
+        return uid
+
+    def _on_data_retriever_work_completed(self, uid, request_type, data):
+        """
+        Signaled whenever the data retriever completes some work.
+
+        :param uid: The unique id of the work that completed
+        :param request_type: Type of work completed
+        :param data: Result of the work
+        """
+        waiters = self._pop_waiters(uid)
+        for (i, (requester, requester_uid)) in enumerate(waiters):
+            # the first requester gets the original result, the others a copy
+            # so that they can all modify it.
+            requester.work_completed.emit(requester_uid, request_type, data if i == 0 else copy.deepcopy(data))
+
+    def _on_data_retriever_work_failure(self, uid, msg):
+        """
+        Signaled whenever the data retriever fails to complete some work.
+
+        :param uid: The unique id of the work that failed
+        :param msg: The error message
+        """
+        for (requester, requester_uid) in self._pop_waiters(uid):
+            requester.work_failure.emit(requester_uid, msg)
+
+    def _pop_waiters(self, uid):
+        """
+        Removes a completed request.
+
+        :param uid: The unique id of the underlying request.
+        :returns: List of (requester, uid) tuples waiting for the request.
+        """
+        key = self._keys.pop(shotgun_model.sanitize_qt(uid), None)
+        if key is None:
+            return []
+        return self._pending.pop(key, [])
+
+    def _log_debug(self, msg):
+        """
+        Convenience wrapper around debug logging
+
+        :param msg: debug message
+        """
+        self._bundle.log_debug("[%s] %s" % (self.__class__.__name__, msg))
+
+
+def _make_key(*values):
+    """
+    Computes a key identifying a request.
+
+    :param values: Values describing the request, e.g. the entity type, filters,
+                   fields and order of a find.
+    :returns: Hashable key.
+    """
+    # values which can't be serialized are keyed on their identity
+    return json.dumps(values, sort_keys=True, default=repr)
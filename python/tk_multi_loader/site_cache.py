@@ -0,0 +1,250 @@
+# Copyright (c) 2015 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Shared, read-only, site cache.
+
+A warm-up job, typically run nightly or hourly, builds the model caches for the
+common queries (the entities tabs, the publish types and the statuses) and
+publishes them to the folder configured with the site_cache_root setting.
+
+When the loader starts, site cache files which are newer than the user's own
+copy are copied to the user's cache location before the models load their
+caches, so that the first launch on a fresh workstation displays data straight
+away. The per-user cache files are then only rewritten when a refresh finds
+changes.
+
+The site cache mirrors the cache location of the app and of its frameworks:
+
+    <site_cache_root>/<project>/<bundle name>/...
+"""
+
+import os
+import time
+import shutil
+
+import sgtk
+from sgtk import TankError
+
+from . import freshness
+
+# roots which have already been seeded during this session
+_seeded_roots = set()
+
+
+def get_site_cache_root(bundle):
+    """
+    Returns the site cache folder for the current project.
+
+    :param bundle: The app instance.
+    :returns: Path or None if no site cache is configured.
+    """
+    root = bundle.get_setting("site_cache_root")
+    if not root:
+        return None
+
+    root = os.path.expanduser(os.path.expandvars(root))
+    project = bundle.context.project
+    if project:
+        return os.path.join(root, "p%d" % project["id"])
+    return os.path.join(root, "site")
+
+
+def seed_user_cache(bundle):
+    """
+    Copies site cache files which are newer than the user's own copy to the
+    user's cache locations. This is only done once per session and should be
+    called before any model loads its cache.
+
+    :param bundle: The app instance.
+    """
+    site_root = get_site_cache_root(bundle)
+    if site_root is None or site_root in _seeded_roots:
+        return
+    _seeded_roots.add(site_root)
+
+    if not os.path.isdir(site_root):
+        bundle.log_debug("Site cache %s does not exist yet." % site_root)
+        return
+
+    start = time.time()
+    count = 0
+    for (name, cache_location) in _get_cache_locations(bundle):
+        source_root = os.path.join(site_root, name)
+        if os.path.isdir(source_root):
+            count += _copy_newer_files(bundle, source_root, cache_location)
+
+    bundle.log_debug(
+        "Seeded %d file(s) from site cache %s in %.2fs." % (count, site_root, time.time() - start)
+    )
+
+
+def publish_site_cache(bundle):
+    """
+    Copies the caches built by the current user to the site cache.
+
+    :param bundle: The app instance.
+    :raises TankError: If no site cache is configured.
+    """
+    site_root = get_site_cache_root(bundle)
+    if site_root is None:
+        raise TankError("The site_cache_root setting is not configured.")
+
+    count = 0
+    for (name, cache_location) in _get_cache_locations(bundle):
+        if os.path.isdir(cache_location):
+            count += _copy_newer_files(bundle, cache_location, os.path.join(site_root, name))
+
+    bundle.log_info("Published %d file(s) to site cache %s." % (count, site_root))
+
+
+def warm_up_site_cache(bundle, timeout=600):
+    """
+    Builds the caches for the entities tabs, the publish types and the statuses
+    and publishes them to the site cache. This doesn't display any UI and is
+    meant to be run by a scheduled job, but requires Qt to be available.
+
+    The publish types cache depends on the action_mappings setting, it is only
+    reused by engines configured with the same mappings as the job's.
+
+    :param bundle: The app instance.
+    :param timeout: Maximum number of seconds to wait for Shotgun.
+    :raises TankError: If no site cache is configured.
+    """
+    # defer imports so that the app works gracefully in batch modes
+    from sgtk.platform.qt import QtCore
+    from .model_entity import SgEntityModel
+    from .model_status import SgStatusModel
+    from .model_publishtype import SgPublishTypeModel
+    from .loader_action_manager import LoaderActionManager
+    from . import utils
+
+    settings = sgtk.platform.import_framework("tk-framework-shotgunutils", "settings")
+    task_manager = sgtk.platform.import_framework("tk-framework-shotgunutils", "task_manager")
+    shotgun_globals = sgtk.platform.import_framework("tk-framework-shotgunutils", "shotgun_globals")
+
+    if get_site_cache_root(bundle) is None:
+        raise TankError("The site_cache_root setting is not configured.")
+
+    bg_task_manager = task_manager.BackgroundTaskManager(None, start_processing=True, max_threads=2)
+    shotgun_globals.register_bg_task_manager(bg_task_manager)
+
+    # the job should always query Shotgun, whatever the freshness policies are
+    freshness.FreshnessPolicy.force_refresh = True
+    models = []
+    try:
+        models.append(SgStatusModel(None, bg_task_manager))
+        models.append(
+            SgPublishTypeModel(
+                None,
+                LoaderActionManager(),
+                settings.UserSettings(bundle),
+                bg_task_manager
+            )
+        )
+
+        for setting_dict in bundle.get_setting("entities"):
+            if setting_dict.get("type") == "Hierarchy":
+                # hierarchy tabs are loaded on demand, one level at a time
+                bundle.log_debug("Skipping hierarchy tab '%s'." % setting_dict.get("caption"))
+                continue
+            model = SgEntityModel(
+                None,
+                setting_dict["entity_type"],
+                utils.resolve_filters(bundle, setting_dict["filters"]),
+                setting_dict["hierarchy"],
+                bg_task_manager
+            )
+            model.async_refresh()
+            models.append(model)
+
+        # wait for all the models to be refreshed
+        pending = set(models)
+        loop = QtCore.QEventLoop()
+
+        def on_done(model, error=None):
+            if error:
+                bundle.log_warning("Could not refresh %s: %s" % (model.__class__.__name__, error))
+            pending.discard(model)
+            if not pending:
+                loop.quit()
+
+        for model in models:
+            model.data_refreshed.connect(lambda _, m=model: on_done(m))
+            model.data_refresh_fail.connect(lambda msg, m=model: on_done(m, msg))
+
+        QtCore.QTimer.singleShot(timeout * 1000, loop.quit)
+        if pending:
+            loop.exec_()
+        if pending:
+            raise TankError("Timed out waiting for Shotgun after %d seconds." % timeout)
+
+    finally:
+        freshness.FreshnessPolicy.force_refresh = False
+        shotgun_globals.unregister_bg_task_manager(bg_task_manager)
+        bg_task_manager.shut_down()
+
+    publish_site_cache(bundle)
+
+
+def _get_cache_locations(bundle):
+    """
+    Returns the cache locations of the app and of its frameworks.
+
+    :param bundle: The app instance.
+    :returns: List of (bundle name, cache location) tuples.
+    """
+    bundles = [bundle] + list(bundle.frameworks.values())
+    return [(b.name, b.cache_location) for b in bundles]
+
+
+def _copy_newer_files(bundle, source_root, target_root):
+    """
+    Copies the files found under a folder to another one, unless the
+    target file is at least as recent. Files are copied to a temporary
+    file first so that readers never see half written files.
+
+    Refresh times recorded by freshness policies are merged instead.
+
+    :param bundle: The app instance.
+    :param source_root: Folder to copy files from.
+    :param target_root: Folder to copy files to.
+    :returns: Number of files copied.
+    """
+    count = 0
+    for (dir_path, _, file_names) in os.walk(source_root):
+        target_dir = os.path.join(target_root, os.path.relpath(dir_path, source_root))
+        for file_name in file_names:
+            if file_name.endswith(".tmp"):
+                # file being written
+                continue
+
+            source_path = os.path.join(dir_path, file_name)
+            target_path = os.path.join(target_dir, file_name)
+            try:
+                if file_name == freshness.FRESHNESS_FILE_NAME:
+                    freshness.merge_refresh_times(source_path, target_path)
+                    continue
+
+                if os.path.exists(target_path) and \
+                        os.path.getmtime(target_path) >= os.path.getmtime(source_path):
+                    continue
+
+                if not os.path.exists(target_dir):
+                    os.makedirs(target_dir)
+                tmp_path = "%s.%d.tmp" % (target_path, os.getpid())
+                shutil.copy2(source_path, tmp_path)
+                if os.path.exists(target_path):
+                    os.remove(target_path)
+                os.rename(tmp_path, target_path)
+                count += 1
+            except Exception as e:
+                bundle.log_debug("Could not copy %s to %s: %s" % (source_path, target_path, e))
+    return count
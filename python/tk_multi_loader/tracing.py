@@ -0,0 +1,273 @@
+# Copyright (c) 2015 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Trace spans for the stages of loading publishes, exported in the Chrome
+trace event format so that they can be inspected in chrome://tracing or
+any compatible viewer.
+
+Synchronous stages are wrapped in a span::
+
+    with tracing.span("filter_publishes_hook", rows_in=len(sg_data_list)) as span:
+        ...
+        span.set(rows_out=len(sg_data_list))
+
+Whole methods can be recorded with the :meth:`traced` decorator instead,
+which keeps their body as it is::
+
+    @tracing.traced("type_aggregation")
+    def set_active_types(self, type_aggregates):
+        ...
+
+Stages completing in a later callback, e.g. Shotgun queries run in the
+background, use :meth:`begin` and :meth:`end`.
+
+Recording is off by default. While it is off, spans are a shared object
+doing nothing, so that tracing costs no more than a function call.
+
+This module is deliberately free of any Qt dependencies.
+"""
+
+import os
+import json
+import time
+import functools
+import itertools
+import threading
+import collections
+
+# number of events kept, the oldest ones are discarded first
+MAX_EVENTS = 200000
+
+_enabled = False
+_events = collections.deque(maxlen=MAX_EVENTS)
+_async_ids = itertools.count(1)
+_thread_names = {}
+
+
+class _NullSpan(object):
+    """
+    Span returned while recording is off.
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    def set(self, **args):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Span(object):
+    """
+    Synchronous stage, recorded as a complete event when exited.
+    """
+
+    def __init__(self, name, args):
+        """
+        :param name: Name of the stage.
+        :param args: Dictionary of values recorded with the stage, e.g. row counts.
+        """
+        self._name = name
+        self._args = args
+        self._start = None
+
+    def __enter__(self):
+        self._start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        end = time.time()
+        if exc_type is not None:
+            self._args["error"] = str(exc_value)
+        _add_event({
+            "name": self._name,
+            "ph": "X",
+            "ts": _to_microseconds(self._start),
+            "dur": _to_microseconds(end - self._start),
+            "args": self._args,
+        })
+        return False
+
+    def set(self, **args):
+        """
+        Records values only known once the stage ran, e.g. the number of rows returned.
+        """
+        self._args.update(args)
+
+
+class AsyncSpan(object):
+    """
+    Stage started and ended in different calls, see :meth:`begin`.
+    """
+
+    def __init__(self, name, args):
+        """
+        :param name: Name of the stage.
+        :param args: Dictionary of values recorded with the stage.
+        """
+        self.name = name
+        self.id = next(_async_ids)
+        _add_event({
+            "name": name,
+            "cat": "async",
+            "ph": "b",
+            "id": self.id,
+            "ts": _to_microseconds(time.time()),
+            "args": args,
+        })
+
+
+def is_enabled():
+    """
+    Checks whether spans are recorded.
+
+    :returns: True if spans are recorded.
+    """
+    return _enabled
+
+
+def set_enabled(enabled):
+    """
+    Starts or stops recording spans. Spans already recorded are kept.
+
+    :param enabled: True to record spans.
+    """
+    global _enabled
+    _enabled = enabled
+
+
+def clear():
+    """
+    Discards the spans recorded.
+    """
+    _events.clear()
+
+
+def get_event_count():
+    """
+    Returns the number of events recorded.
+
+    :returns: Number of events.
+    """
+    return len(_events)
+
+
+def span(name, **args):
+    """
+    Returns a span to record a synchronous stage with a with statement.
+
+    :param name: Name of the stage.
+    :param args: Values recorded with the stage, e.g. row counts or byte sizes.
+    :returns: Context manager with a set method to record more values.
+    """
+    if not _enabled:
+        return _NULL_SPAN
+    return Span(name, args)
+
+
+def traced(name):
+    """
+    Decorator recording each call of a function as a synchronous stage.
+
+    :param name: Name of the stage.
+    :returns: Decorator.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def begin(name, **args):
+    """
+    Starts recording a stage which ends in a later call, see :meth:`end`.
+
+    :param name: Name of the stage.
+    :param args: Values recorded with the stage.
+    :returns: :class:`AsyncSpan`, or None if recording is off.
+    """
+    if not _enabled:
+        return None
+    return AsyncSpan(name, args)
+
+
+def end(async_span, **args):
+    """
+    Ends a stage started with :meth:`begin`. Does nothing if it wasn't recorded.
+
+    :param async_span: Value returned by :meth:`begin`.
+    :param args: Values recorded with the end of the stage.
+    """
+    if async_span is None:
+        return
+    _add_event({
+        "name": async_span.name,
+        "cat": "async",
+        "ph": "e",
+        "id": async_span.id,
+        "ts": _to_microseconds(time.time()),
+        "args": args,
+    })
+
+
+def export(path):
+    """
+    Writes the spans recorded to a file in the Chrome trace event format.
+
+    :param path: Path of the json file to write.
+    :returns: Number of events written.
+    """
+    events = list(_events)
+    pid = os.getpid()
+    trace_events = [
+        {"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": thread_name}}
+        for (tid, thread_name) in _thread_names.items()
+    ]
+    for event in events:
+        event = dict(event)
+        event["pid"] = pid
+        trace_events.append(event)
+
+    with open(path, "w") as fh:
+        json.dump({"traceEvents": trace_events, "displayTimeUnit": "ms"}, fh, default=str)
+    return len(events)
+
+
+def _add_event(event):
+    """
+    Records an event for the current thread.
+
+    :param event: Dictionary of the event.
+    """
+    thread = threading.current_thread()
+    if thread.ident not in _thread_names:
+        _thread_names[thread.ident] = thread.name
+    event["tid"] = thread.ident
+    # appending to a deque is thread safe
+    _events.append(event)
+
+
+def _to_microseconds(seconds):
+    """
+    Converts seconds to the integer microseconds used by trace events.
+
+    :param seconds: Number of seconds.
+    :returns: Number of microseconds.
+    """
+    return int(seconds * 1000000)
@@ -8,6 +8,8 @@
 # agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
 # not expressly granted therein are reserved by Shotgun Software Inc.
 
+import datetime
+
 from sgtk.platform.qt import QtCore, QtGui
 
 
@@ -238,41 +240,70 @@ def create_overlayed_publish_thumbnail(image):
     return base_image
 
 
-def filter_publishes(app, sg_data_list):
+def get_publish_tooltip(sg_item):
+    """
+    Builds a rich text tooltip summarizing a publish.
+
+    :param sg_item: Publish information from Shotgun.
+    :returns: Tooltip string.
+    """
+    tooltip = "<b>Name:</b> %s" % (sg_item.get("code") or "No name given.")
+
+    # Version 012 by John Smith at 2014-02-23 10:34
+    if not isinstance(sg_item.get("created_at"), datetime.datetime):
+        created_unixtime = sg_item.get("created_at") or 0
+        date_str = datetime.datetime.fromtimestamp(created_unixtime).strftime('%Y-%m-%d %H:%M')
+    else:
+        date_str = sg_item.get("created_at").strftime('%Y-%m-%d %H:%M')
+
+    # created_by is set to None if the user has been deleted.
+    if sg_item.get("created_by") and sg_item["created_by"].get("name"):
+        author_str = sg_item["created_by"].get("name")
+    else:
+        author_str = "Unspecified User"
+
+    version = sg_item.get("version_number")
+    vers_str = "%03d" % version if version is not None else "N/A"
+
+    tooltip += "<br><br><b>Version:</b> %s by %s at %s" % (
+        vers_str,
+        author_str,
+        date_str
+    )
+    tooltip += "<br><br><b>Path:</b> %s" % ((sg_item.get("path") or {}).get("local_path"))
+    tooltip += "<br><br><b>Description:</b> %s" % (sg_item.get("description") or "No description given.")
+
+    return tooltip
+
+
+def resolve_filters(app, filters):
     """
-    Filters a list of shotgun published files based on the filter_publishes
-    hook.
-
-    :param app:           app that has the hook.
-    :param sg_data_list:  list of shotgun dictionaries, as returned by the
-                          find() call.
-    :returns:             list of filtered shotgun dictionaries, same form as
-                          the input.
+    Resolves the magic tokens, e.g. {context.entity}, found in Shotgun
+    filters coming from the configuration.
+
+    :param app:      app to get the context from.
+    :param filters:  list of Shotgun filters.
+    :returns:        list of resolved Shotgun filters.
     """
-    try:
-        # Constructing a wrapper dictionary so that it's future proof to
-        # support returning additional information from the hook
-        hook_publish_list = [{"sg_publish": sg_data}
-                             for sg_data in sg_data_list]
-
-        hook_publish_list = app.execute_hook("filter_publishes_hook",
-                                             publishes=hook_publish_list)
-        if not isinstance(hook_publish_list, list):
-            app.log_error(
-                "hook_filter_publishes returned an unexpected result type \
-                '%s' - ignoring!"
-                % type(hook_publish_list).__name__)
-            hook_publish_list = []
-
-        # split back out publishes:
-        sg_data_list = []
-        for item in hook_publish_list:
-            sg_data = item.get("sg_publish")
-            if sg_data:
-                sg_data_list.append(sg_data)
-
-    except:
-        app.log_exception("Failed to execute 'filter_publishes_hook'!")
-        sg_data_list = []
-
-    return sg_data_list
+    resolved_filters = []
+    for filter in filters:
+        resolved_filter = []
+        for field in filter:
+            if field == "{context.entity}":
+                field = app.context.entity
+            elif field == "{context.project}":
+                field = app.context.project
+            elif field == "{context.project.id}":
+                if app.context.project:
+                    field = app.context.project.get("id")
+                else:
+                    field = None
+            elif field == "{context.step}":
+                field = app.context.step
+            elif field == "{context.task}":
+                field = app.context.task
+            elif field == "{context.user}":
+                field = app.context.user
+            resolved_filter.append(field)
+        resolved_filters.append(resolved_filter)
+    return resolved_filters
@@ -0,0 +1,172 @@
+# Copyright (c) 2015 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Tests the live updates of the publish listings: events replayed by a fake
+event source go through the event log watcher into the flat publish model,
+against a mocked Shotgun.
+
+These tests use the tk-core test framework. Set SHOTGUN_TEST_ENGINE to a
+checkout of tk-testengine and SHOTGUN_REPOS_ROOT to the folder holding the
+frameworks, then run them with tk-core's tests/run_tests.py.
+"""
+
+import os
+import time
+import importlib
+
+repo_root = os.path.normpath(os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("SHOTGUN_CURRENT_REPO_ROOT", repo_root)
+os.environ.setdefault("TK_TEST_FIXTURES", os.path.join(repo_root, "tests", "fixtures"))
+
+from tank_test.tank_test_base import setUpModule  # noqa
+from tank_test.tank_test_base import TankTestBase
+
+import sgtk
+from sgtk.platform.qt import QtGui
+
+
+class _PublishTypeModel(object):
+    """
+    Stands in for the publish type model, which the publish model reports
+    the publish types found to.
+    """
+
+    def set_active_types(self, type_id_aggregates):
+        self.type_id_aggregates = type_id_aggregates
+
+
+class TestEventWatcher(TankTestBase):
+    """
+    Feeds publish events through the event log watcher into the flat publish model.
+    """
+
+    # seconds to wait for background work to complete
+    TIMEOUT = 10
+
+    def setUp(self):
+        super(TestEventWatcher, self).setUp()
+        self.setup_fixtures()
+
+        self._qapp = QtGui.QApplication.instance() or QtGui.QApplication([])
+
+        context = self.tk.context_from_entity(self.project["type"], self.project["id"])
+        self.engine = sgtk.platform.start_engine("tk-testengine", self.tk, context)
+        self.addCleanup(self.engine.destroy)
+        self.app = self.engine.apps["tk-multi-loader2"]
+
+        package = self.app.import_module("tk_multi_loader")
+        event_watcher = importlib.import_module("%s.event_watcher" % package.__name__)
+        model_flatpublish = importlib.import_module("%s.model_flatpublish" % package.__name__)
+        task_manager = self.app.frameworks["tk-framework-shotgunutils"].import_module("task_manager")
+
+        self.bg_task_manager = task_manager.BackgroundTaskManager(None, start_processing=True, max_threads=1)
+        self.addCleanup(self.bg_task_manager.shut_down)
+
+        self.shot = {"type": "Shot", "id": 1, "code": "shot_010", "project": self.project}
+        self.publish_type = {"type": "PublishedFileType", "id": 1, "code": "Maya Scene"}
+        self.add_to_sg_mock_db([self.shot, self.publish_type])
+        self.publish_1 = self._create_publish(1, "scene_a")
+        self.publish_2 = self._create_publish(2, "scene_b")
+
+        self.model = model_flatpublish.SgFlatPublishModel(None, _PublishTypeModel(), self.bg_task_manager)
+        self.addCleanup(self.model.destroy)
+        self.refresh_count = 0
+        self.model.data_refreshed.connect(self._on_data_refreshed)
+
+        self.event_source = event_watcher.FakeEventSource("PublishedFile")
+        self.watcher = event_watcher.EventLogWatcher(None, self.bg_task_manager, self.event_source, 3600)
+        self.addCleanup(self.watcher.stop)
+        self.watcher.publishes_changed.connect(self.model.apply_publish_changes)
+
+        # load the publishes of the shot, then start watching for events
+        self.model._do_load_data([["entity", "is", {"type": "Shot", "id": self.shot["id"]}]], [])
+        self._wait_for(lambda: self.refresh_count == 1)
+        self.watcher.start()
+        self._wait_for(lambda: self.watcher.last_event_id is not None)
+
+    def _on_data_refreshed(self, changed):
+        self.refresh_count += 1
+
+    def _create_publish(self, publish_id, name):
+        """
+        Adds a publish of the shot to the mocked Shotgun.
+        """
+        publish = {
+            "type": "PublishedFile",
+            "id": publish_id,
+            "code": name,
+            "name": name,
+            "version_number": 1,
+            "project": self.project,
+            "entity": {"type": "Shot", "id": self.shot["id"]},
+            "published_file_type": {"type": "PublishedFileType", "id": self.publish_type["id"]},
+        }
+        self.add_to_sg_mock_db(publish)
+        return publish
+
+    def _wait_for(self, condition):
+        """
+        Processes events until a condition is met.
+        """
+        end = time.time() + self.TIMEOUT
+        while not condition():
+            if time.time() > end:
+                self.fail("Timed out waiting for background work to complete.")
+            self._qapp.processEvents()
+            time.sleep(0.01)
+
+    def _get_publishes(self):
+        """
+        Returns the publishes displayed by the model, keyed by id.
+        """
+        publishes = {}
+        for row in range(self.model.rowCount()):
+            sg_data = self.model.data(self.model.index(row, 0), self.model.SG_DATA_ROLE)
+            if sg_data:
+                publishes[sg_data["id"]] = sg_data
+        return publishes
+
+    def test_events_update_model(self):
+        """
+        Ensures created, changed and retired publishes are applied to the model.
+        """
+        self.assertEqual(sorted(self._get_publishes()), [1, 2])
+
+        publish_3 = self._create_publish(3, "scene_c")
+        self.mockgun.update("PublishedFile", self.publish_1["id"], {"name": "scene_a_fixed"})
+        self.mockgun.delete("PublishedFile", self.publish_2["id"])
+        self.event_source.add_event("New", publish_3["id"])
+        self.event_source.add_event("Change", self.publish_1["id"])
+        self.event_source.add_event("Retirement", self.publish_2["id"])
+
+        self.watcher.poll()
+        self._wait_for(lambda: self.refresh_count == 2)
+
+        publishes = self._get_publishes()
+        self.assertEqual(sorted(publishes), [1, 3])
+        self.assertEqual(publishes[1]["name"], "scene_a_fixed")
+        self.assertEqual(self.watcher.last_event_id, 3)
+
+    def test_events_during_refresh(self):
+        """
+        Ensures events reported while a refresh is in progress are applied
+        once it completed.
+        """
+        self.model.async_refresh()
+
+        publish_3 = self._create_publish(3, "scene_c")
+        self.mockgun.delete("PublishedFile", self.publish_2["id"])
+        self.event_source.add_event("New", publish_3["id"])
+        self.event_source.add_event("Retirement", self.publish_2["id"])
+        self.watcher.process_events(self.event_source.fetch_events(None, self.watcher.last_event_id))
+
+        self._wait_for(lambda: sorted(self._get_publishes()) == [1, 3])
+        self.assertGreaterEqual(self.refresh_count, 3)
@@ -0,0 +1,66 @@
+# Copyright (c) 2015 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Tests that opening, navigating and closing the loader dialog repeatedly doesn't
+leak memory or Qt objects, against a mocked Shotgun.
+
+These tests use the tk-core test framework. Set SHOTGUN_TEST_ENGINE to a
+checkout of tk-testengine and SHOTGUN_REPOS_ROOT to the folder holding the
+frameworks, then run them with tk-core's tests/run_tests.py.
+"""
+
+import os
+import importlib
+
+repo_root = os.path.normpath(os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("SHOTGUN_CURRENT_REPO_ROOT", repo_root)
+os.environ.setdefault("TK_TEST_FIXTURES", os.path.join(repo_root, "tests", "fixtures"))
+
+from tank_test.tank_test_base import setUpModule  # noqa
+from tank_test.tank_test_base import TankTestBase
+
+import sgtk
+from sgtk.platform.qt import QtGui
+
+
+class TestMemoryLeaks(TankTestBase):
+    """
+    Runs the memory leak test of the loader dialog.
+    """
+
+    def setUp(self):
+        super(TestMemoryLeaks, self).setUp()
+        self.setup_fixtures()
+
+        self._qapp = QtGui.QApplication.instance() or QtGui.QApplication([])
+
+        context = self.tk.context_from_entity(self.project["type"], self.project["id"])
+        self.engine = sgtk.platform.start_engine("tk-testengine", self.tk, context)
+        self.addCleanup(self.engine.destroy)
+        self.app = self.engine.apps["tk-multi-loader2"]
+
+        package = self.app.import_module("tk_multi_loader")
+        self.memory_diagnostics = importlib.import_module("%s.memory_diagnostics" % package.__name__)
+
+        # give the entity tabs something to navigate
+        shots = [
+            {"type": "Shot", "id": shot_id, "code": "shot_%03d" % (shot_id * 10), "project": self.project}
+            for shot_id in range(1, 4)
+        ]
+        self.add_to_sg_mock_db(shots)
+
+    def test_dialog_does_not_leak(self):
+        """
+        Ensures the memory used and the number of Qt objects stay bounded when
+        the dialog is opened and closed repeatedly.
+        """
+        report = self.memory_diagnostics.run_leak_test(self.app, iterations=3)
+        self.assertTrue(report)